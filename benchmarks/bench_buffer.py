@@ -0,0 +1,76 @@
+"""
+Compares the memory held by the write buffer at 1M queued data values:
+the previous list of five-key dicts against the column-backed DataValueBatch.
+
+    python benchmarks/bench_buffer.py [count]
+"""
+
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable
+
+from destination_dhis2 import DataValue, DataValueBatch, DataValues
+
+
+def generate(count: int) -> DataValues:
+    return [
+        {
+            "dataElement": f"de{i % 500:09d}",
+            "completeDate": "2023-02-03",
+            "period": f"2023{i % 12 + 1:02d}",
+            "orgUnit": f"ou{i % 20000:09d}",
+            "value": str(i),
+        }
+        for i in range(count)
+    ]
+
+
+def fill_list(records: DataValues) -> DataValues:
+    buffer: DataValues = []
+    for record in records:
+        data_value: DataValue = {
+            "dataElement": record["dataElement"],
+            "completeDate": record["completeDate"],
+            "period": record["period"],
+            "orgUnit": record["orgUnit"],
+            "value": record["value"],
+        }
+        buffer.append(data_value)
+    return buffer
+
+
+def fill_batch(records: DataValues) -> DataValueBatch:
+    batch = DataValueBatch(capacity=len(records))
+    for record in records:
+        batch.append(
+            record["dataElement"],
+            record["completeDate"],
+            record["period"],
+            record["orgUnit"],
+            record["value"],
+        )
+    return batch
+
+
+def measure(fill: Callable[[DataValues], Any], records: DataValues) -> None:
+    # the record strings are allocated up front, so only the buffer is measured
+    tracemalloc.start()
+    start = time.perf_counter()
+    buffer = fill(records)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{fill.__name__:<12} {len(buffer):>9} values"
+        f" {current / len(records):>7.1f} B/value"
+        f" {peak / 2**20:>8.1f} MiB peak"
+        f" {elapsed:>6.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    records = generate(count)
+    measure(fill_list, records)
+    measure(fill_batch, records)
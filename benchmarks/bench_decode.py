@@ -0,0 +1,84 @@
+"""
+Decoding throughput of the write command's stdin, in records per second,
+over a generated messages.jsonl with a STATE message every 10k records:
+
+- cdk: Destination._parse_input_stream, a validated AirbyteMessage per line
+- fast: the connector's decode_messages, records are not validated
+
+    python benchmarks/bench_decode.py [records] [path]
+"""
+
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, Iterable
+
+from airbyte_cdk.destinations import Destination
+from airbyte_cdk.models import (  # type: ignore # see this https://github.com/airbytehq/airbyte/pull/22963
+    AirbyteMessage,
+)
+
+from destination_dhis2 import DestinationDhis2
+from destination_dhis2.messages import orjson
+
+
+def generate(path: str, count: int) -> None:
+    with open(path, "w") as f:
+        for i in range(count):
+            record = {
+                "type": "RECORD",
+                "record": {
+                    "stream": "dataElements",
+                    "data": {
+                        "dataElement": f"de{i % 500:09d}",
+                        "completeDate": "2023-02-03",
+                        "period": f"2023{i % 12 + 1:02d}",
+                        "orgUnit": f"ou{i % 20000:09d}",
+                        "value": str(i),
+                    },
+                    "emitted_at": 1678386960000,
+                },
+            }
+            f.write(json.dumps(record))
+            f.write("\n")
+            if i % 10_000 == 9_999:
+                state = {"type": "STATE", "state": {"data": {"offset": i}}}
+                f.write(json.dumps(state))
+                f.write("\n")
+
+
+def measure(
+    name: str,
+    parse: Callable[[io.TextIOWrapper], Iterable[AirbyteMessage]],
+    path: str,
+    count: int,
+) -> None:
+    with open(path, "rb") as f:
+        input_stream = io.TextIOWrapper(f, encoding="utf-8")
+        start = time.perf_counter()
+        decoded = sum(1 for _ in parse(input_stream))
+        elapsed = time.perf_counter() - start
+    print(f"{name:<5} {decoded:>9} messages {count / elapsed:>12,.0f} records/s")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    path = (
+        sys.argv[2]
+        if len(sys.argv) > 2
+        else os.path.join(tempfile.gettempdir(), "messages.jsonl")
+    )
+    generate(path, count)
+
+    destination = DestinationDhis2()
+    print(f"JSON backend: {'orjson' if orjson is not None else 'json'}")
+    measure(
+        "cdk",
+        lambda input_stream: Destination._parse_input_stream(destination, input_stream),
+        path,
+        count,
+    )
+    measure("fast", destination._parse_input_stream, path, count)
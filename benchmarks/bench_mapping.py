@@ -0,0 +1,104 @@
+"""
+Per-record cost of the compiled record mappings, in nanoseconds, as rules
+are added one field at a time. Records cycle through 120 dates, so the
+memoised period conversion mostly hits its cache:
+
+- lookups: five plain key lookups, the path before mappings were compiled
+- renames: field_mapping renames only, read by a single itemgetter
+- +constant, +values, +period, +type, +default: one more field with a rule
+
+    python benchmarks/bench_mapping.py [records]
+"""
+
+import sys
+import time
+from typing import Any, Callable, Mapping
+
+from destination_dhis2.mapping import RecordMapping, compile_mapping
+
+CONFIGURATIONS: list[tuple[str, RecordMapping]] = [
+    ("renames", {"orgUnit": "facility", "value": "count"}),
+    ("+constant", {"orgUnit": "facility", "completeDate": {"constant": "2023-03-01"}}),
+    (
+        "+values",
+        {
+            "orgUnit": "facility",
+            "completeDate": {"constant": "2023-03-01"},
+            "dataElement": {"field": "indicator", "values": {"anc1": "Psxm301oJH1"}},
+        },
+    ),
+    (
+        "+period",
+        {
+            "orgUnit": "facility",
+            "completeDate": {"constant": "2023-03-01"},
+            "dataElement": {"field": "indicator", "values": {"anc1": "Psxm301oJH1"}},
+            "period": {"field": "visit_date", "period": "Monthly"},
+        },
+    ),
+    (
+        "+type",
+        {
+            "orgUnit": "facility",
+            "completeDate": {"constant": "2023-03-01"},
+            "dataElement": {"field": "indicator", "values": {"anc1": "Psxm301oJH1"}},
+            "period": {"field": "visit_date", "period": "Monthly"},
+            "value": {"field": "count", "type": "integer"},
+        },
+    ),
+    (
+        "+default",
+        {
+            "orgUnit": {"field": "facility", "default": "ImspTQPwCqd"},
+            "completeDate": {"constant": "2023-03-01"},
+            "dataElement": {"field": "indicator", "values": {"anc1": "Psxm301oJH1"}},
+            "period": {"field": "visit_date", "period": "Monthly"},
+            "value": {"field": "count", "type": "integer"},
+        },
+    ),
+]
+
+
+def generate(count: int) -> list[dict[str, Any]]:
+    return [
+        {
+            "dataElement": "Psxm301oJH1",
+            "indicator": "anc1",
+            "completeDate": "2023-02-03",
+            "period": "202302",
+            "visit_date": f"2023-{i % 12 + 1:02d}-{i % 10 + 1:02d}",
+            "orgUnit": "ImspTQPwCqd",
+            "facility": f"ou{i % 20000:09d}",
+            "value": str(i),
+            "count": i,
+        }
+        for i in range(count)
+    ]
+
+
+def lookups(record: Mapping[str, Any]) -> tuple[Any, ...]:
+    return (
+        record["dataElement"],
+        record["completeDate"],
+        record["period"],
+        record["facility"],
+        record["count"],
+    )
+
+
+def measure(
+    name: str, map_record: Callable[[Mapping[str, Any]], Any], records: list
+) -> None:
+    start = time.perf_counter()
+    for record in records:
+        map_record(record)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<10} {elapsed / len(records) * 1e9:>8,.0f} ns/record")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    records = generate(count)
+    measure("lookups", lookups, records)
+    for name, mapping in CONFIGURATIONS:
+        measure(name, compile_mapping(mapping), records)
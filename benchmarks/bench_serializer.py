@@ -0,0 +1,112 @@
+"""
+Serialize-and-send micro-benchmark for dataValueSets payloads of 10k values,
+posted to a local HTTP server that discards the body:
+
+- dicts: the previous path, a list of dicts handed to requests with json=
+- bytes: the batch encoded into a single bytes payload
+- chunked: the batch streamed with chunked transfer encoding
+
+    python benchmarks/bench_serializer.py [values] [repeats]
+"""
+
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+
+from destination_dhis2 import DataValueBatch
+from destination_dhis2.serializer import (
+    DataValueSetBody,
+    orjson,
+    serialize_data_value_set,
+)
+from destination_dhis2.session import Dhis2Session
+
+
+class DiscardHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                self.rfile.read(size + 2)
+                if size == 0:
+                    break
+        else:
+            self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+def generate(count: int) -> DataValueBatch:
+    batch = DataValueBatch(count)
+    for i in range(count):
+        batch.append(
+            f"de{i % 500:09d}",
+            "2023-02-03",
+            f"2023{i % 12 + 1:02d}",
+            f"ou{i:09d}",
+            str(i),
+        )
+    return batch
+
+
+def measure(
+    name: str,
+    send: Callable[[DataValueBatch], Any],
+    batch: DataValueBatch,
+    repeats: int,
+) -> None:
+    send(batch)  # warm up the connection
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        send(batch)
+    elapsed = (time.perf_counter() - start) / repeats
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{name:<8} {len(batch):>7} values {elapsed * 1000:>8.1f} ms/batch"
+        f" {peak / 2**20:>7.1f} MiB peak"
+    )
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), DiscardHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/api/dataValueSets"
+    session = Dhis2Session()
+    batch = generate(count)
+
+    print(f"JSON backend: {'orjson' if orjson is not None else 'json'}")
+    measure(
+        "dicts",
+        lambda batch: session.request("POST", url, json={"dataValues": list(batch)}),
+        batch,
+        repeats,
+    )
+    measure(
+        "bytes",
+        lambda batch: session.request(
+            "POST", url, data=serialize_data_value_set(batch)
+        ),
+        batch,
+        repeats,
+    )
+    measure(
+        "chunked",
+        lambda batch: session.request("POST", url, data=DataValueSetBody(batch)),
+        batch,
+        repeats,
+    )
+    server.shutdown()
@@ -0,0 +1,130 @@
+"""
+End-to-end throughput of `main.py write` against the fake DHIS2 server in
+benchmarks/fake_dhis2.py, over a generated messages.jsonl with a STATE
+message every 10k records. Reports records per second, the peak RSS of the
+connector process and the requests the server received:
+
+    python benchmarks/bench_write.py [records] [--latency 0.05] \
+        [--set max_concurrent_requests=4] [--set async_imports=true] ...
+
+Options given with --set are added to the connector config, decoded as
+JSON when possible.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any
+
+from bench_decode import generate
+from fake_dhis2 import add_arguments, from_arguments
+
+SUMMARY_PREFIX = "DHIS2 sync summary: "
+
+
+def parse_option(option: str) -> tuple[str, Any]:
+    key, _, value = option.partition("=")
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def catalog() -> dict[str, Any]:
+    return {
+        "streams": [
+            {
+                "stream": {
+                    "name": "dataElements",
+                    "json_schema": {},
+                    "supported_sync_modes": ["full_refresh"],
+                },
+                "sync_mode": "full_refresh",
+                "destination_sync_mode": "overwrite",
+            }
+        ]
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("records", type=int, nargs="?", default=100_000)
+    parser.add_argument("--set", action="append", default=[], dest="options")
+    parser.add_argument("--workdir", default=tempfile.gettempdir())
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    messages_path = os.path.join(args.workdir, f"messages-{args.records}.jsonl")
+    if not os.path.exists(messages_path):
+        # generated once per size and reused by later runs
+        generate(messages_path, args.records)
+
+    # the uids bench_decode generates, for syncs that validate metadata
+    fake = from_arguments(
+        args,
+        metadata={
+            "dataElements": [f"de{i:09d}" for i in range(500)],
+            "organisationUnits": [f"ou{i:09d}" for i in range(20000)],
+        },
+    )
+    config = {
+        "base_url": fake.start(),
+        "client_id": "benchmark",
+        "client_secret": "benchmark",
+        "refresh_token": "benchmark",
+        "api_version": "40",
+        **dict(parse_option(option) for option in args.options),
+    }
+    config_path = os.path.join(args.workdir, "bench-config.json")
+    catalog_path = os.path.join(args.workdir, "bench-catalog.json")
+    with open(config_path, "w") as f:
+        json.dump(config, f)
+    with open(catalog_path, "w") as f:
+        json.dump(catalog(), f)
+
+    main = os.path.join(os.path.dirname(os.path.dirname(__file__)), "main.py")
+    command = [sys.executable, main, "write", "--config", config_path]
+    command += ["--catalog", catalog_path]
+    states, summary = 0, None
+    start = time.perf_counter()
+    with open(messages_path, "rb") as stdin:
+        process = subprocess.Popen(command, stdin=stdin, stdout=subprocess.PIPE)
+        assert process.stdout is not None
+        for line in process.stdout:
+            message = json.loads(line)
+            if message["type"] == "STATE":
+                states += 1
+            elif message["type"] == "LOG" and message["log"]["message"].startswith(
+                SUMMARY_PREFIX
+            ):
+                summary = json.loads(message["log"]["message"][len(SUMMARY_PREFIX) :])
+        # the resource usage of this child alone
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    elapsed = time.perf_counter() - start
+    fake.stop()
+
+    stats = fake.stats()
+    print(f"config:      {json.dumps(dict(map(parse_option, args.options)))}")
+    print(f"exit code:   {process.returncode}")
+    print(f"records:     {args.records:,} in {elapsed:.2f}s")
+    print(f"throughput:  {args.records / elapsed:,.0f} records/s")
+    # ru_maxrss is in KiB on Linux
+    print(f"peak RSS:    {usage.ru_maxrss / 1024:,.1f} MiB")
+    print(f"states:      {states}")
+    print(f"requests:    {json.dumps(stats['requests'])}")
+    print(
+        f"values:      {stats['values_imported']:,} imported,"
+        f" {stats['conflicts']:,} conflicts, {stats['errors']} errors"
+    )
+    if summary is not None:
+        print(
+            f"batches:     {summary['batches']}, latency p50"
+            f" {summary['batch_latency_p50']}s p95 {summary['batch_latency_p95']}s,"
+            f" {summary['retries']} retries"
+        )
+    sys.exit(process.returncode)
@@ -0,0 +1,331 @@
+"""
+Local stand-in for a DHIS2 server, for benchmarks and manual testing.
+
+Serves the token endpoint, dataValueSets imports (JSON or CSV, gzipped or
+chunked, synchronous or as async jobs), the job status endpoints and
+paged metadata collections, with configurable latency, error rate and
+rate of values rejected with ImportSummary conflicts:
+
+    python benchmarks/fake_dhis2.py [--port 8080] [--latency 0.05] ...
+
+The connector only needs `base_url` pointed at it, any credentials work.
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator, Mapping, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from destination_dhis2.constants import (
+    API_PATH,
+    DATA_VALUE_SETS_PATH,
+    IMPORT_JOB_TYPE,
+    SYSTEM_TASKS_PATH,
+    TASK_SUMMARIES_PATH,
+    TOKEN_REFRESH_PATH,
+)
+
+API_PATTERN = re.compile(rf"^{API_PATH}/(?:\d+/)?(?P<endpoint>.+?)/?$")
+
+
+class FakeDhis2:
+    """
+    Behaviour and request counters of the fake server, shared by the
+    handler threads. Conflicts and errors are drawn from a seeded generator,
+    so runs with the same settings see the same failures.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0,
+        value_latency: float = 0,
+        error_rate: float = 0,
+        conflict_rate: float = 0,
+        job_delay: float = 0,
+        metadata: Optional[Mapping[str, list[str]]] = None,
+        seed: int = 0,
+    ):
+        # seconds per import, plus seconds per imported value
+        self.latency = latency
+        self.value_latency = value_latency
+        # share of imports answered with 503 Service Unavailable
+        self.error_rate = error_rate
+        # share of values rejected with an ImportSummary conflict
+        self.conflict_rate = conflict_rate
+        # seconds an async import job takes to complete
+        self.job_delay = job_delay
+        # collection -> uids, e.g. {"dataElements": [...]}
+        self.metadata = dict(metadata or {})
+        self.requests: Counter[str] = Counter()
+        self.values_received = 0
+        self.values_imported = 0
+        self.conflicts = 0
+        self.errors = 0
+        # job id -> (completes at, import summary)
+        self.jobs: dict[str, tuple[float, dict[str, Any]]] = {}
+        self._job_ids = itertools.count(1)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        # serves from a daemon thread, returns the base url
+        self._server = ThreadingHTTPServer((host, port), Dhis2Handler)
+        self._server.daemon_threads = True
+        setattr(self._server, "fake", self)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://{host}:{self._server.server_port}"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "values_received": self.values_received,
+                "values_imported": self.values_imported,
+                "conflicts": self.conflicts,
+                "errors": self.errors,
+            }
+
+    def count(self, route: str) -> None:
+        with self._lock:
+            self.requests[route] += 1
+
+    def fails(self) -> bool:
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+            self.errors += failed
+            return failed
+
+    def import_values(self, org_units: list[str]) -> dict[str, Any]:
+        time.sleep(self.latency + self.value_latency * len(org_units))
+        with self._lock:
+            conflicts = [
+                {
+                    "object": org_unit,
+                    "value": f"Organisation unit not found: {org_unit}",
+                    "errorCode": "E7610",
+                    "indexes": [i],
+                }
+                for i, org_unit in enumerate(org_units)
+                if self._random.random() < self.conflict_rate
+            ]
+            imported = len(org_units) - len(conflicts)
+            self.values_received += len(org_units)
+            self.values_imported += imported
+            self.conflicts += len(conflicts)
+        return {
+            "responseType": "ImportSummary",
+            "status": "WARNING" if conflicts else "SUCCESS",
+            "importCount": {
+                "imported": imported,
+                "updated": 0,
+                "ignored": len(conflicts),
+                "deleted": 0,
+            },
+            "conflicts": conflicts,
+        }
+
+    def add_job(self, summary: dict[str, Any]) -> str:
+        with self._lock:
+            job_id = f"job{next(self._job_ids):08d}"
+            self.jobs[job_id] = (time.monotonic() + self.job_delay, summary)
+        return job_id
+
+    def job_statuses(self) -> dict[str, list[dict[str, Any]]]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                job_id: [{"completed": now >= completes_at, "level": "INFO"}]
+                for job_id, (completes_at, _) in self.jobs.items()
+            }
+
+    def job_summary(self, job_id: str) -> Optional[dict[str, Any]]:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or time.monotonic() < job[0]:
+                return None
+            return job[1]
+
+
+class Dhis2Handler(BaseHTTPRequestHandler):
+    # keeps connections open, as the connector's pooled session expects
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def fake(self) -> FakeDhis2:
+        return getattr(self.server, "fake")
+
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        body = self._read_body()
+        if url.path == TOKEN_REFRESH_PATH:
+            self.fake.count("token")
+            self._respond(200, {"access_token": "token", "expires_in": 43199})
+            return
+        match = API_PATTERN.match(url.path)
+        if match is None or f"/{match['endpoint']}" != DATA_VALUE_SETS_PATH:
+            self._respond(404, {"status": "ERROR", "message": "Not found"})
+            return
+
+        self.fake.count("dataValueSets")
+        if self.fake.fails():
+            self._respond(503, {"status": "ERROR", "message": "Service unavailable"})
+            return
+        summary = self.fake.import_values(self._org_units(body))
+        if parse_qs(url.query).get("async") == ["true"]:
+            job_id = self.fake.add_job(summary)
+            self._respond(
+                200,
+                {
+                    "httpStatus": "OK",
+                    "status": "OK",
+                    "response": {"id": job_id, "jobType": IMPORT_JOB_TYPE},
+                },
+            )
+            return
+        self._respond(200, summary)
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        match = API_PATTERN.match(url.path)
+        if match is None:
+            self._respond(404, {"status": "ERROR", "message": "Not found"})
+            return
+        endpoint = f"/{match['endpoint']}"
+
+        if endpoint == f"{SYSTEM_TASKS_PATH}/{IMPORT_JOB_TYPE}":
+            self.fake.count("tasks")
+            self._respond(200, self.fake.job_statuses())
+        elif endpoint.startswith(f"{TASK_SUMMARIES_PATH}/{IMPORT_JOB_TYPE}/"):
+            self.fake.count("taskSummaries")
+            summary = self.fake.job_summary(endpoint.rsplit("/", 1)[-1])
+            if summary is None:
+                self._respond(404, {"status": "ERROR", "message": "Job not found"})
+            else:
+                self._respond(200, summary)
+        else:
+            collection = endpoint.strip("/")
+            self.fake.count(collection)
+            self._respond(200, self._page(collection, parse_qs(url.query)))
+
+    def _page(self, collection: str, query: Mapping[str, list[str]]) -> dict[str, Any]:
+        uids = self.fake.metadata.get(collection, [])
+        page = int(query.get("page", ["1"])[0])
+        page_size = int(query.get("pageSize", ["50"])[0])
+        return {
+            "pager": {
+                "page": page,
+                "pageSize": page_size,
+                "total": len(uids),
+                "pageCount": max(-(-len(uids) // page_size), 1),
+            },
+            collection: [
+                {"id": uid} for uid in uids[(page - 1) * page_size : page * page_size]
+            ],
+        }
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            body = b"".join(self._read_chunks())
+        else:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return body
+
+    def _read_chunks(self) -> Iterator[bytes]:
+        while True:
+            size = int(self.rfile.readline().strip(), 16)
+            chunk = self.rfile.read(size + 2)[:size]
+            if size == 0:
+                return
+            yield chunk
+
+    def _org_units(self, body: bytes) -> list[str]:
+        # the organisation unit of each value, in payload order
+        if self.headers.get("Content-Type", "").startswith("application/csv"):
+            rows = csv.DictReader(io.StringIO(body.decode()))
+            return [row["orgunit"] for row in rows]
+        data_value_set = json.loads(body)
+        # values without an orgUnit have the one of the set's header
+        return [
+            value.get("orgUnit", data_value_set.get("orgUnit"))
+            for value in data_value_set["dataValues"]
+        ]
+
+    def _respond(self, status: int, body: Any) -> None:
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", type=float, default=0, help="seconds per import")
+    parser.add_argument(
+        "--value-latency", type=float, default=0, help="seconds per imported value"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0, help="share of imports failing with 503"
+    )
+    parser.add_argument(
+        "--conflict-rate",
+        type=float,
+        default=0,
+        help="share of values rejected with a conflict",
+    )
+    parser.add_argument(
+        "--job-delay", type=float, default=0, help="seconds an async import job takes"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def from_arguments(
+    args: argparse.Namespace, metadata: Optional[Mapping[str, list[str]]] = None
+) -> FakeDhis2:
+    return FakeDhis2(
+        latency=args.latency,
+        value_latency=args.value_latency,
+        error_rate=args.error_rate,
+        conflict_rate=args.conflict_rate,
+        job_delay=args.job_delay,
+        metadata=metadata,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    fake = from_arguments(args)
+    print(f"Serving a fake DHIS2 at {fake.start(args.host, args.port)}, Ctrl-C stops")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        fake.stop()
+        print(json.dumps(fake.stats(), indent=2))
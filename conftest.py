@@ -1,3 +1,4 @@
+from typing import Any
 from urllib.parse import urljoin
 
 import pytest
@@ -33,12 +34,12 @@ def oauth_configs(
 
 
 @pytest.fixture(scope="session", autouse=True)
-def config(base_configs: dict[str, str], base_url: str) -> dict[str, str]:
+def config(base_configs: dict[str, str], base_url: str) -> dict[str, Any]:
     return {**base_configs, "base_url": base_url, "api_version": "29"}
 
 
 @pytest.fixture(scope="session", autouse=True)
-def data_elements_url(config: dict[str, str]) -> str:
+def data_elements_url(config: dict[str, Any]) -> str:
     return Dhis2Client(**config)._join_url_fragments(DATA_ELEMENTS_PATH)
 
 
@@ -3,14 +3,45 @@
 #
 
 
-from .authenticator import Dhis2Authenticator
-from .client import DataValue, DataValues, Dhis2Client
-from .destination import DestinationDhis2
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .authenticator import Dhis2Authenticator
+    from .batch import DataValue, DataValueBatch, DataValues
+    from .client import Dhis2Client
+    from .destination import DestinationDhis2
 
 __all__ = [
     "DestinationDhis2",
     "Dhis2Authenticator",
     "Dhis2Client",
     "DataValue",
+    "DataValueBatch",
     "DataValues",
 ]
+
+# exported name -> module, imported on first access so that commands not
+# needing them, like spec, do not pay for importing airbyte_cdk and requests
+_EXPORTS = {
+    "DestinationDhis2": "destination",
+    "Dhis2Authenticator": "authenticator",
+    "Dhis2Client": "client",
+    "DataValue": "batch",
+    "DataValueBatch": "batch",
+    "DataValues": "batch",
+}
+
+
+def __getattr__(name: str) -> Any:
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    # later lookups find it without going through __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -1,5 +1,8 @@
-from typing import Tuple
+import logging
+import threading
+from typing import Any, Optional, Tuple
 
+import pendulum
 import requests
 from airbyte_cdk.sources.streams.http.requests_native_auth import (
     BasicHttpAuthenticator,
@@ -7,19 +10,104 @@ from airbyte_cdk.sources.streams.http.requests_native_auth import (
 )
 from requests.exceptions import RequestException
 
+from .constants import TOKEN_EXPIRY_MARGIN, TOKEN_REFRESH_WINDOW
+from .retry import RetryPolicy
+
+airbyteLogger = logging.getLogger("airbyte")
+
 
 class Dhis2Authenticator(Oauth2Authenticator):
+    """
+    Caches the access token for as long as the authenticator lives.
+
+    The token is reused until `expiry_margin` seconds before it expires.
+    Within `refresh_window` seconds of expiry a refresh is started in the
+    background while callers keep using the current token, and concurrent
+    callers that find the token expired share a single refresh request.
+    Refresh requests go through `session`, so they can share the keep-alive
+    connection pool used for data requests, and transient failures are
+    retried according to `retry_policy`.
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        expiry_margin: int = TOKEN_EXPIRY_MARGIN,
+        refresh_window: int = TOKEN_REFRESH_WINDOW,
+        session: Optional[requests.Session] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(*args, **kwargs)
+        self.session = session or requests.Session()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.expiry_margin = expiry_margin
+        self.refresh_window = refresh_window
+        self._stale_at = pendulum.now().subtract(days=1)
+        self.refresh_count = 0
+        # held for the duration of any refresh, foreground or background
+        self._refresh_lock = threading.Lock()
+
+    def token_has_expired(self) -> bool:
+        return pendulum.now() > self.get_token_expiry_date().subtract(
+            seconds=self.expiry_margin
+        )
+
+    def token_is_stale(self) -> bool:
+        return pendulum.now() > self._stale_at
+
+    def get_access_token(self) -> str:
+        if self.token_has_expired():
+            with self._refresh_lock:
+                # another caller may have refreshed while we waited
+                if self.token_has_expired():
+                    self._refresh()
+        elif self.token_is_stale() and self._refresh_lock.acquire(blocking=False):
+            threading.Thread(target=self._background_refresh, daemon=True).start()
+        return self.access_token
+
+    def invalidate_access_token(self, access_token: Optional[str] = None) -> None:
+        # only drop the token that was actually rejected, so callers racing
+        # on the same 401 do not discard a token that was just refreshed
+        if access_token is None or access_token == self.access_token:
+            self._token_expiry_date = pendulum.now().subtract(days=1)
+
+    def _refresh(self) -> None:
+        current_datetime = pendulum.now()
+        token, expires_in = self.refresh_access_token()
+        self.refresh_count += 1
+        self.access_token = token
+        self.set_token_expiry_date(current_datetime, expires_in)
+        # refresh proactively, but never sooner than halfway through the lifetime
+        lifetime = int(expires_in)
+        self._stale_at = current_datetime.add(
+            seconds=max(lifetime - self.refresh_window, lifetime // 2)
+        )
+
+    def _background_refresh(self) -> None:
+        try:
+            self._refresh()
+        except RequestException as e:
+            # the token is still valid, the next foreground refresh will retry
+            airbyteLogger.warning(f"Background access token refresh failed: {e}")
+        finally:
+            self._refresh_lock.release()
+
     def refresh_access_token(self) -> Tuple[str, int]:
         try:
-            response = requests.request(
-                method="POST",
-                url=self.get_token_refresh_endpoint(),
-                data=self.build_refresh_request_body(),
-                # override default class
-                # to inject basic auth headers to refresh token method
-                headers=BasicHttpAuthenticator(
-                    username=self.get_client_id(), password=self.get_client_secret()
-                ).get_auth_header(),
+            response = self.retry_policy.call(
+                lambda: self.session.request(
+                    method="POST",
+                    url=self.get_token_refresh_endpoint(),
+                    data=self.build_refresh_request_body(),
+                    # override default class
+                    # to inject basic auth headers to refresh token method
+                    headers=BasicHttpAuthenticator(
+                        username=self.get_client_id(),
+                        password=self.get_client_secret(),
+                    ).get_auth_header(),
+                ),
+                "Access token refresh",
             )
             response.raise_for_status()
             response_json = response.json()
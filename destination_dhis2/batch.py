@@ -0,0 +1,189 @@
+from itertools import islice
+from typing import Iterable, Iterator, Optional, TypedDict, cast
+
+from .constants import PAGE_SIZE
+
+
+class _RequiredDataValue(TypedDict):
+    dataElement: str
+    completeDate: str
+    period: str
+    orgUnit: str
+    value: str
+
+
+class DataValue(_RequiredDataValue, total=False):
+    # DHIS2 applies the default combos when left out
+    categoryOptionCombo: str
+    attributeOptionCombo: str
+
+
+DataValues = list[DataValue]
+
+DATA_VALUE_FIELDS = tuple(DataValue.__annotations__)
+
+OPTIONAL_DATA_VALUE_FIELDS = ("categoryOptionCombo", "attributeOptionCombo")
+
+# dataElement, completeDate, period, orgUnit, value, categoryOptionCombo,
+# attributeOptionCombo, the combos being None when left to their defaults
+DataValueRow = tuple[str, str, str, str, str, Optional[str], Optional[str]]
+
+# dataElement, period, orgUnit, categoryOptionCombo, attributeOptionCombo,
+# DHIS2 keeps a single value per key
+DataValueKey = tuple[str, str, str, Optional[str], Optional[str]]
+
+
+def to_data_value(row: DataValueRow) -> DataValue:
+    data_value = dict(zip(DATA_VALUE_FIELDS, row))
+    # only the combos that were set
+    for name in OPTIONAL_DATA_VALUE_FIELDS:
+        if data_value[name] is None:
+            del data_value[name]
+    return cast(DataValue, data_value)
+
+
+class DataValueBatch:
+    """
+    Per-client buffer of data values stored column-wise.
+
+    Each field lives in its own list preallocated to `capacity`, so queueing a
+    value fills seven slots instead of allocating a dict per record. The
+    columns grow by `capacity` slots if more values are queued. The category
+    and attribute option combos are optional, None leaves them to DHIS2's
+    defaults.
+
+    A `coalesce` batch keeps a single value per (dataElement, period, orgUnit,
+    categoryOptionCombo, attributeOptionCombo), a value queued for a key
+    already in the batch replaces the earlier one in place. `coalesced`
+    counts the values replaced that way.
+    """
+
+    __slots__ = (
+        "capacity",
+        "_size",
+        "_data_elements",
+        "_complete_dates",
+        "_periods",
+        "_org_units",
+        "_values",
+        "_category_option_combos",
+        "_attribute_option_combos",
+        "_index",
+        "coalesced",
+        "has_option_combos",
+    )
+
+    def __init__(self, capacity: int = PAGE_SIZE, coalesce: bool = False):
+        self.capacity = capacity
+        self._size = 0
+        # key -> slot of the value queued for it
+        self._index: Optional[dict[DataValueKey, int]] = {} if coalesce else None
+        self.coalesced = 0
+        # whether any value sets a combo, so serializers can skip them otherwise
+        self.has_option_combos = False
+        self._data_elements: list[Optional[str]] = [None] * capacity
+        self._complete_dates: list[Optional[str]] = [None] * capacity
+        self._periods: list[Optional[str]] = [None] * capacity
+        self._org_units: list[Optional[str]] = [None] * capacity
+        self._values: list[Optional[str]] = [None] * capacity
+        self._category_option_combos: list[Optional[str]] = [None] * capacity
+        self._attribute_option_combos: list[Optional[str]] = [None] * capacity
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, key: DataValueKey) -> bool:
+        # only coalescing batches index their keys
+        return self._index is not None and key in self._index
+
+    def __iter__(self) -> Iterator[DataValue]:
+        # materialises the dicts lazily, one value at a time
+        for row in self.rows():
+            yield to_data_value(row)
+
+    def rows(self) -> Iterator[DataValueRow]:
+        # iterates the columns in place, without building a dict per value
+        size = self._size
+        rows = zip(
+            islice(self._data_elements, size),
+            islice(self._complete_dates, size),
+            islice(self._periods, size),
+            islice(self._org_units, size),
+            islice(self._values, size),
+            islice(self._category_option_combos, size),
+            islice(self._attribute_option_combos, size),
+        )
+        return cast(Iterator[DataValueRow], rows)  # filled slots are never None
+
+    def shared_header(self) -> Optional[tuple[str, str]]:
+        # the (period, orgUnit) every value has in common, if any
+        size = self._size
+        if size == 0:
+            return None
+        period, org_unit = self._periods[0], self._org_units[0]
+        if self._periods.count(period) < size or self._org_units.count(org_unit) < size:
+            return None
+        return cast(tuple[str, str], (period, org_unit))
+
+    def _grow(self) -> None:
+        extension: list[Optional[str]] = [None] * self.capacity
+        self._data_elements.extend(extension)
+        self._complete_dates.extend(extension)
+        self._periods.extend(extension)
+        self._org_units.extend(extension)
+        self._values.extend(extension)
+        self._category_option_combos.extend(extension)
+        self._attribute_option_combos.extend(extension)
+
+    def append(
+        self,
+        data_element: str,
+        complete_date: str,
+        period: str,
+        org_unit: str,
+        value: str,
+        category_option_combo: Optional[str] = None,
+        attribute_option_combo: Optional[str] = None,
+    ) -> None:
+        if category_option_combo is not None or attribute_option_combo is not None:
+            self.has_option_combos = True
+        if self._index is not None:
+            key = (
+                data_element,
+                period,
+                org_unit,
+                category_option_combo,
+                attribute_option_combo,
+            )
+            slot = self._index.get(key)
+            if slot is not None:
+                # last write wins, the key keeps its position in the batch
+                self._complete_dates[slot] = complete_date
+                self._values[slot] = value
+                self.coalesced += 1
+                return
+            self._index[key] = self._size
+
+        i = self._size
+        if i == len(self._values):
+            self._grow()
+        self._data_elements[i] = data_element
+        self._complete_dates[i] = complete_date
+        self._periods[i] = period
+        self._org_units[i] = org_unit
+        self._values[i] = value
+        self._category_option_combos[i] = category_option_combo
+        self._attribute_option_combos[i] = attribute_option_combo
+        self._size = i + 1
+
+    def extend(self, data_values: Iterable[DataValue]) -> None:
+        for data_value in data_values:
+            self.append(
+                data_value["dataElement"],
+                data_value["completeDate"],
+                data_value["period"],
+                data_value["orgUnit"],
+                data_value["value"],
+                data_value.get("categoryOptionCombo"),
+                data_value.get("attributeOptionCombo"),
+            )
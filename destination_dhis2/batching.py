@@ -0,0 +1,101 @@
+import logging
+import threading
+from typing import Optional
+
+from .constants import (
+    MAX_BATCH_BYTES,
+    MAX_BATCH_SIZE,
+    MIN_BATCH_SIZE,
+    PAGE_SIZE,
+    TARGET_BATCH_LATENCY,
+)
+
+airbyteLogger = logging.getLogger("airbyte")
+
+# weight of the latest observation in the moving averages
+SMOOTHING = 0.3
+# error rate above which batches shrink regardless of latency
+MAX_ERROR_RATE = 0.1
+
+
+class AdaptiveBatchSizer:
+    """
+    Picks the number of values per batch from the observed import latency,
+    error rate and serialized payload size.
+
+    Batches grow by half while imports finish well within `target_latency`,
+    shrink proportionally when they take longer and halve on errors, always
+    staying between `min_size` and `max_size` values and under `max_bytes`.
+    Only full batches grow them, a batch split off a full one, e.g. a data
+    value set of grouped values, counts as full by the size it was split from.
+    """
+
+    def __init__(
+        self,
+        initial_size: int = PAGE_SIZE,
+        min_size: int = MIN_BATCH_SIZE,
+        max_size: int = MAX_BATCH_SIZE,
+        max_bytes: int = MAX_BATCH_BYTES,
+        target_latency: float = TARGET_BATCH_LATENCY,
+    ):
+        if not 0 < min_size <= max_size:
+            raise ValueError(
+                f"Invalid batch size bounds: min {min_size}, max {max_size}"
+            )
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.target_latency = target_latency
+        self.error_rate = 0.0
+        self.bytes_per_value: Optional[float] = None
+        self._batch_size = self._clamp(initial_size)
+        self._lock = threading.Lock()
+
+    @property
+    def batch_size(self) -> int:
+        return self._batch_size
+
+    def _clamp(self, size: float) -> int:
+        if self.bytes_per_value:
+            size = min(size, self.max_bytes / self.bytes_per_value)
+        return int(max(self.min_size, min(self.max_size, size)))
+
+    def record(
+        self,
+        values: int,
+        latency: float,
+        payload_bytes: int,
+        failed: bool,
+        split_from: Optional[int] = None,
+    ) -> None:
+        with self._lock:
+            self.error_rate += SMOOTHING * (float(failed) - self.error_rate)
+            if payload_bytes and values:
+                observed = payload_bytes / values
+                self.bytes_per_value = (
+                    observed
+                    if self.bytes_per_value is None
+                    else self.bytes_per_value
+                    + SMOOTHING * (observed - self.bytes_per_value)
+                )
+
+            size = float(self._batch_size)
+            if failed or self.error_rate > MAX_ERROR_RATE:
+                size /= 2
+            elif latency > self.target_latency:
+                size *= self.target_latency / latency
+            # partial batches, e.g. flushed for a state, say little about capacity
+            elif (
+                latency < self.target_latency / 2
+                and (values if split_from is None else split_from) >= self._batch_size
+            ):
+                size *= 1.5
+
+            batch_size = self._clamp(size)
+            if batch_size != self._batch_size:
+                airbyteLogger.info(
+                    f"Batch size adjusted from {self._batch_size} to {batch_size} values"
+                    f" (latency {latency:.2f}s, {payload_bytes} bytes,"
+                    f" error rate {self.error_rate:.2f})"
+                )
+                self._batch_size = batch_size
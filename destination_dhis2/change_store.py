@@ -0,0 +1,135 @@
+import hashlib
+import sqlite3
+import threading
+from typing import Iterable, Optional
+
+from .batch import DataValueKey, DataValueRow
+from .constants import CHANGE_STORE_BUSY_TIMEOUT, CHANGE_STORE_CACHE_SIZE
+
+
+def value_hash(complete_date: str, value: str) -> bytes:
+    # 8 bytes are plenty to tell a changed value from the last imported one
+    return hashlib.blake2b(
+        f"{complete_date}\x1f{value}".encode(), digest_size=8
+    ).digest()
+
+
+class ChangeStore:
+    """
+    Remembers a hash of the last value DHIS2 imported for each
+    (dataElement, period, orgUnit, categoryOptionCombo, attributeOptionCombo)
+    in a SQLite file, so repeated full refresh syncs only send the values
+    that changed since. Default combos are stored as empty strings.
+
+    Lookups go to disk through SQLite's page cache, which is bounded by
+    `cache_size` KiB, so memory does not grow with the number of unchanged
+    values. The keys of the values found changed are kept for the rest of
+    the sync, as a later value for one of them must be sent even when it
+    matches the hash stored before.
+    Shard processes share the file, a write waits up to `busy_timeout`
+    seconds for that of another shard.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        cache_size: int = CHANGE_STORE_CACHE_SIZE,
+        busy_timeout: float = CHANGE_STORE_BUSY_TIMEOUT,
+    ):
+        self.path = path
+        # written by the flush workers and read while records are buffered
+        self._lock = threading.Lock()
+        # keys whose value was found changed, and sent, during this sync
+        self._changed: set[DataValueKey] = set()
+        self._connection = sqlite3.connect(
+            path, timeout=busy_timeout, check_same_thread=False
+        )
+        self._connection.execute(f"PRAGMA cache_size = -{int(cache_size)}")
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS data_values ("
+            " data_element TEXT NOT NULL,"
+            " period TEXT NOT NULL,"
+            " org_unit TEXT NOT NULL,"
+            " category_option_combo TEXT NOT NULL,"
+            " attribute_option_combo TEXT NOT NULL,"
+            " hash BLOB NOT NULL,"
+            " PRIMARY KEY (data_element, period, org_unit,"
+            " category_option_combo, attribute_option_combo)"
+            ") WITHOUT ROWID"
+        )
+        self._connection.commit()
+
+    def is_unchanged(
+        self,
+        data_element: str,
+        complete_date: str,
+        period: str,
+        org_unit: str,
+        value: str,
+        category_option_combo: Optional[str] = None,
+        attribute_option_combo: Optional[str] = None,
+    ) -> bool:
+        key = (
+            data_element,
+            period,
+            org_unit,
+            category_option_combo,
+            attribute_option_combo,
+        )
+        with self._lock:
+            if key in self._changed:
+                return False
+            row = self._connection.execute(
+                "SELECT hash FROM data_values"
+                " WHERE data_element = ? AND period = ? AND org_unit = ?"
+                " AND category_option_combo = ? AND attribute_option_combo = ?",
+                (
+                    data_element,
+                    period,
+                    org_unit,
+                    category_option_combo or "",
+                    attribute_option_combo or "",
+                ),
+            ).fetchone()
+            if row is not None and row[0] == value_hash(complete_date, value):
+                return True
+            self._changed.add(key)
+        return False
+
+    def update(self, rows: Iterable[DataValueRow]) -> None:
+        """
+        Records the values of `rows` as imported, to be called only once
+        DHIS2 has acknowledged them.
+        """
+        entries = [
+            (
+                data_element,
+                period,
+                org_unit,
+                category_option_combo or "",
+                attribute_option_combo or "",
+                value_hash(complete_date, value),
+            )
+            for (
+                data_element,
+                complete_date,
+                period,
+                org_unit,
+                value,
+                category_option_combo,
+                attribute_option_combo,
+            ) in rows
+        ]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO data_values"
+                " (data_element, period, org_unit, category_option_combo,"
+                " attribute_option_combo, hash) VALUES (?, ?, ?, ?, ?, ?)",
+                entries,
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,145 @@
+import time
+from typing import Callable, Iterable, Optional
+
+from airbyte_cdk.models import (  # type: ignore # see this https://github.com/airbytehq/airbyte/pull/22963
+    AirbyteMessage,
+    AirbyteStateType,
+)
+
+from .stream_writer import StreamWriter
+
+# (name, namespace) of the stream of a per-stream state, None for any other
+StateKey = Optional[tuple[str, Optional[str]]]
+
+
+def state_key(message: AirbyteMessage) -> StateKey:
+    state = message.state
+    if state is not None and state.type == AirbyteStateType.STREAM:
+        descriptor = state.stream.stream_descriptor
+        return descriptor.name, descriptor.namespace
+    return None
+
+
+class HeldState:
+    __slots__ = ("message", "held_at", "records_at", "waiting_for", "sequence")
+
+    def __init__(
+        self,
+        message: AirbyteMessage,
+        held_at: float,
+        records_at: int,
+        waiting_for: dict[StreamWriter, int],
+        sequence: int,
+    ):
+        self.message = message
+        # when, and after how many records, the oldest state it replaced was held
+        self.held_at = held_at
+        self.records_at = records_at
+        # writer -> its submitted batches when the state arrived, for the
+        # writers still buffering records from before it
+        self.waiting_for = waiting_for
+        # the client batches that must be durable, once no writer is waited for
+        self.sequence = sequence
+
+
+class CheckpointPolicy:
+    """
+    Decides when the STATE messages of a sync are emitted, instead of
+    checkpointing on every one of them.
+
+    States are held, and a newer state of the same stream, or a newer
+    global state, replaces the held one, so only the latest is emitted.
+    A held state is released without waiting once its records have gone
+    out in batches that filled up naturally and DHIS2 acknowledged them,
+    or spooled them. Once the oldest held state has waited `linger`
+    seconds, or `max_records` records have been read since it, the
+    destination checkpoints and releases them all. With a `linger` of 0
+    every state is checkpointed as it arrives.
+    """
+
+    def __init__(
+        self,
+        linger: float = 0,
+        max_records: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.linger = linger
+        self.max_records = max_records
+        self.clock = clock
+        self.records = 0
+        self.coalesced = 0
+        self._held: dict[StateKey, HeldState] = {}
+
+    def __len__(self) -> int:
+        return len(self._held)
+
+    def hold(
+        self, message: AirbyteMessage, writers: Iterable[StreamWriter], submitted: int
+    ) -> None:
+        """
+        Holds a state covering the records `writers` have received so far,
+        `submitted` being the number of batches the client was handed.
+        """
+        key = state_key(message)
+        replaced = self._held.pop(key, None)
+        if replaced is None:
+            held_at, records_at = self.clock(), self.records
+        else:
+            self.coalesced += 1
+            held_at, records_at = replaced.held_at, replaced.records_at
+        self._held[key] = HeldState(
+            message,
+            held_at,
+            records_at,
+            {
+                writer: writer.submitted_batches
+                for writer in writers
+                if len(writer.buffer) > 0
+            },
+            submitted,
+        )
+
+    def due(self) -> bool:
+        # whether the held states must be checkpointed now
+        if not self._held:
+            return False
+        oldest = min(self._held.values(), key=lambda held: held.held_at)
+        if self.clock() - oldest.held_at >= self.linger:
+            return True
+        return (
+            self.max_records is not None
+            and self.records - oldest.records_at >= self.max_records
+        )
+
+    def writers(self) -> set[StreamWriter]:
+        # the writers still buffering records of a held state
+        return {writer for held in self._held.values() for writer in held.waiting_for}
+
+    def ready(self, submitted: int, durable: int) -> list[AirbyteMessage]:
+        """
+        Releases the held states whose records are durable, given the number
+        of batches the client was handed and how many of those, counting
+        from the first, are durable.
+        """
+        released = []
+        for key, held in list(self._held.items()):
+            if held.waiting_for:
+                if any(
+                    writer.submitted_batches == count
+                    for writer, count in held.waiting_for.items()
+                ):
+                    continue
+                # each writer's records from before the state are in a
+                # batch handed over by now
+                held.waiting_for = {}
+                held.sequence = submitted
+            if durable >= held.sequence:
+                released.append(held.message)
+                del self._held[key]
+        return released
+
+    def release(self) -> list[AirbyteMessage]:
+        # every held state, once everything written so far is durable
+        released = [held.message for held in self._held.values()]
+        self._held.clear()
+        return released
@@ -1,26 +1,59 @@
-from typing import Any, Literal, Mapping, Optional, TypedDict
-from urllib.parse import urljoin
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from http import HTTPStatus
+from typing import Iterable, Optional, Union
 
 import requests
+from requests.exceptions import RequestException
 
-from .authenticator import Dhis2Authenticator
-from .constants import API_PATH, DATA_VALUE_SETS_PATH, PAGE_SIZE, TOKEN_REFRESH_PATH
+from .batch import DataValue, DataValueBatch, to_data_value
+from .batching import AdaptiveBatchSizer
+from .change_store import ChangeStore
+from .connection import Dhis2Connection
+from .constants import (
+    CONNECT_TIMEOUT,
+    DATA_VALUE_SETS_PATH,
+    IMPORT_JOB_TIMEOUT,
+    MAX_BATCH_BYTES,
+    MAX_BATCH_SIZE,
+    MAX_CONCURRENT_REQUESTS,
+    MAX_RETRIES,
+    METADATA_CACHE_TTL,
+    METRICS_INTERVAL,
+    MIN_BATCH_SIZE,
+    MIN_GROUP_SIZE,
+    PAGE_SIZE,
+    POOL_SIZE,
+    READ_TIMEOUT,
+    RETRY_BUDGET,
+    SPOOL_MAX_BATCHES,
+    TARGET_BATCH_LATENCY,
+)
+from .dead_letter import DeadLetterQueue
+from .grouping import empty_grouping_stats, group_batch
+from .import_jobs import ImportJobPoller, parse_job_id
+from .import_options import ImportStrategy, import_params
+from .import_summary import ImportSummary, empty_import_count
+from .metadata import MetadataIndex
+from .retry import is_permanent_failure
+from .serializer import (
+    CONTENT_TYPES,
+    DataValueSetBody,
+    PayloadFormat,
+    payload_size,
+    serialize_payload,
+)
+from .spool import Spool
+from .telemetry import MetricsSnapshot, SyncMetrics, log_metrics, write_prometheus
+from .throttle import ConcurrencyGovernor, RateLimiter, RateLimitWindow
 
+airbyteLogger = logging.getLogger("airbyte")
 
-class DataValue(TypedDict):
-    dataElement: str
-    completeDate: str
-    period: str
-    orgUnit: str
-    value: str
-
-
-DataValues = list[DataValue]
-
-
-class Dhis2Client:
-    write_buffer: DataValues = []
 
+class Dhis2Client(Dhis2Connection):
     def __init__(
         self,
         base_url: str,
@@ -28,88 +61,533 @@ class Dhis2Client:
         client_secret: str,
         refresh_token: str,
         api_version: str,
+        pool_size: int = POOL_SIZE,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        max_concurrent_requests: int = MAX_CONCURRENT_REQUESTS,
+        max_retries: int = MAX_RETRIES,
+        retry_budget: int = RETRY_BUDGET,
+        adaptive_batching: bool = False,
+        min_batch_size: int = MIN_BATCH_SIZE,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_batch_bytes: int = MAX_BATCH_BYTES,
+        target_batch_latency: float = TARGET_BATCH_LATENCY,
+        chunked_requests: bool = False,
+        payload_format: PayloadFormat = "json",
+        compress_requests: bool = False,
+        dead_letter_path: Optional[str] = None,
+        validate_metadata: bool = False,
+        metadata_cache_path: Optional[str] = None,
+        metadata_cache_ttl: int = METADATA_CACHE_TTL,
+        validate_data_set_assignment: bool = False,
+        change_store_path: Optional[str] = None,
+        coalesce_duplicates: bool = True,
+        async_imports: bool = False,
+        import_job_timeout: float = IMPORT_JOB_TIMEOUT,
+        import_strategy: ImportStrategy = "CREATE_AND_UPDATE",
+        skip_existing_check: bool = False,
+        skip_audit: bool = False,
+        dry_run: bool = False,
+        id_scheme: Optional[str] = None,
+        data_element_id_scheme: Optional[str] = None,
+        org_unit_id_scheme: Optional[str] = None,
+        preheat_cache: bool = False,
+        spool_path: Optional[str] = None,
+        spool_max_batches: int = SPOOL_MAX_BATCHES,
+        requests_per_second: Optional[float] = None,
+        values_per_second: Optional[float] = None,
+        rate_limit_windows: Optional[list[RateLimitWindow]] = None,
+        rate_limit_timezone: str = "UTC",
+        adaptive_concurrency: bool = False,
+        metrics_interval: float = METRICS_INTERVAL,
+        metrics_path: Optional[str] = None,
+        group_data_values: bool = False,
+        min_group_size: int = MIN_GROUP_SIZE,
     ):
-        self.base_url = base_url
-        self.client_id = client_id
-        self.client_secret = client_secret
-        self.refresh_token = refresh_token
-        self.api_version = api_version
-
-    def _join_url_fragments(self, endpoint: str) -> str:
-        # constitute complete url by join url fragments
-        # while stripping possibly misplaced forward slashes
-        return urljoin(
-            self.base_url,
-            "/".join(
-                part.strip("/") for part in (API_PATH, self.api_version, endpoint)
-            ),
+        self.max_concurrent_requests = max_concurrent_requests
+        self.chunked_requests = chunked_requests
+        if payload_format not in CONTENT_TYPES:
+            raise ValueError(f"Unsupported payload format: {payload_format}")
+        self.payload_format = payload_format
+        self.compress_requests = compress_requests
+        # totals of the ImportSummary responses of every batch
+        self.import_count = empty_import_count()
+        self._import_count_lock = threading.Lock()
+        self.dead_letters = DeadLetterQueue(dead_letter_path)
+        self.validate_metadata = validate_metadata
+        self.metadata_cache_path = metadata_cache_path
+        self.metadata_cache_ttl = metadata_cache_ttl
+        self.validate_data_set_assignment = validate_data_set_assignment
+        # sent with every dataValueSets import
+        self.import_params = import_params(
+            import_strategy=import_strategy,
+            skip_existing_check=skip_existing_check,
+            skip_audit=skip_audit,
+            dry_run=dry_run,
+            id_scheme=id_scheme,
+            data_element_id_scheme=data_element_id_scheme,
+            org_unit_id_scheme=org_unit_id_scheme,
+            preheat_cache=preheat_cache,
+            coalesce_duplicates=coalesce_duplicates,
         )
-
-    @property
-    def _token_refresh_endpoint(self) -> str:
-        # does not use the API_PATH prefix
-        return urljoin(self.base_url, TOKEN_REFRESH_PATH)
-
-    def _get_auth_headers(self) -> Mapping[str, Any]:
-        authenticator = Dhis2Authenticator(
-            token_refresh_endpoint=self._token_refresh_endpoint,
-            client_id=self.client_id,
-            client_secret=self.client_secret,
-            refresh_token=self.refresh_token,
+        self.dry_run = dry_run
+        if validate_metadata and {
+            id_scheme,
+            data_element_id_scheme,
+            org_unit_id_scheme,
+        } - {None, "UID"}:
+            raise ValueError("validate_metadata requires the UID id scheme")
+        # buffers keep only the last value queued for each key
+        self.coalesce_duplicates = coalesce_duplicates
+        self.coalesced_count = 0
+        # batches are sorted and split into data value sets per
+        # (period, orgUnit) with both fields in the set's header
+        self.group_data_values = group_data_values
+        self.min_group_size = min_group_size
+        self.grouping = empty_grouping_stats()
+        # batches are imported by DHIS2 in the background while their
+        # workers wait for the jobs to complete
+        self.import_jobs = (
+            ImportJobPoller(self, timeout=import_job_timeout) if async_imports else None
+        )
+        # batches are persisted before they are queued, so a crashed sync
+        # can resume them and more batches can wait than fit in memory
+        self.spool = Spool(spool_path) if spool_path is not None else None
+        if self.spool is not None and skip_existing_check:
+            # a batch imported right before a crash is imported again on resume
+            raise ValueError("skip_existing_check cannot be used with a spool")
+        self.spool_max_batches = spool_max_batches
+        # set by load_metadata when validation is enabled
+        self.metadata: Optional[MetadataIndex] = None
+        # values unchanged since their last import are not sent again
+        self.change_store = (
+            ChangeStore(change_store_path) if change_store_path is not None else None
+        )
+        # throughput and latency of the sync, reported every metrics_interval
+        self.metrics = SyncMetrics(metrics_interval)
+        self.metrics_path = metrics_path
+        self.batch_sizer = (
+            AdaptiveBatchSizer(
+                min_size=min_batch_size,
+                max_size=max_batch_size,
+                max_bytes=max_batch_bytes,
+                target_latency=target_batch_latency,
+            )
+            if adaptive_batching
+            else None
         )
-        return authenticator.get_auth_header()
+        self.write_buffer = DataValueBatch(
+            self.batch_size, coalesce=coalesce_duplicates
+        )
+        # shared DHIS2 servers are protected from floods of requests or values
+        self.rate_limiter = (
+            RateLimiter(
+                requests_per_second=requests_per_second,
+                values_per_second=values_per_second,
+                windows=rate_limit_windows,
+                timezone=rate_limit_timezone,
+            )
+            if requests_per_second or values_per_second or rate_limit_windows
+            else None
+        )
+        # imports run as concurrently as the server keeps up with
+        self.governor = (
+            ConcurrencyGovernor(max_concurrent_requests)
+            if adaptive_concurrency
+            else None
+        )
+        super().__init__(
+            base_url=base_url,
+            client_id=client_id,
+            client_secret=client_secret,
+            refresh_token=refresh_token,
+            api_version=api_version,
+            # every in-flight batch needs its own connection
+            pool_size=max(pool_size, max_concurrent_requests),
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            max_retries=max_retries,
+            retry_budget=retry_budget,
+            rate_limiter=self.rate_limiter,
+        )
+        # batches are written by a bounded pool while the next buffer fills
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_requests, thread_name_prefix="dhis2-flush"
+        )
+        self._pending: set[Future[None]] = set()
+        # batches handed to the workers, and how many of those, counting
+        # from the first, DHIS2 has acknowledged
+        self.submitted_batches = 0
+        self._acknowledged = 0
+        self._acknowledged_out_of_order: set[int] = set()
+        self._acknowledged_lock = threading.Lock()
 
-    def request(
-        self,
-        http_method: str,
-        endpoint: str,
-        params: Optional[dict[str, Any]] = None,
-        json: Optional[dict[str, Any]] = None,
-    ) -> requests.Response:
-        url = self._join_url_fragments(endpoint)
-        headers = {
-            "Accept": "application/json",
-            "Content-Type": "application/json",
-            **self._get_auth_headers(),
-        }
-        response = requests.request(
-            method=http_method, url=url, headers=headers, params=params, json=json
+    def load_metadata(self) -> Optional[MetadataIndex]:
+        if self.validate_metadata and self.metadata is None:
+            self.metadata = MetadataIndex.load(
+                self,
+                cache_path=self.metadata_cache_path,
+                ttl=self.metadata_cache_ttl,
+                check_assignments=self.validate_data_set_assignment,
+            )
+        return self.metadata
+
+    def metrics_snapshot(self) -> MetricsSnapshot:
+        return self.metrics.snapshot(
+            token_refreshes=self._authenticator.refresh_count,
+            retries=self.retry_policy.retries,
+            queue_depth=len(self._pending),
         )
-        return response
 
-    def _batch_write(self, dataValues: DataValues) -> requests.Response:
+    def report_metrics(self) -> None:
+        """
+        Logs the metrics of the sync so far, and dumps them to metrics_path,
+        once every metrics_interval.
+        """
+        if not self.metrics.due():
+            return
+        snapshot = self.metrics_snapshot()
+        log_metrics(snapshot)
+        if self.metrics_path is not None:
+            write_prometheus(snapshot, self.metrics_path)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        super().close()
+        if self.change_store is not None:
+            self.change_store.close()
+
+    def _batch_write(self, dataValues: Iterable[DataValue]) -> requests.Response:
         """
         https://docs.dhis2.org/en/develop/using-the-api/dhis-core-version-master/data.html#webapi_sending_bulks_data_values
         """
 
-        request_body: dict[Literal["dataValues"], DataValues] = {
-            "dataValues": dataValues
-        }
-        response = self.request(
-            http_method="POST",
-            endpoint=DATA_VALUE_SETS_PATH,
-            json=request_body,  # type: ignore # Type[Literal["some_str"]] != str
+        if isinstance(dataValues, DataValueBatch):
+            batch = dataValues
+        else:
+            batch = DataValueBatch()
+            batch.extend(dataValues)
+
+        # encoded straight from the batch columns, without an intermediate document
+        body: Union[bytes, DataValueSetBody] = (
+            DataValueSetBody(
+                batch,
+                self.payload_format,
+                self.compress_requests,
+                hoist_headers=self.group_data_values,
+            )
+            if self.chunked_requests
+            else serialize_payload(
+                batch,
+                self.payload_format,
+                self.compress_requests,
+                hoist_headers=self.group_data_values,
+            )
         )
-        return response
+        headers = {"Content-Type": CONTENT_TYPES[self.payload_format]}
+        if self.compress_requests:
+            headers["Content-Encoding"] = "gzip"
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire_values(len(batch))
+        if self.governor is not None:
+            self.governor.acquire()
+        start = time.monotonic()
+        failed = True
+        try:
+            response = self.request(
+                http_method="POST",
+                endpoint=DATA_VALUE_SETS_PATH,
+                params={
+                    **self.import_params,
+                    **({"async": "true"} if self.import_jobs is not None else {}),
+                },
+                data=body,
+                headers=headers,
+                # imports are idempotent, so transient failures are safe to retry,
+                # unless DHIS2 inserts every value without checking for it
+                retry=True,
+                idempotent="skipExistingCheck" not in self.import_params,
+            )
+            failed = response.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR
+            return response
+        finally:
+            if self.governor is not None:
+                self.governor.release(
+                    latency=time.monotonic() - start, values=len(batch), failed=failed
+                )
 
     def queue_write_operation(self, dataValue: DataValue) -> None:
-        # remove other possible appends
-        data_value: DataValue = {
-            "dataElement": dataValue["dataElement"],
-            "completeDate": dataValue["completeDate"],
-            "period": dataValue["period"],
-            "orgUnit": dataValue["orgUnit"],
-            "value": dataValue["value"],
-        }
-        self.write_buffer.append(data_value)
+        # only the data value fields are kept, other possible appends are dropped,
+        # values unchanged since their last import are skipped by StreamWriter
+        self.write_buffer.append(
+            dataValue["dataElement"],
+            dataValue["completeDate"],
+            dataValue["period"],
+            dataValue["orgUnit"],
+            dataValue["value"],
+            dataValue.get("categoryOptionCombo"),
+            dataValue.get("attributeOptionCombo"),
+        )
+
+    @property
+    def batch_size(self) -> int:
+        return self.batch_sizer.batch_size if self.batch_sizer else PAGE_SIZE
 
     def buffer_is_full(self) -> bool:
-        return len(self.write_buffer) >= PAGE_SIZE
+        return len(self.write_buffer) >= self.batch_size
 
-    def flush(self) -> None:
-        # TODO: Handle retry?
-        # best place to handle retry imo
-        if len(self.write_buffer) > 0:
-            response = self._batch_write(self.write_buffer)
+    def _write_batch(
+        self,
+        dataValues: DataValueBatch,
+        resubmit: bool = True,
+        split_from: Optional[int] = None,
+    ) -> None:
+        start = time.monotonic()
+        try:
+            response = self._batch_write(dataValues)
+            # an async import is only timed once its job has completed
+            summary = self._import_summary(response)
+        except RequestException:
+            self._observe_batch(dataValues, start, None, True, split_from)
+            raise
+        # a 409 with an import summary only reports conflicts in the data,
+        # which neither the batch size nor the throughput is to blame for
+        self._observe_batch(
+            dataValues, start, response, summary is None and not response.ok, split_from
+        )
+
+        if summary is None:
             response.raise_for_status()
-            self.write_buffer.clear()
+            return
+
+        rejected = summary.rejected_indexes(dataValues)
+        if summary.status == "ERROR" and not rejected:
+            response.raise_for_status()
+            raise RequestException(
+                f"Import of {len(dataValues)} values failed: {summary.description}",
+                response=response,
+            )
+
+        accepted = DataValueBatch(len(dataValues) - len(rejected))
+        for i, row in enumerate(dataValues.rows()):
+            if i not in rejected:
+                accepted.append(*row)
+        # an atomic import drops the whole batch over a single conflict,
+        # so the values that were not at fault are sent once more on their own
+        resubmitting = resubmit and summary.acknowledged == 0 and len(accepted) > 0
+        self._record_import(summary, len(rejected) if resubmitting else None)
+        if (
+            self.change_store is not None
+            and not resubmitting
+            and summary.status != "ERROR"
+            # a dry run only reports what would have been imported
+            and not self.dry_run
+        ):
+            self.change_store.update(accepted.rows())
+
+        if rejected:
+            airbyteLogger.warning(
+                f"DHIS2 rejected {len(rejected)} of {len(dataValues)} values,"
+                f" e.g. {next(iter(rejected.values()))}"
+            )
+            rows = list(dataValues.rows())
+            self.dead_letters.put(
+                (to_data_value(rows[i]), reason) for i, reason in rejected.items()
+            )
+        if resubmitting:
+            self._write_batch(accepted, resubmit=False)
+
+    def _import_summary(self, response: requests.Response) -> Optional[ImportSummary]:
+        if self.import_jobs is not None and response.ok:
+            # the response only names the job, its summary follows once it completes
+            return self.import_jobs.wait(parse_job_id(response))
+        if response.ok or response.status_code == HTTPStatus.CONFLICT:
+            return ImportSummary.from_response(response)
+        return None
+
+    def _record_import(
+        self, summary: ImportSummary, ignored: Optional[int] = None
+    ) -> None:
+        with self._import_count_lock:
+            if ignored is not None:
+                # only the rejected values of a batch that is being re-submitted count
+                self.import_count["ignored"] += ignored
+                return
+            for key, count in summary.import_count.items():
+                self.import_count[key] += count  # type: ignore[literal-required]
+
+    def _observe_batch(
+        self,
+        dataValues: DataValueBatch,
+        start: float,
+        response: Optional[requests.Response],
+        failed: bool,
+        split_from: Optional[int] = None,
+    ) -> None:
+        body = response.request.body if response is not None else None
+        latency = time.monotonic() - start
+        payload_bytes = payload_size(body)
+        self.metrics.record_batch(
+            values=len(dataValues),
+            payload_bytes=payload_bytes,
+            latency=latency,
+            failed=failed,
+        )
+        if self.batch_sizer is not None:
+            self.batch_sizer.record(
+                values=len(dataValues),
+                latency=latency,
+                payload_bytes=payload_bytes,
+                failed=failed,
+                split_from=split_from,
+            )
+
+    def _wait_for_pending(self, max_pending: int) -> None:
+        # block until at most max_pending batches are in flight,
+        # re-raising the error of any batch that failed
+        while len(self._pending) > max_pending:
+            done, not_done = wait(self._pending, return_when=FIRST_COMPLETED)
+            self._pending = not_done
+            for future in done:
+                future.result()
+
+    def submit(self, batch: Optional[DataValueBatch] = None) -> None:
+        """
+        Hands a batch, by default the client's own buffer, to a worker and
+        returns without waiting for the import, blocking only while
+        max_concurrent_requests batches are already in flight.
+
+        With a spool the batch is written to it first and only its segment
+        is queued, blocking only while spool_max_batches are waiting. With
+        group_data_values the batch is queued as its group_batch batches.
+        """
+        if batch is None:
+            if len(self.write_buffer) == 0:
+                return
+            # hand the filled buffer over and start a fresh one
+            batch, self.write_buffer = self.write_buffer, DataValueBatch(
+                self.batch_size, coalesce=self.coalesce_duplicates
+            )
+        self.coalesced_count += batch.coalesced
+        if len(batch) == 0:
+            return
+        if self.group_data_values:
+            # CSV has no header to share, its rows are only sorted
+            batches, stats = group_batch(
+                batch, self.min_group_size if self.payload_format == "json" else None
+            )
+            for key, count in stats.items():
+                self.grouping[key] += count  # type: ignore[literal-required]
+            # the adaptive batch size goes by the batch the groups came from
+            for group in batches:
+                self._submit(group, split_from=len(batch))
+            return
+        self._submit(batch)
+
+    def _submit(self, batch: DataValueBatch, split_from: Optional[int] = None) -> None:
+        self.submitted_batches += 1
+        if self.spool is not None:
+            segment = self.spool.write(batch)
+            self._wait_for_pending(self.spool_max_batches - 1)
+            self._pending.add(
+                self._executor.submit(
+                    self._write_segment, self.spool, segment, split_from
+                )
+            )
+            self.metrics.record_queue_depth(len(self._pending))
+            return
+        # an overloaded server gets a single request at a time
+        concurrency = self.circuit_breaker.concurrency(self.max_concurrent_requests)
+        self._wait_for_pending(concurrency - 1)
+        future = self._executor.submit(self._write_batch, batch, True, split_from)
+        future.add_done_callback(
+            functools.partial(self._acknowledge, self.submitted_batches)
+        )
+        self._pending.add(future)
+        self.metrics.record_queue_depth(len(self._pending))
+
+    def _acknowledge(self, sequence: int, future: Future[None]) -> None:
+        # a failed batch holds back every later one until the sync fails
+        if future.cancelled() or future.exception() is not None:
+            return
+        with self._acknowledged_lock:
+            self._acknowledged_out_of_order.add(sequence)
+            while self._acknowledged + 1 in self._acknowledged_out_of_order:
+                self._acknowledged += 1
+                self._acknowledged_out_of_order.remove(self._acknowledged)
+
+    def durable_batches(self) -> int:
+        """
+        How many of the batches submitted so far, counting from the first,
+        are durable: spooled, or acknowledged by DHIS2 along with every
+        batch before them. Does not wait, but raises the error of any batch
+        that already failed.
+        """
+        self._raise_for_failed_batches()
+        if self.spool is not None:
+            return self.submitted_batches
+        with self._acknowledged_lock:
+            return self._acknowledged
+
+    def _raise_for_failed_batches(self) -> None:
+        done = {future for future in self._pending if future.done()}
+        self._pending -= done
+        for future in done:
+            future.result()
+
+    def _write_segment(
+        self, spool: Spool, segment: str, split_from: Optional[int] = None
+    ) -> None:
+        # read back from disk so waiting batches do not hold memory
+        batch = spool.read(segment)
+        try:
+            self._write_batch(batch, split_from=split_from)
+        except RequestException as e:
+            # transient failures keep the segment for the next sync
+            if not is_permanent_failure(e):
+                raise
+            # its state was already emitted, and kept in the spool it would
+            # fail every later sync, so its values become dead letters
+            airbyteLogger.error(
+                f"DHIS2 rejected a spooled batch of {len(batch)} values,"
+                f" moving them to the dead letters: {e}"
+            )
+            self.dead_letters.put(
+                (to_data_value(row), f"Batch rejected: {e}") for row in batch.rows()
+            )
+        spool.release(segment)
+
+    def resume_spool(self) -> int:
+        """
+        Queues the batches a previous sync spooled but did not import,
+        returning their number. Must be called before anything is submitted.
+        """
+        if self.spool is None:
+            return 0
+        segments = self.spool.segments()
+        for segment in segments:
+            self._wait_for_pending(self.spool_max_batches - 1)
+            self._pending.add(
+                self._executor.submit(self._write_segment, self.spool, segment)
+            )
+        return len(segments)
+
+    def checkpoint(self) -> None:
+        """
+        Makes every value queued so far durable. Without a spool that means
+        flushing, with a spool it is enough that the batches are spooled, so
+        only the errors of batches that already failed are raised.
+        """
+        if self.spool is None:
+            self.flush()
+            return
+        self.submit()
+        self._raise_for_failed_batches()
+
+    def flush(self) -> None:
+        """
+        Writes the buffered values and waits until every batch submitted so
+        far has been acknowledged by DHIS2.
+        """
+        self.submit()
+        self._wait_for_pending(0)
@@ -0,0 +1,160 @@
+from http import HTTPStatus
+from typing import Any, Iterable, Mapping, Optional, Union
+from urllib.parse import urljoin
+
+import requests
+
+from .authenticator import Dhis2Authenticator
+from .constants import (
+    API_PATH,
+    CONNECT_TIMEOUT,
+    MAX_RETRIES,
+    POOL_SIZE,
+    READ_TIMEOUT,
+    RETRY_BUDGET,
+    TOKEN_REFRESH_PATH,
+)
+from .retry import CircuitBreaker, RetryPolicy
+from .session import ConnectionStats, Dhis2Session
+from .throttle import RateLimiter
+
+# the options of a connector config a Dhis2Connection takes
+CONNECTION_OPTIONS = (
+    "base_url",
+    "client_id",
+    "client_secret",
+    "refresh_token",
+    "api_version",
+    "pool_size",
+    "connect_timeout",
+    "read_timeout",
+    "max_retries",
+    "retry_budget",
+)
+
+
+class Dhis2Connection:
+    """
+    Authenticated requests to the DHIS2 API over a pooled session, all that
+    commands other than write need. Dhis2Client builds the write path on it.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        client_id: str,
+        client_secret: str,
+        refresh_token: str,
+        api_version: str,
+        pool_size: int = POOL_SIZE,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        max_retries: int = MAX_RETRIES,
+        retry_budget: int = RETRY_BUDGET,
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
+        self.base_url = base_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_token = refresh_token
+        self.api_version = api_version
+        self.session = Dhis2Session(
+            pool_size=pool_size,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            rate_limiter=rate_limiter,
+        )
+        self.circuit_breaker = CircuitBreaker()
+        # shared by data and token requests so the budget covers the whole sync
+        self.retry_policy = RetryPolicy(
+            max_retries=max_retries,
+            retry_budget=retry_budget,
+            circuit_breaker=self.circuit_breaker,
+        )
+        # lives as long as the client so the access token is reused across requests
+        self._authenticator = Dhis2Authenticator(
+            token_refresh_endpoint=self._token_refresh_endpoint,
+            client_id=self.client_id,
+            client_secret=self.client_secret,
+            refresh_token=self.refresh_token,
+            session=self.session,
+            retry_policy=self.retry_policy,
+        )
+
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any]) -> "Dhis2Connection":
+        # the other options of the config only matter to writes
+        return cls(**{key: config[key] for key in CONNECTION_OPTIONS if key in config})
+
+    def _join_url_fragments(self, endpoint: str) -> str:
+        # constitute complete url by join url fragments
+        # while stripping possibly misplaced forward slashes
+        return urljoin(
+            self.base_url,
+            "/".join(
+                part.strip("/") for part in (API_PATH, self.api_version, endpoint)
+            ),
+        )
+
+    @property
+    def _token_refresh_endpoint(self) -> str:
+        # does not use the API_PATH prefix
+        return urljoin(self.base_url, TOKEN_REFRESH_PATH)
+
+    def _get_auth_headers(self) -> Mapping[str, Any]:
+        return self._authenticator.get_auth_header()
+
+    def request(
+        self,
+        http_method: str,
+        endpoint: str,
+        params: Optional[dict[str, Any]] = None,
+        json: Optional[dict[str, Any]] = None,
+        data: Optional[Union[bytes, Iterable[bytes]]] = None,
+        headers: Optional[Mapping[str, str]] = None,
+        retry: bool = False,
+        idempotent: bool = True,
+    ) -> requests.Response:
+        url = self._join_url_fragments(endpoint)
+        kwargs = {"params": params, "json": json, "data": data, "headers": headers}
+        if retry:
+            return self.retry_policy.call(
+                lambda: self._request(http_method, url, **kwargs),
+                f"{http_method} {endpoint}",
+                idempotent=idempotent,
+            )
+        return self._request(http_method, url, **kwargs)
+
+    def _request(self, http_method: str, url: str, **kwargs: Any) -> requests.Response:
+        access_token = self._authenticator.get_access_token()
+        response = self._send(http_method, url, access_token, **kwargs)
+        if response.status_code == HTTPStatus.UNAUTHORIZED:
+            # the token may have been revoked before its expiry, retry once
+            self._authenticator.invalidate_access_token(access_token)
+            access_token = self._authenticator.get_access_token()
+            response = self._send(http_method, url, access_token, **kwargs)
+        return response
+
+    def _send(
+        self,
+        http_method: str,
+        url: str,
+        access_token: str,
+        headers: Optional[Mapping[str, str]] = None,
+        **kwargs: Any,
+    ) -> requests.Response:
+        request_headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            **(headers or {}),
+            "Authorization": f"Bearer {access_token}",
+        }
+        return self.session.request(
+            method=http_method, url=url, headers=request_headers, **kwargs
+        )
+
+    def connection_stats(self) -> ConnectionStats:
+        return self.session.connection_stats()
+
+    def close(self) -> None:
+        self.session.close()
@@ -5,3 +5,84 @@ TOKEN_REFRESH_PATH: Final = "/uaa/oauth/token"
 DATA_ELEMENTS_PATH: Final = "/dataElements"
 DATA_VALUE_SETS_PATH: Final = "/dataValueSets"
 PAGE_SIZE: Final = 1000
+# seconds before expiry at which a cached access token is no longer used
+TOKEN_EXPIRY_MARGIN: Final = 60
+# seconds before expiry at which the access token is refreshed in the background
+TOKEN_REFRESH_WINDOW: Final = 300
+# maximum number of pooled keep-alive connections to the DHIS2 host
+POOL_SIZE: Final = 10
+# seconds to wait for a connection to be established
+CONNECT_TIMEOUT: Final = 10
+# seconds to wait for DHIS2 to respond, imports of large batches can be slow
+READ_TIMEOUT: Final = 300
+# number of dataValueSets batches that may be importing at the same time
+MAX_CONCURRENT_REQUESTS: Final = 1
+# transient statuses worth retrying, the request is assumed to be idempotent
+RETRYABLE_STATUS_CODES: Final = frozenset({429, 502, 503, 504})
+# client errors about the credentials or the connection rather than the
+# batch sent, which may well succeed later
+NON_BATCH_CLIENT_ERRORS: Final = frozenset({401, 403, 408})
+# retries of a single request
+MAX_RETRIES: Final = 5
+# retries of all requests in a sync combined
+RETRY_BUDGET: Final = 100
+# seconds, the backoff delay doubles per attempt up to BACKOFF_CAP
+BACKOFF_BASE: Final = 1
+BACKOFF_CAP: Final = 60
+# consecutive failures after which concurrency drops to a single request
+CIRCUIT_BREAKER_THRESHOLD: Final = 3
+# minimum seconds the circuit breaker stays open
+CIRCUIT_BREAKER_COOLDOWN: Final = 30
+# json schema key holding per-stream options in the configured catalog
+STREAM_OPTIONS_KEY: Final = "dhis2"
+# bounds of the adaptive batch size, in values per dataValueSets request
+MIN_BATCH_SIZE: Final = 100
+MAX_BATCH_SIZE: Final = 10000
+# upper bound of a serialized dataValueSets payload, in bytes
+MAX_BATCH_BYTES: Final = 10 * 1024 * 1024
+# seconds a batch import should take, adaptive batches grow or shrink towards it
+TARGET_BATCH_LATENCY: Final = 10
+# number of data values encoded at a time when serializing a batch
+SERIALIZE_CHUNK_SIZE: Final = 1000
+DATA_SETS_PATH: Final = "/dataSets"
+ORGANISATION_UNITS_PATH: Final = "/organisationUnits"
+# page size of metadata requests, data sets carry their org unit assignments
+METADATA_PAGE_SIZE: Final = 500
+# seconds a locally cached metadata index is used before it is refreshed
+METADATA_CACHE_TTL: Final = 24 * 60 * 60
+# KiB of SQLite page cache the change store may hold in memory
+CHANGE_STORE_CACHE_SIZE: Final = 16 * 1024
+# seconds a change store waits for another shard's write to the same file
+CHANGE_STORE_BUSY_TIMEOUT: Final = 60
+# progress and summaries of asynchronous import jobs
+SYSTEM_TASKS_PATH: Final = "/system/tasks"
+TASK_SUMMARIES_PATH: Final = "/system/taskSummaries"
+IMPORT_JOB_TYPE: Final = "DATAVALUE_IMPORT"
+# seconds between import job status checks, doubling up to IMPORT_POLL_CAP
+IMPORT_POLL_INTERVAL: Final = 1
+IMPORT_POLL_CAP: Final = 30
+# seconds an asynchronous import may take before the batch fails
+IMPORT_JOB_TIMEOUT: Final = 60 * 60
+# file suffix of the batches in the write-ahead spool
+SPOOL_SEGMENT_SUFFIX: Final = ".segment"
+# directory under spool_path each shard spools to, followed by its number
+SHARD_SPOOL_PREFIX: Final = "shard-"
+# spooled batches that may wait for import before reading input blocks
+SPOOL_MAX_BATCHES: Final = 100
+# bytes of stdin read at a time when decoding input messages
+READ_CHUNK_SIZE: Final = 1024 * 1024
+# records sent to a shard process at a time
+SHARD_CHUNK_SIZE: Final = 1000
+# chunks that may be queued for a shard before reading input blocks
+SHARD_QUEUE_SIZE: Final = 16
+# an adaptive concurrency governor backs off once a batch takes this many
+# times longer per value than the fastest recent batch
+GOVERNOR_LATENCY_FACTOR: Final = 2
+# seconds between metrics reports during a sync
+METRICS_INTERVAL: Final = 60
+# upper bounds of the batch latency histogram buckets, in seconds
+LATENCY_BUCKETS: Final = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# smallest (period, orgUnit) group sent as a data value set of its own
+MIN_GROUP_SIZE: Final = 50
+# dates converted to periods remembered per mapped field
+PERIOD_CACHE_SIZE: Final = 4096
@@ -0,0 +1,29 @@
+import json
+import threading
+from typing import Any, Iterable, Mapping, Optional, Tuple
+
+
+class DeadLetterQueue:
+    """
+    Collects data values DHIS2 will not import. Each one is counted and, when
+    a `path` is configured, appended to it as a JSON line with the reason.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def put(self, entries: Iterable[Tuple[Mapping[str, Any], str]]) -> None:
+        # entries are (data value, reason) pairs
+        entries = list(entries)
+        with self._lock:
+            self.count += len(entries)
+            if self.path is not None and entries:
+                with open(self.path, "a") as f:
+                    for data_value, reason in entries:
+                        # one write per line, shard processes may append concurrently
+                        f.write(
+                            json.dumps({"dataValue": data_value, "reason": reason})
+                            + "\n"
+                        )
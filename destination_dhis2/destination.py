@@ -3,26 +3,45 @@
 #
 
 
+import io
 import logging
-from typing import Any, Iterable, Mapping
+from typing import Any, Iterable, Mapping, Optional
 
 from airbyte_cdk.destinations import Destination
 from airbyte_cdk.models import (  # type: ignore # see this https://github.com/airbytehq/airbyte/pull/22963
     AirbyteConnectionStatus,
     AirbyteMessage,
+    AirbyteStateType,
     ConfiguredAirbyteCatalog,
     Status,
     Type,
 )
 from requests.exceptions import RequestException
 
+from .checkpoint import CheckpointPolicy, state_key
 from .client import Dhis2Client
+from .connection import Dhis2Connection
 from .constants import DATA_ELEMENTS_PATH
+from .messages import decode_messages
+from .sharding import (
+    ShardedWriter,
+    WriteStats,
+    collect_write_stats,
+    resume_other_spools,
+)
+from .stream_writer import StreamWriter
+from .telemetry import log_metrics, write_prometheus
 
 airbyteLogger = logging.getLogger("airbyte")
 
 
 class DestinationDhis2(Destination):
+    def _parse_input_stream(
+        self, input_stream: io.TextIOWrapper
+    ) -> Iterable[AirbyteMessage]:
+        # decodes the raw bytes, records skip the pydantic validation
+        return decode_messages(input_stream.buffer)
+
     def write(
         self,
         config: Mapping[str, Any],
@@ -53,47 +72,86 @@ class DestinationDhis2(Destination):
             Iterable of AirbyteStateMessages wrapped in AirbyteMessage structs
         """
 
-        client = Dhis2Client(**config)
+        client_config, shards, policy = self._client_config(config)
+        # the spools this sync's writers do not resume go in before any input
+        resume_other_spools(client_config, shards)
+        if shards > 1:
+            yield from self._write_sharded(
+                client_config, configured_catalog, input_messages, shards, policy
+            )
+            return
+
+        client = Dhis2Client(**client_config)
+        writers: dict[str, StreamWriter] = {}
 
-        stream_names = {s.stream.name for s in configured_catalog.streams}
+        try:
+            metadata = client.load_metadata()
+            if metadata is not None:
+                airbyteLogger.info(
+                    f"Validating records against {len(metadata.data_elements)} data elements"
+                    f" and {len(metadata.org_units)} organisation units"
+                )
 
-        for stream_name in stream_names:
-            airbyteLogger.info(
-                f"Starting write to DHIS2 with the '{stream_name}' stream"
-            )
+            # one writer per configured stream, each with its own buffer
+            writers = {
+                s.stream.name: StreamWriter.from_configured_stream(s, client)
+                for s in configured_catalog.streams
+            }
 
+            for stream_name, writer in writers.items():
+                airbyteLogger.info(
+                    f"Starting write to DHIS2 with the '{stream_name}' stream"
+                    f" in batches of {writer.batch_size}"
+                )
+
+            resumed = client.resume_spool()
+            if resumed > 0:
+                # the values of an interrupted sync go in before newer ones
+                airbyteLogger.info(f"Resuming {resumed} spooled batches")
+                client.flush()
+
+            # input_messages can only be consumed once, so every stream is
+            # dispatched from this single pass
             for message in input_messages:
                 if message.type == Type.RECORD:
-                    data = message.record.data
-                    record_stream_name = message.record.stream
+                    record_writer = writers.get(message.record.stream)
 
-                    if record_stream_name not in stream_names:
+                    if record_writer is None:
                         airbyteLogger.warning(
-                            f"Stream {record_stream_name} was not present in configured streams, skipping"
+                            f"Stream {message.record.stream} was not present in configured streams, skipping"
                         )
                         continue
 
-                    # add to buffer
-                    client.queue_write_operation(dataValue=data)
-
-                    if client.buffer_is_full():
-                        try:
-                            client.flush()
-                        except RequestException as e:
-                            airbyteLogger.error(
-                                f"Exception flushing AirbyteRecordMessage: {e}"
-                            )
-                            raise e
+                    try:
+                        # submits the stream's batch once full and keeps reading
+                        # while it is imported
+                        record_writer.write(message.record.data)
+                        client.metrics.records += 1
+                        policy.records += 1
+                        # held states can go once a batch filled up, and must
+                        # once they lingered long enough
+                        if len(policy) > 0 and (
+                            len(record_writer.buffer) == 0 or policy.due()
+                        ):
+                            yield from self._release_states(client, policy)
+                    except RequestException as e:
+                        airbyteLogger.error(
+                            f"Exception flushing AirbyteRecordMessage: {e}"
+                        )
+                        raise e
+                    # throughput so far, once every metrics_interval
+                    client.report_metrics()
 
                 elif message.type == Type.STATE:
-                    # Emitting a state message indicates that all records which came before it
-                    # have been written to the destination.
-                    # So we flush the queue to ensure writes happen
-                    # then output the state message to indicate it's safe to checkpoint state.
+                    # held until every record before it is durable, replacing
+                    # any older state it covers
                     try:
-                        airbyteLogger.info(f"flushing buffer for state: {message}")
-                        client.flush()
-                        yield message
+                        policy.hold(
+                            message,
+                            self._writers_for_state(writers, message),
+                            client.submitted_batches,
+                        )
+                        yield from self._release_states(client, policy)
                     except RequestException as e:
                         airbyteLogger.error(
                             f"Exception flushing AirbyteStateMessage: {e}"
@@ -115,18 +173,179 @@ class DestinationDhis2(Destination):
 
             # Make sure to flush any records still in the queue
             try:
+                for writer in writers.values():
+                    writer.submit()
                 client.flush()
+                yield from policy.release()
             except RequestException as e:
                 airbyteLogger.error(f"Exception flushing AirbyteRecordMessage's: {e}")
                 raise e
+            self._log_coalesced_states(policy)
+        finally:
+            self._log_write_stats(
+                collect_write_stats(client, writers), client.metrics_path
+            )
+            client.close()
+
+    def _write_sharded(
+        self,
+        config: Mapping[str, Any],
+        configured_catalog: ConfiguredAirbyteCatalog,
+        input_messages: Iterable[AirbyteMessage],
+        shards: int,
+        policy: CheckpointPolicy,
+    ) -> Iterable[AirbyteMessage]:
+        # same protocol as write, with the records spread over shard processes
+        airbyteLogger.info(f"Starting write to DHIS2 with {shards} shard processes")
+        writer = ShardedWriter(config, configured_catalog, shards)
+        try:
+            for message in input_messages:
+                if message.type == Type.RECORD:
+                    if message.record.stream not in writer.org_units:
+                        airbyteLogger.warning(
+                            f"Stream {message.record.stream} was not present in configured streams, skipping"
+                        )
+                        continue
+                    writer.write(message.record.stream, message.record.data)
+                    policy.records += 1
+                    if len(policy) > 0 and policy.due():
+                        yield from self._barrier(writer, policy)
+
+                elif message.type == Type.STATE:
+                    # the shards' batches are out of sight, so held states are
+                    # only released by a barrier once they are due
+                    policy.hold(message, [], 0)
+                    if policy.due():
+                        yield from self._barrier(writer, policy)
+
+                elif message.type == Type.LOG:
+                    airbyteLogger.log(
+                        logging.getLevelName(message.log.level.value),
+                        message.log.message,
+                    )
+
+                else:
+                    airbyteLogger.info(
+                        f"Message type {message.type} not supported, skipping"
+                    )
+
+            stats = writer.close()
+            yield from policy.release()
+            self._log_coalesced_states(policy)
+            self._log_write_stats(stats, config.get("metrics_path"))
+        finally:
+            writer.terminate()
+
+    @staticmethod
+    def _client_config(
+        config: Mapping[str, Any],
+    ) -> tuple[dict[str, Any], int, CheckpointPolicy]:
+        # the shards and the checkpoint policy are the only options not meant
+        # for the client
+        client_config = dict(config)
+        shards = client_config.pop("shards", 1)
+        policy = CheckpointPolicy(
+            linger=client_config.pop("state_linger", 0),
+            max_records=client_config.pop("state_max_records", None),
+        )
+        return client_config, shards, policy
+
+    @staticmethod
+    def _release_states(
+        client: Dhis2Client, policy: CheckpointPolicy
+    ) -> list[AirbyteMessage]:
+        if policy.due():
+            # Emitting a state message indicates that all records which came before it
+            # have been written to the destination.
+            # So we flush the held states' writers and wait for every in-flight batch,
+            # or only until it is spooled to disk,
+            # then output the state messages to indicate it's safe to checkpoint state.
+            for writer in policy.writers():
+                writer.submit()
+            client.checkpoint()
+            return policy.release()
+        # without waiting, the states whose batches were already acknowledged
+        return policy.ready(client.submitted_batches, client.durable_batches())
+
+    @staticmethod
+    def _barrier(
+        writer: ShardedWriter, policy: CheckpointPolicy
+    ) -> list[AirbyteMessage]:
+        # released once every shard has checkpointed their records
+        messages = policy.release()
+        keys = {state_key(message) for message in messages}
+        key = keys.pop() if len(keys) == 1 else None
+        writer.barrier(key[0] if key is not None else None)
+        return messages
+
+    @staticmethod
+    def _log_coalesced_states(policy: CheckpointPolicy) -> None:
+        if policy.coalesced > 0:
+            airbyteLogger.info(
+                f"Skipped {policy.coalesced} state messages"
+                " replaced by a later one before their records were durable"
+            )
+
+    @staticmethod
+    def _log_write_stats(stats: WriteStats, metrics_path: Optional[str] = None) -> None:
+        for stream_name, count in stats["invalid"].items():
+            if count > 0:
+                airbyteLogger.warning(
+                    f"Skipped {count} invalid records from the '{stream_name}' stream"
+                )
+        for stream_name, count in stats["unchanged"].items():
+            if count > 0:
+                airbyteLogger.info(
+                    f"Skipped {count} values unchanged since"
+                    f" their last import from the '{stream_name}' stream"
+                )
+        import_count = stats["import_count"]
+        airbyteLogger.info(
+            f"DHIS2 imported {import_count['imported']},"
+            f" updated {import_count['updated']},"
+            f" ignored {import_count['ignored']}"
+            f" and deleted {import_count['deleted']} values,"
+            f" {stats['rejected']} values were rejected and"
+            f" {stats['coalesced']} duplicates replaced by a later value"
+        )
+        grouping = stats["grouping"]
+        if grouping["sets"] > 0:
+            airbyteLogger.info(
+                f"Sent {grouping['values']} values in {grouping['sets']} data value sets"
+                " with a shared period and orgUnit header,"
+                f" about {grouping['bytes_saved'] // 1024} KiB less payload"
+                f" for {grouping['extra_requests']} more requests"
+            )
+        connections = stats["connections"]
+        airbyteLogger.info(
+            f"Sent {connections['requests']} requests over"
+            f" {connections['connections']} connections"
+            f" ({connections['reused']} reused)"
+        )
+        log_metrics(stats["metrics"], final=True)
+        if metrics_path is not None:
+            write_prometheus(stats["metrics"], metrics_path)
+
+    @staticmethod
+    def _writers_for_state(
+        writers: Mapping[str, StreamWriter], message: AirbyteMessage
+    ) -> Iterable[StreamWriter]:
+        # a per-stream state only covers the records of its own stream,
+        # any other state covers every stream
+        state = message.state
+        if state is not None and state.type == AirbyteStateType.STREAM:
+            writer = writers.get(state.stream.stream_descriptor.name)
+            return [writer] if writer is not None else []
+        return writers.values()
 
     def check(
         self, logger: logging.Logger, config: Mapping[str, Any]
     ) -> AirbyteConnectionStatus:
+        # only what a single authenticated request needs, none of the write path,
+        # and an unreachable server fails the check at once instead of being retried
+        connection = Dhis2Connection.from_config(dict(config, max_retries=0))
         try:
-            client = Dhis2Client(**config)
-
-            response = client.request(
+            response = connection.request(
                 http_method="GET",
                 endpoint=DATA_ELEMENTS_PATH,
                 # return smallest possible subset
@@ -151,3 +370,5 @@ class DestinationDhis2(Destination):
                 status=Status.FAILED,
                 message=f"Exception in check command: {repr(req_err)}",
             )
+        finally:
+            connection.close()
@@ -0,0 +1,84 @@
+from itertools import groupby
+from operator import itemgetter
+from typing import Optional, TypedDict
+
+from .batch import DataValueBatch, DataValueRow
+from .constants import MIN_GROUP_SIZE
+
+# bytes of `,"period":"","orgUnit":""` a flat payload repeats on every value
+HOISTED_FIELDS_SIZE = len(',"period":"","orgUnit":""')
+
+_sort_key = itemgetter(2, 3, 0)  # period, orgUnit, dataElement
+_group_key = itemgetter(2, 3)  # period, orgUnit
+
+
+class GroupingStats(TypedDict):
+    # data value sets sent with a shared period and orgUnit header
+    sets: int
+    values: int
+    # estimated payload bytes the shared headers saved
+    bytes_saved: int
+    # requests sent on top of the one per batch, as each set is a request
+    extra_requests: int
+
+
+def empty_grouping_stats() -> GroupingStats:
+    return {"sets": 0, "values": 0, "bytes_saved": 0, "extra_requests": 0}
+
+
+def group_batch(
+    batch: DataValueBatch, min_group_size: Optional[int] = MIN_GROUP_SIZE
+) -> tuple[list[DataValueBatch], GroupingStats]:
+    """
+    Sorts a batch by period, orgUnit and dataElement, so DHIS2 imports the
+    values of an organisation unit together, and splits every (period,
+    orgUnit) group of at least `min_group_size` values off into a batch of
+    its own, to be sent as a data value set with both in its header.
+
+    The smaller groups stay together, still sorted, in a last batch, so no
+    batch is larger than the one given. Without `min_group_size` the batch
+    is only sorted.
+
+    A JSON data value set has a single header, so every batch split off is
+    a request of its own, which the stats count as extra requests.
+    """
+    stats = empty_grouping_stats()
+    rows = sorted(batch.rows(), key=_sort_key)
+    if min_group_size is None:
+        return [_to_batch(rows)], stats
+
+    batches: list[DataValueBatch] = []
+    rest: list[DataValueRow] = []
+    rest_groups = 0
+    for (period, org_unit), group in groupby(rows, key=_group_key):
+        values = list(group)
+        if len(values) < min_group_size:
+            rest.extend(values)
+            rest_groups += 1
+            continue
+        batches.append(_to_batch(values))
+        _count_set(stats, period, org_unit, len(values))
+    if rest:
+        batches.append(_to_batch(rest))
+        if rest_groups == 1:
+            # a single small group still gets a header of its own
+            period, org_unit = _group_key(rest[0])
+            _count_set(stats, period, org_unit, len(rest))
+    stats["extra_requests"] = len(batches) - 1
+    return batches, stats
+
+
+def _count_set(stats: GroupingStats, period: str, org_unit: str, size: int) -> None:
+    stats["sets"] += 1
+    stats["values"] += size
+    # the fields are left out of every value, but once in the header
+    stats["bytes_saved"] += (size - 1) * (
+        HOISTED_FIELDS_SIZE + len(period) + len(org_unit)
+    )
+
+
+def _to_batch(rows: list[DataValueRow]) -> DataValueBatch:
+    batch = DataValueBatch(max(len(rows), 1))
+    for row in rows:
+        batch.append(*row)
+    return batch
@@ -0,0 +1,114 @@
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Mapping, Optional
+
+import requests
+from requests.exceptions import RequestException
+
+from .constants import (
+    IMPORT_JOB_TIMEOUT,
+    IMPORT_JOB_TYPE,
+    IMPORT_POLL_CAP,
+    IMPORT_POLL_INTERVAL,
+    SYSTEM_TASKS_PATH,
+    TASK_SUMMARIES_PATH,
+)
+from .import_summary import ImportSummary
+
+if TYPE_CHECKING:
+    from .client import Dhis2Client
+
+
+def parse_job_id(response: requests.Response) -> str:
+    # newer versions wrap the job configuration in a web message
+    body: Mapping[str, Any] = response.json()
+    job = body.get("response", body)
+    try:
+        return job["id"]
+    except (KeyError, TypeError):
+        raise RequestException(
+            f"DHIS2 did not return an import job: {body}", response=response
+        ) from None
+
+
+class ImportJobPoller:
+    """
+    https://docs.dhis2.org/en/develop/using-the-api/dhis-core-version-master/data.html#webapi_data_values_async_import
+
+    Waits for asynchronous dataValueSets imports to complete. A single
+    `GET /system/tasks/DATAVALUE_IMPORT` reports the progress of every job,
+    so a status request made by one waiting worker answers every other
+    waiter too, instead of each polling its own job. Waiters back off from
+    `interval` up to `cap` seconds between checks.
+    """
+
+    def __init__(
+        self,
+        client: "Dhis2Client",
+        interval: float = IMPORT_POLL_INTERVAL,
+        cap: float = IMPORT_POLL_CAP,
+        timeout: float = IMPORT_JOB_TIMEOUT,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.client = client
+        self.interval = interval
+        self.cap = cap
+        self.timeout = timeout
+        self.sleep = sleep
+        self._waiting: set[str] = set()
+        self._completed: set[str] = set()
+        # number of status requests so far, tells waiters whether the
+        # status changed while they slept
+        self._polls = 0
+        self._lock = threading.Lock()
+
+    def wait(self, job_id: str) -> Optional[ImportSummary]:
+        deadline = time.monotonic() + self.timeout
+        delay = self.interval
+        with self._lock:
+            self._waiting.add(job_id)
+            seen = self._polls
+        try:
+            while True:
+                self.sleep(delay)
+                with self._lock:
+                    # the status may have been refreshed by another waiter
+                    # while this one slept, otherwise it is refreshed for all
+                    if self._polls == seen:
+                        self._poll()
+                    seen = self._polls
+                    if job_id in self._completed:
+                        break
+                if time.monotonic() >= deadline:
+                    raise RequestException(
+                        f"Import job {job_id} did not complete"
+                        f" within {self.timeout} seconds"
+                    )
+                delay = min(delay * 2, self.cap)
+        finally:
+            with self._lock:
+                self._waiting.discard(job_id)
+                self._completed.discard(job_id)
+
+        response = self.client.request(
+            http_method="GET",
+            endpoint=f"{TASK_SUMMARIES_PATH}/{IMPORT_JOB_TYPE}/{job_id}",
+            retry=True,
+        )
+        response.raise_for_status()
+        return ImportSummary.from_response(response)
+
+    def _poll(self) -> None:
+        response = self.client.request(
+            http_method="GET",
+            endpoint=f"{SYSTEM_TASKS_PATH}/{IMPORT_JOB_TYPE}",
+            retry=True,
+        )
+        response.raise_for_status()
+        self._polls += 1
+        # job id -> notifications, the completed flag is set on the last one
+        for job_id, notifications in response.json().items():
+            if job_id in self._waiting and any(
+                notification.get("completed") for notification in notifications
+            ):
+                self._completed.add(job_id)
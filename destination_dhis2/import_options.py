@@ -0,0 +1,79 @@
+import re
+from typing import Literal, Optional, TypedDict
+
+ImportStrategy = Literal["CREATE", "UPDATE", "CREATE_AND_UPDATE"]
+
+IMPORT_STRATEGIES: frozenset[str] = frozenset({"CREATE", "UPDATE", "CREATE_AND_UPDATE"})
+
+# UID, CODE, NAME or ATTRIBUTE:<attribute uid>
+ID_SCHEME_PATTERN = re.compile(r"^(UID|CODE|NAME|ATTRIBUTE:[A-Za-z][A-Za-z0-9]{10})$")
+
+
+class ImportParams(TypedDict, total=False):
+    """
+    https://docs.dhis2.org/en/develop/using-the-api/dhis-core-version-master/data.html#webapi_data_values_import_parameters
+    """
+
+    importStrategy: str
+    skipExistingCheck: str
+    skipAudit: str
+    dryRun: str
+    idScheme: str
+    dataElementIdScheme: str
+    orgUnitIdScheme: str
+    preheatCache: str
+
+
+def import_params(
+    import_strategy: ImportStrategy = "CREATE_AND_UPDATE",
+    skip_existing_check: bool = False,
+    skip_audit: bool = False,
+    dry_run: bool = False,
+    id_scheme: Optional[str] = None,
+    data_element_id_scheme: Optional[str] = None,
+    org_unit_id_scheme: Optional[str] = None,
+    preheat_cache: bool = False,
+    coalesce_duplicates: bool = True,
+) -> ImportParams:
+    """
+    Query parameters of a dataValueSets import, only the options that differ
+    from DHIS2's defaults are sent. Raises ValueError for unknown values and
+    for combinations that could store a data value twice.
+    """
+
+    if import_strategy not in IMPORT_STRATEGIES:
+        raise ValueError(f"Unsupported import strategy: {import_strategy}")
+    for scheme in (id_scheme, data_element_id_scheme, org_unit_id_scheme):
+        if scheme is not None and not ID_SCHEME_PATTERN.match(scheme):
+            raise ValueError(f"Unsupported id scheme: {scheme}")
+    if skip_existing_check:
+        # without the check DHIS2 inserts every value as a new row
+        if import_strategy != "CREATE":
+            raise ValueError(
+                "skip_existing_check requires the CREATE import strategy,"
+                " existing values would otherwise be stored twice"
+            )
+        if not coalesce_duplicates:
+            raise ValueError(
+                "skip_existing_check requires coalesce_duplicates,"
+                " repeated values in a batch would otherwise be stored twice"
+            )
+
+    params: ImportParams = {}
+    if import_strategy != "CREATE_AND_UPDATE":
+        params["importStrategy"] = import_strategy
+    if skip_existing_check:
+        params["skipExistingCheck"] = "true"
+    if skip_audit:
+        params["skipAudit"] = "true"
+    if dry_run:
+        params["dryRun"] = "true"
+    if id_scheme is not None:
+        params["idScheme"] = id_scheme
+    if data_element_id_scheme is not None:
+        params["dataElementIdScheme"] = data_element_id_scheme
+    if org_unit_id_scheme is not None:
+        params["orgUnitIdScheme"] = org_unit_id_scheme
+    if preheat_cache:
+        params["preheatCache"] = "true"
+    return params
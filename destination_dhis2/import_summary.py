@@ -0,0 +1,92 @@
+from typing import Any, Mapping, Optional, TypedDict, cast
+
+import requests
+
+from .batch import DataValueBatch, DataValueRow
+
+
+class ImportCount(TypedDict):
+    imported: int
+    updated: int
+    ignored: int
+    deleted: int
+
+
+class ImportConflict(TypedDict, total=False):
+    # uid or value the conflict is about, e.g. an unknown orgUnit
+    object: str
+    # human readable description of the conflict
+    value: str
+    errorCode: str
+    # positions of the offending values in the payload, DHIS2 2.38+
+    indexes: list[int]
+
+
+def empty_import_count() -> ImportCount:
+    return {"imported": 0, "updated": 0, "ignored": 0, "deleted": 0}
+
+
+class ImportSummary:
+    """
+    https://docs.dhis2.org/en/develop/using-the-api/dhis-core-version-master/data.html#webapi_data_values_import_summary
+    """
+
+    def __init__(
+        self,
+        status: str,
+        import_count: ImportCount,
+        conflicts: list[ImportConflict],
+        description: Optional[str] = None,
+    ):
+        self.status = status
+        self.import_count = import_count
+        self.conflicts = conflicts
+        self.description = description
+
+    @classmethod
+    def from_json(cls, body: Mapping[str, Any]) -> Optional["ImportSummary"]:
+        # newer versions wrap the summary in a web message
+        summary = body.get("response", body)
+        if not isinstance(summary, Mapping) or "importCount" not in summary:
+            return None
+        return cls(
+            status=summary.get("status", body.get("status", "")),
+            import_count=cast(
+                ImportCount, {**empty_import_count(), **summary["importCount"]}
+            ),
+            conflicts=list(summary.get("conflicts") or []),
+            description=summary.get("description") or body.get("message"),
+        )
+
+    @classmethod
+    def from_response(cls, response: requests.Response) -> Optional["ImportSummary"]:
+        try:
+            body = response.json()
+        except ValueError:
+            return None
+        return cls.from_json(body) if isinstance(body, Mapping) else None
+
+    @property
+    def acknowledged(self) -> int:
+        count = self.import_count
+        return count["imported"] + count["updated"] + count["deleted"]
+
+    def rejected_indexes(self, batch: DataValueBatch) -> dict[int, str]:
+        """
+        Maps each conflict back to the positions of the values in `batch`
+        that caused it, with the conflict description.
+        """
+        rejected: dict[int, str] = {}
+        rows: Optional[list[DataValueRow]] = None
+        for conflict in self.conflicts:
+            reason = conflict.get("value") or conflict.get("errorCode") or "conflict"
+            indexes = conflict.get("indexes")
+            if indexes is None:
+                # older versions only name the offending uid or value
+                rows = list(batch.rows()) if rows is None else rows
+                indexes = [
+                    i for i, row in enumerate(rows) if conflict.get("object") in row
+                ]
+            for i in indexes:
+                rejected.setdefault(i, reason)
+        return rejected
@@ -0,0 +1,266 @@
+import datetime
+import functools
+from typing import (
+    Any,
+    Callable,
+    Literal,
+    Mapping,
+    Optional,
+    TypedDict,
+    Union,
+    cast,
+)
+
+from .batch import DATA_VALUE_FIELDS, OPTIONAL_DATA_VALUE_FIELDS, DataValueRow
+from .constants import PERIOD_CACHE_SIZE
+
+PeriodType = Literal[
+    "Daily", "Weekly", "Monthly", "BiMonthly", "Quarterly", "SixMonthly", "Yearly"
+]
+
+PERIOD_TYPES: frozenset[str] = frozenset(PeriodType.__args__)  # type: ignore[attr-defined]
+
+ValueType = Literal["string", "integer", "number", "boolean"]
+
+Accessor = Callable[[Mapping[str, Any]], Any]
+
+RecordMapper = Callable[[Mapping[str, Any]], DataValueRow]
+
+
+class FieldRule(TypedDict, total=False):
+    # record field the value is read from, defaults to the DataValue field
+    field: str
+    # used for every record instead of a record field
+    constant: Any
+    # used when the record field is missing or null
+    default: Any
+    # source value -> value sent, e.g. data element codes to uids
+    values: dict[str, str]
+    # DHIS2 period type the record's date is converted to
+    period: PeriodType
+    # checked and normalised to DHIS2's text representation
+    type: ValueType
+
+
+# DataValue field -> record field or rule, e.g.
+# {"orgUnit": "facility", "period": {"field": "visit_date", "period": "Monthly"}}
+RecordMapping = Mapping[str, Union[str, FieldRule]]
+
+FIELD_RULE_KEYS: frozenset[str] = frozenset(FieldRule.__annotations__)
+
+
+def to_period(date: str, period_type: PeriodType) -> str:
+    """
+    https://docs.dhis2.org/en/develop/using-the-api/dhis-core-version-master/introduction.html#webapi_date_perid_format
+
+    The period of `period_type` an ISO 8601 date or datetime falls in.
+    """
+    try:
+        day = datetime.date.fromisoformat(date[:10])
+    except (TypeError, ValueError):
+        raise ValueError(f"Not an ISO 8601 date: {date!r}") from None
+    if period_type == "Daily":
+        return day.strftime("%Y%m%d")
+    if period_type == "Weekly":
+        year, week, _ = day.isocalendar()
+        return f"{year}W{week}"
+    if period_type == "Monthly":
+        return day.strftime("%Y%m")
+    if period_type == "BiMonthly":
+        return f"{day.year}{(day.month + 1) // 2:02d}B"
+    if period_type == "Quarterly":
+        return f"{day.year}Q{(day.month + 2) // 3}"
+    if period_type == "SixMonthly":
+        return f"{day.year}S{(day.month + 5) // 6}"
+    return str(day.year)
+
+
+def _string(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _integer(value: Any) -> str:
+    if isinstance(value, bool):
+        raise ValueError(f"Not an integer: {value!r}")
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, str):
+        try:
+            return str(int(value))
+        except ValueError:
+            pass
+    # e.g. 12.0 or "12.0"
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Not an integer: {value!r}") from None
+    if not number.is_integer():
+        raise ValueError(f"Not an integer: {value!r}")
+    return str(int(number))
+
+
+def _number(value: Any) -> str:
+    if isinstance(value, bool):
+        raise ValueError(f"Not a number: {value!r}")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Not a number: {value!r}") from None
+    if isinstance(value, str):
+        return value.strip()
+    return str(int(number)) if number.is_integer() else repr(number)
+
+
+_BOOLEANS = {"true": "true", "1": "true", "false": "false", "0": "false"}
+
+
+def _boolean(value: Any) -> str:
+    try:
+        return _BOOLEANS[_string(value).strip().lower()]
+    except KeyError:
+        raise ValueError(f"Not a boolean: {value!r}") from None
+
+
+COERCIONS: dict[str, Callable[[Any], str]] = {
+    "string": _string,
+    "integer": _integer,
+    "number": _number,
+    "boolean": _boolean,
+}
+
+
+def _lookup(values: Mapping[str, str]) -> Callable[[Any], str]:
+    def lookup(value: Any) -> str:
+        try:
+            return values[value]
+        except (KeyError, TypeError):
+            raise ValueError(f"No mapping for value {value!r}") from None
+
+    return lookup
+
+
+def _transforms(name: str, rule: FieldRule) -> list[Callable[[Any], Any]]:
+    # applied in this order to the value read from the record
+    transforms: list[Callable[[Any], Any]] = []
+    if "values" in rule:
+        transforms.append(_lookup(rule["values"]))
+    if "period" in rule:
+        period_type = rule["period"]
+        if period_type not in PERIOD_TYPES:
+            raise ValueError(f"Unsupported period type for {name}: {period_type}")
+        # records of a sync share few distinct dates, each is converted once
+        transforms.append(
+            functools.lru_cache(maxsize=PERIOD_CACHE_SIZE)(
+                functools.partial(to_period, period_type=period_type)
+            )
+        )
+    if "type" in rule:
+        coerce = COERCIONS.get(rule["type"])
+        if coerce is None:
+            raise ValueError(f"Unsupported value type for {name}: {rule['type']}")
+        transforms.append(coerce)
+    return transforms
+
+
+def _compile_field(
+    name: str, rule: Union[str, FieldRule], namespace: dict[str, Any]
+) -> str:
+    """
+    The Python expression reading DataValue field `name` from `record`,
+    the objects it refers to are added to `namespace` under unique names.
+    Optional fields are None when the record does not have them.
+    """
+    optional = name in OPTIONAL_DATA_VALUE_FIELDS
+    if isinstance(rule, str):
+        return f"record.get({rule!r})" if optional else f"record[{rule!r}]"
+    unknown_keys = set(rule) - FIELD_RULE_KEYS
+    if unknown_keys:
+        raise ValueError(f"Unknown mapping options for {name}: {sorted(unknown_keys)}")
+    if "constant" in rule and ("field" in rule or "default" in rule):
+        raise ValueError(f"{name} cannot map both a constant and a record field")
+
+    transforms = _transforms(name, rule)
+    if "constant" in rule:
+        # transformed once, here, rather than for every record
+        value = rule["constant"]
+        for transform in transforms:
+            value = transform(value)
+        namespace[f"{name}_constant"] = value
+        return f"{name}_constant"
+
+    field = rule.get("field", name)
+    if "default" in rule:
+        namespace[f"{name}_default"] = rule["default"]
+        expression = (
+            f"({name}_value if ({name}_value := record.get({field!r})) is not None"
+            f" else {name}_default)"
+        )
+    elif optional:
+        expression = f"{name}_value"
+    else:
+        expression = f"record[{field!r}]"
+    for i, transform in enumerate(transforms):
+        namespace[f"{name}_transform{i}"] = transform
+        expression = f"{name}_transform{i}({expression})"
+    if optional and "default" not in rule:
+        # transformed only when present
+        expression = (
+            f"({expression} if ({name}_value := record.get({field!r})) is not None"
+            " else None)"
+        )
+    return expression
+
+
+_COMPILED_TEMPLATE = """\
+def compiled(record):
+    try:
+        return {expression}
+    except KeyError as e:
+        raise ValueError(f"Missing field {{e.args[0]!r}}") from None
+    except TypeError as e:
+        raise ValueError(f"Invalid field value: {{e}}") from None
+"""
+
+
+def _compile(expression: str, namespace: dict[str, Any]) -> Any:
+    # a single function per stream, so records do not go through a call
+    # per field and rule, as dataclasses and namedtuple generate theirs.
+    # Missing fields and values of the wrong type, e.g. an unhashable one
+    # for a lookup, are errors of the record like any other
+    exec(_COMPILED_TEMPLATE.format(expression=expression), namespace)
+    return namespace["compiled"]
+
+
+def compile_field(mapping: RecordMapping, name: str) -> Accessor:
+    # reads a single DataValue field of a record, e.g. to route it by orgUnit
+    namespace: dict[str, Any] = {}
+    return cast(
+        Accessor,
+        _compile(_compile_field(name, mapping.get(name, name), namespace), namespace),
+    )
+
+
+def compile_mapping(mapping: Optional[RecordMapping] = None) -> RecordMapper:
+    """
+    Compiles a mapping once into a function returning the DataValue row of
+    a record. Unmapped fields keep their name. The generated function reads
+    every field inline and only calls out for the value lookups, period
+    conversions and coercions of the mapping.
+
+    Raises ValueError for an invalid mapping when compiling, and from the
+    returned function for a record the mapping cannot convert, including
+    one missing a mapped field.
+    """
+    mapping = mapping or {}
+    unknown_fields = set(mapping) - set(DATA_VALUE_FIELDS)
+    if unknown_fields:
+        raise ValueError(f"Unknown DataValue fields: {sorted(unknown_fields)}")
+
+    namespace: dict[str, Any] = {}
+    expressions = [
+        _compile_field(name, mapping.get(name, name), namespace)
+        for name in DATA_VALUE_FIELDS
+    ]
+    return cast(RecordMapper, _compile(f"({', '.join(expressions)})", namespace))
@@ -0,0 +1,62 @@
+import json
+import logging
+from typing import IO, Any, Callable, Iterator
+
+from airbyte_cdk.models import (  # type: ignore # see this https://github.com/airbytehq/airbyte/pull/22963
+    AirbyteMessage,
+    AirbyteRecordMessage,
+    Type,
+)
+from pydantic import ValidationError
+
+from .constants import READ_CHUNK_SIZE
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover # orjson is optional
+    orjson = None  # type: ignore[assignment]
+
+airbyteLogger = logging.getLogger("airbyte")
+
+loads: Callable[[bytes], Any] = orjson.loads if orjson is not None else json.loads
+
+
+def decode_messages(
+    input_stream: IO[bytes], chunk_size: int = READ_CHUNK_SIZE
+) -> Iterator[AirbyteMessage]:
+    """
+    Decodes the Airbyte messages of a write command from raw stdin.
+
+    Lines are read `chunk_size` bytes at a time and RECORD messages are built
+    without pydantic validation, their data going through untouched. Every
+    other message type is a fraction of the input and is fully validated.
+    """
+
+    while True:
+        lines = input_stream.readlines(chunk_size)
+        if not lines:
+            return
+        for line in lines:
+            try:
+                message = loads(line)
+                if message.get("type") == "RECORD":
+                    record = message["record"]
+                    # the fields the CDK model requires must be present
+                    fields = {
+                        "stream": record["stream"],
+                        "data": record["data"],
+                        "emitted_at": record["emitted_at"],
+                    }
+                    if "namespace" in record:
+                        fields["namespace"] = record["namespace"]
+                    yield AirbyteMessage.construct(
+                        type=Type.RECORD,
+                        record=AirbyteRecordMessage.construct(**fields),
+                    )
+                else:
+                    yield AirbyteMessage.parse_obj(message)
+            except (ValueError, TypeError, KeyError, AttributeError, ValidationError):
+                airbyteLogger.info(
+                    "ignoring input which can't be deserialized as Airbyte Message:"
+                    f" {line!r}"
+                )
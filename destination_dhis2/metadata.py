@@ -0,0 +1,196 @@
+import json
+import logging
+import os
+import re
+from typing import TYPE_CHECKING, Any, Iterator, Optional, TypedDict, cast
+
+import pendulum
+
+from .constants import (
+    DATA_ELEMENTS_PATH,
+    DATA_SETS_PATH,
+    METADATA_CACHE_TTL,
+    METADATA_PAGE_SIZE,
+    ORGANISATION_UNITS_PATH,
+)
+
+if TYPE_CHECKING:
+    from .client import Dhis2Client
+
+airbyteLogger = logging.getLogger("airbyte")
+
+# https://docs.dhis2.org/en/develop/using-the-api/dhis-core-version-master/introduction.html#webapi_date_perid_format
+PERIOD_PATTERN = re.compile(
+    r"^\d{4}("
+    r"\d{2}(\d{2}|B)?"  # daily, monthly, bi-monthly
+    r"|(Wed|Thu|Sat|Sun|Bi)?W\d{1,2}"  # weekly, bi-weekly
+    r"|Q[1-4]|S[12]|(April|Nov)S[12]"  # quarterly, six-monthly
+    r"|April|July|Oct|Nov"  # financial years
+    r")?$"
+)
+
+
+class DataSetAssignments(TypedDict):
+    dataElements: list[str]
+    organisationUnits: list[str]
+
+
+class MetadataCache(TypedDict):
+    # ISO timestamp of the last (incremental) refresh
+    refreshed_at: str
+    dataElements: list[str]
+    organisationUnits: list[str]
+    dataSets: dict[str, DataSetAssignments]
+
+
+class MetadataIndex:
+    """
+    In-memory index of the data element and org unit uids known to DHIS2 and
+    the data sets assigning them to each other, to validate data values
+    before they are buffered.
+
+    The index is cached in a local JSON file. Within `ttl` seconds the cache
+    is used as is, after that only metadata updated since the last refresh
+    is fetched and merged in. Deleted metadata is only dropped by removing
+    the cache file.
+    """
+
+    def __init__(self, cache: MetadataCache, check_assignments: bool = False):
+        self.cache = cache
+        self.check_assignments = check_assignments
+        self.data_elements = set(cache["dataElements"])
+        self.org_units = set(cache["organisationUnits"])
+        # uid -> data sets it belongs to
+        self.data_element_sets: dict[str, set[str]] = {}
+        self.org_unit_sets: dict[str, set[str]] = {}
+        for data_set, assignments in cache["dataSets"].items():
+            for uid in assignments["dataElements"]:
+                self.data_element_sets.setdefault(uid, set()).add(data_set)
+            for uid in assignments["organisationUnits"]:
+                self.org_unit_sets.setdefault(uid, set()).add(data_set)
+
+    @classmethod
+    def load(
+        cls,
+        client: "Dhis2Client",
+        cache_path: Optional[str] = None,
+        ttl: int = METADATA_CACHE_TTL,
+        check_assignments: bool = False,
+    ) -> "MetadataIndex":
+        cache: Optional[MetadataCache] = None
+        if cache_path is not None and os.path.exists(cache_path):
+            with open(cache_path) as f:
+                cache = json.load(f)
+
+        now = pendulum.now("UTC")
+        if cache is None:
+            airbyteLogger.info("Fetching DHIS2 metadata")
+            cache = {
+                "refreshed_at": now.to_iso8601_string(),
+                "dataElements": [],
+                "organisationUnits": [],
+                "dataSets": {},
+            }
+            cls._refresh(client, cache, None)
+        elif now.diff(_parse_datetime(cache["refreshed_at"])).in_seconds() >= ttl:
+            airbyteLogger.info(
+                f"Fetching DHIS2 metadata updated since {cache['refreshed_at']}"
+            )
+            since = cache["refreshed_at"]
+            cache["refreshed_at"] = now.to_iso8601_string()
+            cls._refresh(client, cache, since)
+        else:
+            return cls(cache, check_assignments)
+
+        if cache_path is not None:
+            # write then rename, so a crash never leaves a truncated cache,
+            # to a file of its own as shard processes may refresh concurrently
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, cache_path)
+        return cls(cache, check_assignments)
+
+    @staticmethod
+    def _refresh(
+        client: "Dhis2Client", cache: MetadataCache, since: Optional[str]
+    ) -> None:
+        cache["dataElements"] = sorted(
+            set(cache["dataElements"]).union(
+                item["id"] for item in _fetch(client, DATA_ELEMENTS_PATH, "id", since)
+            )
+        )
+        cache["organisationUnits"] = sorted(
+            set(cache["organisationUnits"]).union(
+                item["id"]
+                for item in _fetch(client, ORGANISATION_UNITS_PATH, "id", since)
+            )
+        )
+        for item in _fetch(
+            client,
+            DATA_SETS_PATH,
+            "id,dataSetElements[dataElement[id]],organisationUnits[id]",
+            since,
+        ):
+            cache["dataSets"][item["id"]] = {
+                "dataElements": [
+                    element["dataElement"]["id"]
+                    for element in item.get("dataSetElements", [])
+                ],
+                "organisationUnits": [
+                    org_unit["id"] for org_unit in item.get("organisationUnits", [])
+                ],
+            }
+
+    def validate(self, data_element: str, period: str, org_unit: str) -> Optional[str]:
+        """
+        Returns why DHIS2 would reject a data value, or None if it is valid.
+        """
+        if data_element not in self.data_elements:
+            return f"Data element not found: {data_element}"
+        if org_unit not in self.org_units:
+            return f"Organisation unit not found: {org_unit}"
+        if not PERIOD_PATTERN.match(period):
+            return f"Invalid period: {period}"
+        if self.check_assignments and self.data_element_sets.get(
+            data_element, set()
+        ).isdisjoint(self.org_unit_sets.get(org_unit, ())):
+            return (
+                f"Data element {data_element} is not assigned to"
+                f" organisation unit {org_unit} through any data set"
+            )
+        return None
+
+
+def _parse_datetime(value: str) -> pendulum.DateTime:
+    return cast(pendulum.DateTime, pendulum.parse(value))
+
+
+def _fetch(
+    client: "Dhis2Client", endpoint: str, fields: str, since: Optional[str]
+) -> Iterator[dict[str, Any]]:
+    # pages through a metadata collection, e.g. {"pager": ..., "dataElements": [...]}
+    collection = endpoint.strip("/")
+    params: dict[str, Any] = {
+        "fields": fields,
+        "paging": "true",
+        "pageSize": METADATA_PAGE_SIZE,
+    }
+    if since is not None:
+        # a day of overlap, so the server's time zone cannot make us miss updates
+        since_date = _parse_datetime(since).subtract(days=1).to_date_string()
+        params["filter"] = f"lastUpdated:ge:{since_date}"
+
+    page, page_count = 1, 1
+    while page <= page_count:
+        response = client.request(
+            http_method="GET",
+            endpoint=endpoint,
+            params={**params, "page": page},
+            retry=True,
+        )
+        response.raise_for_status()
+        body = response.json()
+        yield from body.get(collection, [])
+        page_count = body.get("pager", {}).get("pageCount", page)
+        page += 1
@@ -0,0 +1,201 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from http import HTTPStatus
+from typing import Callable, Optional
+
+import requests
+from requests.exceptions import (
+    ConnectionError,
+    ConnectTimeout,
+    RequestException,
+    Timeout,
+)
+
+from .constants import (
+    BACKOFF_BASE,
+    BACKOFF_CAP,
+    CIRCUIT_BREAKER_COOLDOWN,
+    CIRCUIT_BREAKER_THRESHOLD,
+    MAX_RETRIES,
+    NON_BATCH_CLIENT_ERRORS,
+    RETRY_BUDGET,
+    RETRYABLE_STATUS_CODES,
+)
+
+airbyteLogger = logging.getLogger("airbyte")
+
+
+def is_permanent_failure(error: RequestException) -> bool:
+    """
+    Whether an import would fail the same way with the same batch: DHIS2
+    answered it with an ERROR import summary, or with a client error that
+    is not about the credentials, a timeout or the rate of requests.
+    """
+    response = error.response
+    if response is None:
+        return False
+    if response.ok:
+        return True
+    return (
+        400 <= response.status_code < 500
+        and response.status_code not in RETRYABLE_STATUS_CODES
+        and response.status_code not in NON_BATCH_CLIENT_ERRORS
+    )
+
+
+def parse_retry_after(response: requests.Response) -> Optional[float]:
+    # Retry-After is either a number of seconds or an HTTP date
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is None:
+        return None
+    try:
+        return max(float(retry_after), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0)
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive overload failures and stays open for
+    at least `cooldown` seconds, closing again on the next success. While it
+    is open the client drops to a single request in flight.
+    """
+
+    def __init__(
+        self,
+        threshold: int = CIRCUIT_BREAKER_THRESHOLD,
+        cooldown: float = CIRCUIT_BREAKER_COOLDOWN,
+    ):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= self.threshold and not self.is_open():
+                self._opened_at = time.monotonic()
+                airbyteLogger.warning(
+                    "DHIS2 server appears overloaded, reducing concurrency to 1"
+                )
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._consecutive_failures = 0
+            if (
+                self._opened_at is not None
+                and time.monotonic() - self._opened_at >= self.cooldown
+            ):
+                self._opened_at = None
+                airbyteLogger.info("DHIS2 server recovered, restoring concurrency")
+
+    def concurrency(self, max_concurrency: int) -> int:
+        return 1 if self.is_open() else max_concurrency
+
+
+class RetryPolicy:
+    """
+    Retries idempotent requests that failed with a transient status code or a
+    connection error, using capped exponential backoff with full jitter and
+    honouring Retry-After. A response asking to wait longer than
+    `backoff_cap` is returned as is rather than retried early. Every retry draws from a budget shared by all
+    requests of the sync.
+
+    Requests that are not `idempotent` are only retried when they cannot
+    have reached the server: a connection that timed out before it was
+    established, or a 429 response refusing the request before it was
+    processed.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = MAX_RETRIES,
+        retry_budget: int = RETRY_BUDGET,
+        backoff_base: float = BACKOFF_BASE,
+        backoff_cap: float = BACKOFF_CAP,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.max_retries = max_retries
+        self.retry_budget = retry_budget
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.retries = 0
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2**attempt))
+
+    def _take_retry(self, attempt: int) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        with self._lock:
+            if self.retries >= self.retry_budget:
+                return False
+            self.retries += 1
+            if self.retries == self.retry_budget:
+                airbyteLogger.warning(
+                    f"Retry budget of {self.retry_budget} retries exhausted for this sync"
+                )
+            return True
+
+    def call(
+        self,
+        send: Callable[[], requests.Response],
+        description: str,
+        idempotent: bool = True,
+    ) -> requests.Response:
+        attempt = 0
+        while True:
+            try:
+                response = send()
+            except (ConnectionError, Timeout) as e:
+                self.circuit_breaker.record_failure()
+                if not (idempotent or isinstance(e, ConnectTimeout)):
+                    raise
+                if not self._take_retry(attempt):
+                    raise
+                delay = self.backoff(attempt)
+                reason = repr(e)
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    self.circuit_breaker.record_success()
+                    return response
+                self.circuit_breaker.record_failure()
+                if not (
+                    idempotent or response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+                ):
+                    return response
+                retry_after = parse_retry_after(response)
+                if retry_after is not None and retry_after > self.backoff_cap:
+                    airbyteLogger.warning(
+                        f"{description} failed with status {response.status_code},"
+                        f" not retrying as the server asked to wait {retry_after:.0f}s"
+                    )
+                    return response
+                if not self._take_retry(attempt):
+                    return response
+                delay = self.backoff(attempt) if retry_after is None else retry_after
+                reason = f"status {response.status_code}"
+
+            attempt += 1
+            airbyteLogger.warning(
+                f"{description} failed with {reason}, retrying in {delay:.1f}s"
+                f" (attempt {attempt}/{self.max_retries})"
+            )
+            self._sleep(delay)
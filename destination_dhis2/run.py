@@ -0,0 +1,23 @@
+import json
+from importlib.resources import files
+
+
+def spec_message() -> str:
+    # the SPEC message the CDK prints, read from the same spec.json
+    spec = json.loads(files(__package__ or __name__).joinpath("spec.json").read_text())
+    return json.dumps({"type": "SPEC", "spec": spec})
+
+
+def run(args: list[str]) -> None:
+    """
+    Runs a connector command. `spec` is answered from spec.json directly,
+    without importing airbyte_cdk or requests, every other command is
+    handed to DestinationDhis2.
+    """
+    if args == ["spec"]:
+        print(spec_message())
+        return
+
+    from .destination import DestinationDhis2
+
+    DestinationDhis2().run(args)
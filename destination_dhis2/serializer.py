@@ -0,0 +1,273 @@
+import csv
+import io
+import json
+import zlib
+from functools import partial
+from itertools import islice
+from json.encoder import (  # type: ignore[attr-defined] # C accelerated
+    encode_basestring_ascii,
+)
+from typing import Any, Callable, Iterable, Iterator, Literal
+
+from .batch import DataValueBatch, DataValueRow
+from .constants import SERIALIZE_CHUNK_SIZE
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover # orjson is optional
+    orjson = None  # type: ignore[assignment]
+
+PayloadFormat = Literal["json", "csv"]
+
+CONTENT_TYPES: dict[str, str] = {"json": "application/json", "csv": "application/csv"}
+
+# completeDate is a data value set attribute, DHIS2 ignores it on single values
+CSV_HEADER = (
+    "dataelement,period,orgunit,categoryoptioncombo,attributeoptioncombo,value\r\n"
+)
+
+DATA_VALUE_TEMPLATE = (
+    '{"dataElement":%s,"completeDate":%s,"period":%s,"orgUnit":%s,"value":%s}'
+)
+
+# period and orgUnit are given once, in the data value set header
+HOISTED_DATA_VALUE_TEMPLATE = '{"dataElement":%s,"completeDate":%s,"value":%s}'
+
+
+def _encode_scalar(value: Any) -> str:
+    # fast path for the common case, values of other types are left to json
+    if type(value) is str:
+        return encode_basestring_ascii(value)
+    return json.dumps(value)
+
+
+def _encode_rows(rows: list[DataValueRow]) -> bytes:
+    # comma separated data value objects, without the enclosing brackets
+    if orjson is not None:
+        return orjson.dumps(
+            [
+                {
+                    "dataElement": data_element,
+                    "completeDate": complete_date,
+                    "period": period,
+                    "orgUnit": org_unit,
+                    "value": value,
+                }
+                for data_element, complete_date, period, org_unit, value, _, _ in rows
+            ]
+        )[1:-1]
+    return ",".join(
+        DATA_VALUE_TEMPLATE % tuple(map(_encode_scalar, row[:5])) for row in rows
+    ).encode()
+
+
+def _encode_hoisted_rows(rows: list[DataValueRow]) -> bytes:
+    # like _encode_rows, leaving out the period and orgUnit of the header
+    if orjson is not None:
+        return orjson.dumps(
+            [
+                {
+                    "dataElement": data_element,
+                    "completeDate": complete_date,
+                    "value": value,
+                }
+                for data_element, complete_date, _, _, value, _, _ in rows
+            ]
+        )[1:-1]
+    return ",".join(
+        HOISTED_DATA_VALUE_TEMPLATE
+        % (
+            _encode_scalar(data_element),
+            _encode_scalar(complete_date),
+            _encode_scalar(value),
+        )
+        for data_element, complete_date, _, _, value, _, _ in rows
+    ).encode()
+
+
+def _encode_option_combo_rows(rows: list[DataValueRow], hoisted: bool) -> bytes:
+    # like _encode_rows, with the combos of the values that set them
+    data_values: list[dict[str, str]] = []
+    for (
+        data_element,
+        complete_date,
+        period,
+        org_unit,
+        value,
+        category_option_combo,
+        attribute_option_combo,
+    ) in rows:
+        data_value = {"dataElement": data_element, "completeDate": complete_date}
+        if not hoisted:
+            data_value["period"] = period
+            data_value["orgUnit"] = org_unit
+        data_value["value"] = value
+        if category_option_combo is not None:
+            data_value["categoryOptionCombo"] = category_option_combo
+        if attribute_option_combo is not None:
+            data_value["attributeOptionCombo"] = attribute_option_combo
+        data_values.append(data_value)
+    if orjson is not None:
+        return orjson.dumps(data_values)[1:-1]
+    return json.dumps(data_values, separators=(",", ":"))[1:-1].encode()
+
+
+def iter_data_value_set(
+    batch: DataValueBatch,
+    chunk_size: int = SERIALIZE_CHUNK_SIZE,
+    hoist_headers: bool = False,
+) -> Iterator[bytes]:
+    """
+    Yields the `{"dataValues": [...]}` payload of a batch in chunks of
+    `chunk_size` values, so only one chunk is encoded in memory at a time.
+
+    With `hoist_headers`, a batch whose values all share a period and
+    orgUnit is sent as a data value set with both in its header instead.
+    Category and attribute option combos are only sent for the values that
+    set them, DHIS2 applies its defaults to the others.
+    """
+    header = batch.shared_header() if hoist_headers else None
+    encode: Callable[[list[DataValueRow]], bytes]
+    if batch.has_option_combos:
+        encode = partial(_encode_option_combo_rows, hoisted=header is not None)
+    else:
+        encode = _encode_rows if header is None else _encode_hoisted_rows
+    if header is None:
+        yield b'{"dataValues":['
+    else:
+        period, org_unit = header
+        yield (
+            f'{{"period":{_encode_scalar(period)},'
+            f'"orgUnit":{_encode_scalar(org_unit)},"dataValues":['
+        ).encode()
+    rows = batch.rows()
+    separator = b""
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        yield separator + encode(chunk)
+        separator = b","
+    yield b"]}"
+
+
+def iter_csv_data_values(
+    batch: DataValueBatch, chunk_size: int = SERIALIZE_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    Yields a batch in DHIS2's CSV data value import format, which does not
+    repeat the field names on every row, in chunks of `chunk_size` rows.
+    """
+    yield CSV_HEADER.encode()
+    rows = batch.rows()
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        out = io.StringIO()
+        writer = csv.writer(out)
+        # combos left to their defaults are written as empty columns
+        writer.writerows(
+            (
+                data_element,
+                period,
+                org_unit,
+                category_option_combo,
+                attribute_option_combo,
+                value,
+            )
+            for (
+                data_element,
+                _,
+                period,
+                org_unit,
+                value,
+                category_option_combo,
+                attribute_option_combo,
+            ) in chunk
+        )
+        yield out.getvalue().encode()
+
+
+def iter_gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def iter_payload(
+    batch: DataValueBatch,
+    payload_format: PayloadFormat = "json",
+    compress: bool = False,
+    chunk_size: int = SERIALIZE_CHUNK_SIZE,
+    hoist_headers: bool = False,
+) -> Iterator[bytes]:
+    if payload_format == "json":
+        chunks = iter_data_value_set(batch, chunk_size, hoist_headers)
+    elif payload_format == "csv":
+        chunks = iter_csv_data_values(batch, chunk_size)
+    else:
+        raise ValueError(f"Unsupported payload format: {payload_format}")
+    return iter_gzip(chunks) if compress else chunks
+
+
+def serialize_payload(
+    batch: DataValueBatch,
+    payload_format: PayloadFormat = "json",
+    compress: bool = False,
+    hoist_headers: bool = False,
+) -> bytes:
+    return b"".join(
+        iter_payload(batch, payload_format, compress, hoist_headers=hoist_headers)
+    )
+
+
+def serialize_data_value_set(batch: DataValueBatch) -> bytes:
+    return serialize_payload(batch)
+
+
+class DataValueSetBody:
+    """
+    Request body that streams a batch with chunked transfer encoding.
+
+    It can be iterated more than once, so retried requests re-encode the
+    batch instead of sending an exhausted stream, and records the size of
+    the last payload it produced.
+    """
+
+    def __init__(
+        self,
+        batch: DataValueBatch,
+        payload_format: PayloadFormat = "json",
+        compress: bool = False,
+        chunk_size: int = SERIALIZE_CHUNK_SIZE,
+        hoist_headers: bool = False,
+    ):
+        self.batch = batch
+        self.payload_format = payload_format
+        self.compress = compress
+        self.chunk_size = chunk_size
+        self.hoist_headers = hoist_headers
+        self.size = 0
+
+    def __iter__(self) -> Iterator[bytes]:
+        self.size = 0
+        for chunk in iter_payload(
+            self.batch,
+            self.payload_format,
+            self.compress,
+            self.chunk_size,
+            self.hoist_headers,
+        ):
+            self.size += len(chunk)
+            yield chunk
+
+
+def payload_size(body: Any) -> int:
+    # bytes sent for a prepared request body
+    if isinstance(body, DataValueSetBody):
+        return body.size
+    return len(body) if body else 0
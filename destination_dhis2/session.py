@@ -0,0 +1,58 @@
+from typing import Any, Optional, TypedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .constants import CONNECT_TIMEOUT, POOL_SIZE, READ_TIMEOUT
+from .throttle import RateLimiter
+
+
+class ConnectionStats(TypedDict):
+    requests: int
+    connections: int
+    reused: int
+
+
+class Dhis2Session(requests.Session):
+    """
+    Keep-alive session shared by the data and token paths of a Dhis2Client.
+
+    Connections are pooled per host, up to `pool_size` of them, and every
+    request gets separate connect and read timeouts unless the caller passes
+    its own. With a `rate_limiter`, every request, retries and token
+    refreshes included, waits for its turn.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = POOL_SIZE,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
+        super().__init__()
+        self.rate_limiter = rate_limiter
+        self.timeout = (connect_timeout, read_timeout)
+        # block rather than open throwaway connections once the pool is exhausted
+        self.adapter = HTTPAdapter(pool_maxsize=pool_size, pool_block=True)
+        self.mount("https://", self.adapter)
+        self.mount("http://", self.adapter)
+
+    def request(  # type: ignore[override] # only narrows keyword handling
+        self, method: str, url: str, **kwargs: Any
+    ) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire_request()
+        return super().request(method, url, **kwargs)
+
+    def connection_stats(self) -> ConnectionStats:
+        stats: ConnectionStats = {"requests": 0, "connections": 0, "reused": 0}
+        for pool_key in self.adapter.poolmanager.pools.keys():
+            pool = self.adapter.poolmanager.pools.get(pool_key)
+            if pool is None:
+                continue
+            stats["requests"] += pool.num_requests
+            stats["connections"] += pool.num_connections
+        stats["reused"] = max(stats["requests"] - stats["connections"], 0)
+        return stats
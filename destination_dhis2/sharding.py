@@ -0,0 +1,360 @@
+import logging
+import multiprocessing
+import os
+import queue
+import zlib
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from typing import Any, Iterable, Mapping, Optional, TypedDict
+
+from airbyte_cdk.models import (  # type: ignore # see this https://github.com/airbytehq/airbyte/pull/22963
+    ConfiguredAirbyteCatalog,
+)
+
+from .client import Dhis2Client
+from .constants import (
+    SHARD_CHUNK_SIZE,
+    SHARD_QUEUE_SIZE,
+    SHARD_SPOOL_PREFIX,
+    STREAM_OPTIONS_KEY,
+)
+from .grouping import GroupingStats, empty_grouping_stats
+from .import_summary import ImportCount, empty_import_count
+from .mapping import Accessor, compile_field
+from .session import ConnectionStats
+from .spool import Spool, spool_directories
+from .stream_writer import StreamOptions, StreamWriter, stream_mapping
+from .telemetry import MetricsSnapshot, merge_metrics
+
+airbyteLogger = logging.getLogger("airbyte")
+
+# commands sent to the shards, and the replies they send back
+RECORDS = "records"
+BARRIER = "barrier"
+CLOSE = "close"
+ERROR = "error"
+
+# seconds between checks that the shards are still alive while waiting on them
+SHARD_POLL_INTERVAL = 1
+
+# per second limits of the config and of its rate limit windows
+RATE_LIMITS = ("requests_per_second", "values_per_second")
+
+
+class WriteStats(TypedDict):
+    import_count: ImportCount
+    rejected: int
+    coalesced: int
+    grouping: GroupingStats
+    connections: ConnectionStats
+    # per stream
+    invalid: dict[str, int]
+    unchanged: dict[str, int]
+    metrics: MetricsSnapshot
+
+
+def collect_write_stats(
+    client: Dhis2Client, writers: Mapping[str, StreamWriter]
+) -> WriteStats:
+    return {
+        "import_count": client.import_count,
+        "rejected": client.dead_letters.count,
+        "coalesced": client.coalesced_count,
+        "grouping": client.grouping,
+        "connections": client.connection_stats(),
+        "invalid": {name: writer.invalid_count for name, writer in writers.items()},
+        "unchanged": {name: writer.unchanged_count for name, writer in writers.items()},
+        "metrics": client.metrics_snapshot(),
+    }
+
+
+def merge_write_stats(all_stats: Iterable[WriteStats]) -> WriteStats:
+    all_stats = list(all_stats)
+    merged: WriteStats = {
+        "import_count": empty_import_count(),
+        "rejected": 0,
+        "coalesced": 0,
+        "grouping": empty_grouping_stats(),
+        "connections": {"requests": 0, "connections": 0, "reused": 0},
+        "invalid": {},
+        "unchanged": {},
+        "metrics": merge_metrics(stats["metrics"] for stats in all_stats),
+    }
+    for stats in all_stats:
+        for key, count in stats["import_count"].items():
+            merged["import_count"][key] += count  # type: ignore[literal-required]
+        merged["rejected"] += stats["rejected"]
+        merged["coalesced"] += stats["coalesced"]
+        for key, count in stats["grouping"].items():
+            merged["grouping"][key] += count  # type: ignore[literal-required]
+        for key, count in stats["connections"].items():
+            merged["connections"][key] += count  # type: ignore[literal-required]
+        for name, count in stats["invalid"].items():
+            merged["invalid"][name] = merged["invalid"].get(name, 0) + count
+        for name, count in stats["unchanged"].items():
+            merged["unchanged"][name] = merged["unchanged"].get(name, 0) + count
+    return merged
+
+
+def shard_of(org_unit: str, shards: int) -> int:
+    # crc32 rather than hash(), which is salted differently in every process
+    return zlib.crc32(org_unit.encode()) % shards
+
+
+def shard_config(config: Mapping[str, Any], shard: int, shards: int) -> dict[str, Any]:
+    shard_config = dict(config)
+    if shard_config.get("spool_path"):
+        # spool segments are numbered per process
+        shard_config["spool_path"] = os.path.join(
+            shard_config["spool_path"], f"{SHARD_SPOOL_PREFIX}{shard}"
+        )
+    # the parent dumps the metrics of every shard combined
+    shard_config.pop("metrics_path", None)
+    # every shard throttles itself, so together they keep to the limits
+    for key in RATE_LIMITS:
+        if shard_config.get(key):
+            shard_config[key] = shard_config[key] / shards
+    if shard_config.get("rate_limit_windows"):
+        shard_config["rate_limit_windows"] = [
+            {
+                **window,
+                **{key: window[key] / shards for key in RATE_LIMITS if key in window},
+            }
+            for window in shard_config["rate_limit_windows"]
+        ]
+    return shard_config
+
+
+def resume_other_spools(config: Mapping[str, Any], shards: int) -> int:
+    """
+    Imports the batches left under spool_path by a sync with a different
+    number of shards, which no writer of this sync resumes, and returns
+    their number. Their state was emitted once they were spooled, so they
+    must go in before any newer values.
+    """
+    spool_path = config.get("spool_path")
+    if not spool_path:
+        return 0
+    own_spools = (
+        {spool_path}
+        if shards == 1
+        else {
+            shard_config(config, shard, shards)["spool_path"] for shard in range(shards)
+        }
+    )
+    resumed = 0
+    for directory in spool_directories(spool_path):
+        if directory in own_spools or not Spool(directory).segments():
+            continue
+        client = Dhis2Client(**dict(config, spool_path=directory))
+        try:
+            count = client.resume_spool()
+            airbyteLogger.info(
+                f"Resuming {count} batches spooled to {directory}"
+                " by a sync with a different number of shards"
+            )
+            client.flush()
+            resumed += count
+        finally:
+            client.close()
+    return resumed
+
+
+def _run_shard(
+    shard: int,
+    config: Mapping[str, Any],
+    catalog: str,
+    inbox: "Queue[Any]",
+    outbox: "Queue[Any]",
+) -> None:
+    client = Dhis2Client(**config)
+    try:
+        client.load_metadata()
+        writers = {
+            s.stream.name: StreamWriter.from_configured_stream(s, client)
+            for s in ConfiguredAirbyteCatalog.parse_raw(catalog).streams
+        }
+        if client.resume_spool() > 0:
+            client.flush()
+
+        while True:
+            command, stream, payload = inbox.get()
+            if command == RECORDS:
+                writer = writers[stream]
+                for record in payload:
+                    writer.write(record)
+                client.metrics.records += len(payload)
+                client.report_metrics()
+            elif command == BARRIER:
+                # as with a single process, a state of a stream missing from
+                # the catalog covers no writer
+                if stream is None:
+                    barrier_writers = list(writers.values())
+                else:
+                    barrier_writers = [writers[stream]] if stream in writers else []
+                for writer in barrier_writers:
+                    writer.submit()
+                client.checkpoint()
+                outbox.put((shard, BARRIER, None))
+            else:
+                for writer in writers.values():
+                    writer.submit()
+                client.flush()
+                outbox.put((shard, CLOSE, collect_write_stats(client, writers)))
+                return
+    except Exception as e:
+        outbox.put((shard, ERROR, f"{type(e).__name__}: {e}"))
+        # a non-zero exit code tells the parent to stop waiting on this shard
+        raise
+    finally:
+        client.close()
+
+
+class ShardedWriter:
+    """
+    Spreads the records of a sync over `shards` worker processes, each with
+    its own Dhis2Client, so decoding happens here while validation,
+    serialization and imports run in parallel.
+
+    Records are partitioned by a hash of their orgUnit, so the values of an
+    organisation unit are always imported, in order, by the same process
+    and concurrent imports do not contend on the same rows. A barrier only
+    returns once every shard has checkpointed the records sent before it.
+    """
+
+    def __init__(
+        self,
+        config: Mapping[str, Any],
+        configured_catalog: ConfiguredAirbyteCatalog,
+        shards: int,
+        chunk_size: int = SHARD_CHUNK_SIZE,
+    ):
+        self.shards = shards
+        self.chunk_size = chunk_size
+        # reads the orgUnit of each stream's records, as their mapping does
+        self.org_units: dict[str, Accessor] = {}
+        for configured_stream in configured_catalog.streams:
+            stream = configured_stream.stream
+            options: StreamOptions = (stream.json_schema or {}).get(
+                STREAM_OPTIONS_KEY, {}
+            )
+            self.org_units[stream.name] = compile_field(
+                stream_mapping(options), "orgUnit"
+            )
+        # shard -> stream -> records not sent yet
+        self._chunks: list[dict[str, list[Mapping[str, Any]]]] = [
+            {} for _ in range(shards)
+        ]
+
+        # spawned rather than forked, the parent may be running threads
+        context = multiprocessing.get_context("spawn")
+        self._outbox: "Queue[Any]" = context.Queue()
+        self._inboxes: list["Queue[Any]"] = [
+            context.Queue(SHARD_QUEUE_SIZE) for _ in range(shards)
+        ]
+        self._processes: list[BaseProcess] = [
+            context.Process(
+                target=_run_shard,
+                args=(
+                    shard,
+                    shard_config(config, shard, shards),
+                    configured_catalog.json(),
+                    self._inboxes[shard],
+                    self._outbox,
+                ),
+                name=f"dhis2-shard-{shard}",
+                daemon=True,
+            )
+            for shard in range(shards)
+        ]
+        for process in self._processes:
+            process.start()
+
+    def write(self, stream: str, record: Mapping[str, Any]) -> None:
+        try:
+            shard = shard_of(self.org_units[stream](record), self.shards)
+        except ValueError:
+            # the shard's writer sends the record to its dead letters
+            shard = 0
+        chunk = self._chunks[shard].setdefault(stream, [])
+        chunk.append(record)
+        if len(chunk) >= self.chunk_size:
+            self._send(shard, RECORDS, stream, self._chunks[shard].pop(stream))
+
+    def barrier(self, stream: Optional[str] = None) -> None:
+        """
+        Sends the records of `stream`, by default of every stream, to the
+        shards and waits until every shard has checkpointed them.
+        """
+        for shard in range(self.shards):
+            self._send_chunks(shard, stream)
+            self._send(shard, BARRIER, stream)
+        self._wait_for(BARRIER)
+
+    def close(self) -> WriteStats:
+        """
+        Flushes every shard and returns their combined stats.
+        """
+        for shard in range(self.shards):
+            self._send_chunks(shard)
+            self._send(shard, CLOSE)
+        stats = self._wait_for(CLOSE)
+        for process in self._processes:
+            process.join()
+        return merge_write_stats(stats)
+
+    def terminate(self) -> None:
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+    def _send_chunks(self, shard: int, stream: Optional[str] = None) -> None:
+        chunks = self._chunks[shard]
+        for name in list(chunks) if stream is None else [stream]:
+            if name in chunks:
+                self._send(shard, RECORDS, name, chunks.pop(name))
+
+    def _send(
+        self,
+        shard: int,
+        command: str,
+        stream: Optional[str] = None,
+        payload: Any = None,
+    ) -> None:
+        # a full inbox means the shard is busy, unless it has failed
+        while True:
+            try:
+                self._inboxes[shard].put(
+                    (command, stream, payload), timeout=SHARD_POLL_INTERVAL
+                )
+                return
+            except queue.Full:
+                self._raise_for_failed_shards()
+
+    def _wait_for(self, command: str) -> list[Any]:
+        replies: dict[int, Any] = {}
+        while len(replies) < self.shards:
+            try:
+                shard, reply, payload = self._outbox.get(timeout=SHARD_POLL_INTERVAL)
+            except queue.Empty:
+                self._raise_for_failed_shards()
+                continue
+            if reply == ERROR:
+                raise RuntimeError(f"Shard {shard} failed: {payload}")
+            replies[shard] = payload
+        return [replies[shard] for shard in range(self.shards)]
+
+    def _raise_for_failed_shards(self) -> None:
+        for shard, process in enumerate(self._processes):
+            if process.exitcode not in (None, 0):
+                error = f"exited with code {process.exitcode}"
+                # prefer the error the shard reported right before exiting
+                try:
+                    _, reply, payload = self._outbox.get(timeout=SHARD_POLL_INTERVAL)
+                except queue.Empty:
+                    pass
+                else:
+                    if reply == ERROR:
+                        error = payload
+                raise RuntimeError(f"Shard {shard} failed: {error}")
@@ -0,0 +1,84 @@
+import json
+import os
+import threading
+
+from .batch import DataValueBatch
+from .constants import SHARD_SPOOL_PREFIX, SPOOL_SEGMENT_SUFFIX
+
+
+def spool_directories(path: str) -> list[str]:
+    # the spool at `path` and that of every shard that spooled under it
+    if not os.path.isdir(path):
+        return []
+    return [path] + sorted(
+        os.path.join(path, name)
+        for name in os.listdir(path)
+        if name.startswith(SHARD_SPOOL_PREFIX)
+        and os.path.isdir(os.path.join(path, name))
+    )
+
+
+class Spool:
+    """
+    Write-ahead spool of the batches handed to the flush workers.
+
+    Every batch is written to its own segment file in `directory` and
+    fsynced once, before it is queued for import, and the segment is removed
+    once DHIS2 has acknowledged the batch. Segments left behind by a crashed
+    sync are imported again by the next one, oldest first.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        existing = self.segments()
+        self._sequence = (
+            int(os.path.basename(existing[-1])[: -len(SPOOL_SEGMENT_SUFFIX)]) + 1
+            if existing
+            else 0
+        )
+
+    def segments(self) -> list[str]:
+        # zero padded sequence numbers sort in the order they were written
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(SPOOL_SEGMENT_SUFFIX)
+        )
+
+    def write(self, batch: DataValueBatch) -> str:
+        with self._lock:
+            sequence = self._sequence
+            self._sequence += 1
+        segment = os.path.join(self.directory, f"{sequence:012d}{SPOOL_SEGMENT_SUFFIX}")
+        # a segment only appears under its final name once fully on disk
+        tmp_path = f"{segment}.tmp"
+        with open(tmp_path, "w") as f:
+            for row in batch.rows():
+                f.write(json.dumps(row))
+                f.write("\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, segment)
+        self._sync_directory()
+        return segment
+
+    def read(self, segment: str) -> DataValueBatch:
+        with open(segment) as f:
+            rows = [json.loads(line) for line in f]
+        batch = DataValueBatch(max(len(rows), 1))
+        for row in rows:
+            batch.append(*row)
+        return batch
+
+    def release(self, segment: str) -> None:
+        os.remove(segment)
+
+    def _sync_directory(self) -> None:
+        # makes the new directory entry itself durable
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
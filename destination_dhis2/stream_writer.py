@@ -0,0 +1,117 @@
+from typing import Any, Mapping, Optional, TypedDict, Union
+
+from airbyte_cdk.models import (  # type: ignore # see this https://github.com/airbytehq/airbyte/pull/22963
+    ConfiguredAirbyteStream,
+)
+
+from .batch import DataValueBatch
+from .client import Dhis2Client
+from .constants import STREAM_OPTIONS_KEY
+from .mapping import FieldRule, RecordMapping, compile_mapping
+
+
+class StreamOptions(TypedDict, total=False):
+    # number of records buffered before the batch is submitted,
+    # defaults to the client's, possibly adaptive, batch size
+    batch_size: int
+    # DataValue field -> record field, unmapped fields keep their name
+    field_mapping: dict[str, str]
+    # DataValue field -> record field or FieldRule, overrides field_mapping
+    mapping: dict[str, Union[str, FieldRule]]
+
+
+def stream_mapping(options: StreamOptions) -> RecordMapping:
+    return {**options.get("field_mapping", {}), **options.get("mapping", {})}
+
+
+class StreamWriter:
+    """
+    Buffers the records of one stream and submits them to the shared client
+    whenever the stream's own batch is full. Streams without a fixed
+    `batch_size` follow the client's batch size.
+
+    Records are converted to data values by the stream's mapping, compiled
+    once, and records it cannot convert are sent to the client's dead
+    letters instead of the buffer. So are records that DHIS2 would reject,
+    when the client has loaded a metadata index.
+    With a change store, records whose value DHIS2 already holds are skipped.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        client: Dhis2Client,
+        batch_size: Optional[int] = None,
+        field_mapping: Optional[Mapping[str, str]] = None,
+        mapping: Optional[RecordMapping] = None,
+    ):
+        try:
+            self._map = compile_mapping({**(field_mapping or {}), **(mapping or {})})
+        except ValueError as e:
+            raise ValueError(f"Stream {name} has an invalid mapping: {e}") from e
+
+        self.name = name
+        self.client = client
+        self._batch_size = batch_size
+        self.coalesce = client.coalesce_duplicates
+        self.buffer = DataValueBatch(self.batch_size, coalesce=self.coalesce)
+        self.metadata = client.metadata
+        self.change_store = client.change_store
+        self.invalid_count = 0
+        self.unchanged_count = 0
+        self.submitted_batches = 0
+
+    @classmethod
+    def from_configured_stream(
+        cls, configured_stream: ConfiguredAirbyteStream, client: Dhis2Client
+    ) -> "StreamWriter":
+        # options are read from the stream's json schema, e.g.
+        # {"dhis2": {"batch_size": 500, "field_mapping": {"orgUnit": "facility"}}}
+        stream = configured_stream.stream
+        options: StreamOptions = (stream.json_schema or {}).get(STREAM_OPTIONS_KEY, {})
+        return cls(
+            name=stream.name,
+            client=client,
+            batch_size=options.get("batch_size"),
+            field_mapping=options.get("field_mapping"),
+            mapping=options.get("mapping"),
+        )
+
+    @property
+    def batch_size(self) -> int:
+        return self._batch_size or self.client.batch_size
+
+    def write(self, record: Mapping[str, Any]) -> None:
+        try:
+            row = self._map(record)
+        except ValueError as e:
+            self._reject(record, str(e))
+            return
+        if self.metadata is not None:
+            data_element, _, period, org_unit = row[:4]
+            reason = self.metadata.validate(data_element, period, org_unit)
+            if reason is not None:
+                self._reject(record, reason)
+                return
+
+        # a value sent for the key earlier in the sync must still be replaced,
+        # even by the value DHIS2 held before
+        if self.change_store is not None and self.change_store.is_unchanged(*row):
+            self.unchanged_count += 1
+            return
+
+        self.buffer.append(*row)
+        if len(self.buffer) >= self.batch_size:
+            self.submit()
+
+    def _reject(self, record: Mapping[str, Any], reason: str) -> None:
+        self.invalid_count += 1
+        self.client.dead_letters.put([(record, reason)])
+
+    def submit(self) -> None:
+        if len(self.buffer) > 0:
+            batch, self.buffer = self.buffer, DataValueBatch(
+                self.batch_size, coalesce=self.coalesce
+            )
+            self.client.submit(batch)
+            self.submitted_batches += 1
@@ -0,0 +1,254 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Iterable, Optional, TypedDict
+
+from .constants import LATENCY_BUCKETS, METRICS_INTERVAL
+
+airbyteLogger = logging.getLogger("airbyte")
+
+PROMETHEUS_PREFIX = "dhis2_destination"
+
+
+class HistogramSnapshot(TypedDict):
+    # cumulative counts per upper bound, the last bound is +Inf
+    buckets: list[int]
+    count: int
+    sum: float
+
+
+class MetricsSnapshot(TypedDict):
+    elapsed: float
+    records: int
+    records_per_second: float
+    values: int
+    values_per_second: float
+    bytes_sent: int
+    batches: int
+    failed_batches: int
+    batch_latency: HistogramSnapshot
+    batch_latency_p50: Optional[float]
+    batch_latency_p95: Optional[float]
+    token_refreshes: int
+    retries: int
+    queue_depth: int
+    max_queue_depth: int
+
+
+class LatencyHistogram:
+    """
+    Counts observations per bucket of `bounds` seconds, the same way a
+    Prometheus histogram does, so quantiles can be estimated cheaply.
+    """
+
+    def __init__(self, bounds: Iterable[float] = LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        # the last bucket catches everything above the highest bound
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        for i, bound in enumerate(self.bounds):
+            if seconds <= bound:
+                break
+        else:
+            i = len(self.bounds)
+        self.counts[i] += 1
+        self.sum += seconds
+
+    def snapshot(self) -> HistogramSnapshot:
+        cumulative, total = [], 0
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return {"buckets": cumulative, "count": total, "sum": self.sum}
+
+
+def quantile(
+    histogram: HistogramSnapshot,
+    q: float,
+    bounds: tuple[float, ...] = LATENCY_BUCKETS,
+) -> Optional[float]:
+    # the upper bound of the bucket holding the q-th observation
+    if histogram["count"] == 0:
+        return None
+    rank = q * histogram["count"]
+    for bound, cumulative in zip(bounds + (math.inf,), histogram["buckets"]):
+        if cumulative >= rank:
+            return bound
+    return math.inf
+
+
+class SyncMetrics:
+    """
+    Throughput, payload and latency counters of a sync. Batches are recorded
+    by the flush workers, records by the thread reading input.
+    """
+
+    def __init__(self, interval: float = METRICS_INTERVAL):
+        self.interval = interval
+        self.started_at = time.monotonic()
+        self.records = 0
+        self.values = 0
+        self.bytes_sent = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.max_queue_depth = 0
+        self.batch_latency = LatencyHistogram()
+        self._reported_at = self.started_at
+        self._lock = threading.Lock()
+
+    def record_batch(
+        self, values: int, payload_bytes: int, latency: float, failed: bool
+    ) -> None:
+        with self._lock:
+            self.batches += 1
+            self.batch_latency.observe(latency)
+            if failed:
+                self.failed_batches += 1
+            else:
+                self.values += values
+                self.bytes_sent += payload_bytes
+
+    def record_queue_depth(self, depth: int) -> None:
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def due(self) -> bool:
+        # whether the next periodic report is due, resetting the timer if so
+        now = time.monotonic()
+        if now - self._reported_at < self.interval:
+            return False
+        self._reported_at = now
+        return True
+
+    def snapshot(
+        self, token_refreshes: int = 0, retries: int = 0, queue_depth: int = 0
+    ) -> MetricsSnapshot:
+        with self._lock:
+            elapsed = max(time.monotonic() - self.started_at, 1e-9)
+            latency = self.batch_latency.snapshot()
+            return {
+                "elapsed": round(elapsed, 3),
+                "records": self.records,
+                "records_per_second": round(self.records / elapsed, 1),
+                "values": self.values,
+                "values_per_second": round(self.values / elapsed, 1),
+                "bytes_sent": self.bytes_sent,
+                "batches": self.batches,
+                "failed_batches": self.failed_batches,
+                "batch_latency": latency,
+                "batch_latency_p50": quantile(latency, 0.5),
+                "batch_latency_p95": quantile(latency, 0.95),
+                "token_refreshes": token_refreshes,
+                "retries": retries,
+                "queue_depth": queue_depth,
+                "max_queue_depth": max(self.max_queue_depth, queue_depth),
+            }
+
+
+def merge_metrics(snapshots: Iterable[MetricsSnapshot]) -> MetricsSnapshot:
+    # snapshots of processes running side by side, rates add up
+    snapshots = list(snapshots)
+    elapsed = max(max((s["elapsed"] for s in snapshots), default=0), 1e-9)
+    buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+    for snapshot in snapshots:
+        for i, count in enumerate(snapshot["batch_latency"]["buckets"]):
+            buckets[i] += count
+    latency: HistogramSnapshot = {
+        "buckets": buckets,
+        "count": sum(s["batch_latency"]["count"] for s in snapshots),
+        "sum": sum(s["batch_latency"]["sum"] for s in snapshots),
+    }
+    records = sum(snapshot["records"] for snapshot in snapshots)
+    values = sum(snapshot["values"] for snapshot in snapshots)
+    return {
+        "elapsed": elapsed,
+        "records": records,
+        "records_per_second": round(records / elapsed, 1),
+        "values": values,
+        "values_per_second": round(values / elapsed, 1),
+        "bytes_sent": sum(snapshot["bytes_sent"] for snapshot in snapshots),
+        "batches": sum(snapshot["batches"] for snapshot in snapshots),
+        "failed_batches": sum(snapshot["failed_batches"] for snapshot in snapshots),
+        "batch_latency": latency,
+        "batch_latency_p50": quantile(latency, 0.5),
+        "batch_latency_p95": quantile(latency, 0.95),
+        "token_refreshes": sum(s["token_refreshes"] for s in snapshots),
+        "retries": sum(snapshot["retries"] for snapshot in snapshots),
+        "queue_depth": sum(snapshot["queue_depth"] for snapshot in snapshots),
+        "max_queue_depth": sum(s["max_queue_depth"] for s in snapshots),
+    }
+
+
+def log_metrics(snapshot: MetricsSnapshot, final: bool = False) -> None:
+    # one JSON document per line, so log pipelines can parse it
+    summary = {key: value for key, value in snapshot.items() if key != "batch_latency"}
+    airbyteLogger.info(
+        f"DHIS2 sync {'summary' if final else 'metrics'}: {json.dumps(summary)}"
+    )
+
+
+def to_prometheus(snapshot: MetricsSnapshot) -> str:
+    """
+    https://prometheus.io/docs/instrumenting/exposition_formats/#text-based-format
+    """
+
+    lines = []
+
+    def metric(name: str, kind: str, help: str, value: float) -> None:
+        lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help}")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {kind}")
+        lines.append(f"{PROMETHEUS_PREFIX}_{name} {value}")
+
+    metric(
+        "records_total", "counter", "Records read from the source", snapshot["records"]
+    )
+    metric("values_total", "counter", "Data values imported", snapshot["values"])
+    metric(
+        "bytes_sent_total",
+        "counter",
+        "Payload bytes of imported batches",
+        snapshot["bytes_sent"],
+    )
+    metric("batches_total", "counter", "Batches sent", snapshot["batches"])
+    metric(
+        "failed_batches_total",
+        "counter",
+        "Batches that failed",
+        snapshot["failed_batches"],
+    )
+    metric(
+        "token_refreshes_total",
+        "counter",
+        "Access token refreshes",
+        snapshot["token_refreshes"],
+    )
+    metric("retries_total", "counter", "Retried requests", snapshot["retries"])
+    metric(
+        "queue_depth", "gauge", "Batches waiting or in flight", snapshot["queue_depth"]
+    )
+    metric(
+        "elapsed_seconds", "gauge", "Duration of the sync so far", snapshot["elapsed"]
+    )
+
+    name = f"{PROMETHEUS_PREFIX}_batch_latency_seconds"
+    latency = snapshot["batch_latency"]
+    lines.append(f"# HELP {name} Latency of batch imports")
+    lines.append(f"# TYPE {name} histogram")
+    for bound, count in zip(LATENCY_BUCKETS + (math.inf,), latency["buckets"]):
+        le = "+Inf" if bound == math.inf else repr(float(bound))
+        lines.append(f'{name}_bucket{{le="{le}"}} {count}')
+    lines.append(f"{name}_sum {latency['sum']}")
+    lines.append(f"{name}_count {latency['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(snapshot: MetricsSnapshot, path: str) -> None:
+    # replaced atomically, e.g. for node_exporter's textfile collector
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(to_prometheus(snapshot))
+    os.replace(tmp_path, path)
@@ -0,0 +1,209 @@
+import logging
+import re
+import threading
+import time
+from typing import Callable, Optional, TypedDict
+
+import pendulum
+
+from .constants import GOVERNOR_LATENCY_FACTOR
+
+airbyteLogger = logging.getLogger("airbyte")
+
+TIME_PATTERN = re.compile(r"^([01]\d|2[0-3]):[0-5]\d$")
+
+# the fastest batch seen stops counting as the baseline at this rate per batch,
+# so the governor adapts to a server that became permanently slower
+BASELINE_DRIFT = 1.01
+
+
+class RateLimitWindow(TypedDict, total=False):
+    # HH:MM in the rate limit timezone, a window may wrap around midnight
+    start: str
+    end: str
+    # ISO weekdays the window applies on, 1 is Monday, every day by default
+    days: list[int]
+    requests_per_second: float
+    values_per_second: float
+
+
+class TokenBucket:
+    """
+    Hands out `rate` tokens per second, up to `burst` at once. Taking more
+    tokens than are available goes into debt, so the caller and whoever comes
+    after it sleep until the bucket has refilled.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1) -> float:
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= amount
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+        if delay > 0:
+            self._sleep(delay)
+        return delay
+
+
+class RateLimiter:
+    """
+    Caps requests and data values per second. Limits can differ per time
+    window, e.g. tighter during office hours, the first matching window wins
+    and outside of them `requests_per_second` and `values_per_second` apply.
+    No limit is applied where neither sets one.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: Optional[float] = None,
+        values_per_second: Optional[float] = None,
+        windows: Optional[list[RateLimitWindow]] = None,
+        timezone: str = "UTC",
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        for window in windows or []:
+            if not (
+                TIME_PATTERN.match(window.get("start", ""))
+                and TIME_PATTERN.match(window.get("end", ""))
+            ):
+                raise ValueError(f"Invalid rate limit window: {window}")
+        rates = [requests_per_second, values_per_second]
+        for window in windows or []:
+            rates += [
+                window.get("requests_per_second"),
+                window.get("values_per_second"),
+            ]
+        if any(rate is not None and rate <= 0 for rate in rates):
+            raise ValueError("Rate limits must be positive")
+        self.requests_per_second = requests_per_second
+        self.values_per_second = values_per_second
+        self.windows = windows or []
+        self.timezone = pendulum.timezone(timezone)
+        self._sleep = sleep
+        self._buckets: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def limits(
+        self, now: Optional[pendulum.DateTime] = None
+    ) -> tuple[Optional[float], Optional[float]]:
+        # requests and values per second at `now`
+        now = now or pendulum.now(self.timezone)
+        time_of_day = now.format("HH:mm")
+        for window in self.windows:
+            if now.isoweekday() not in window.get("days", range(1, 8)):
+                continue
+            start, end = window["start"], window["end"]
+            if (
+                start <= time_of_day < end
+                if start <= end
+                else time_of_day >= start or time_of_day < end
+            ):
+                return (
+                    window.get("requests_per_second"),
+                    window.get("values_per_second"),
+                )
+        return self.requests_per_second, self.values_per_second
+
+    def _bucket(self, name: str, rate: Optional[float]) -> Optional[TokenBucket]:
+        if rate is None:
+            return None
+        with self._lock:
+            bucket = self._buckets.get(name)
+            if bucket is None:
+                bucket = self._buckets[name] = TokenBucket(rate, sleep=self._sleep)
+            elif bucket.rate != rate:
+                # a new window started
+                bucket.rate = rate
+                bucket.burst = max(rate, 1)
+            return bucket
+
+    def acquire_request(self) -> None:
+        # blocks until another request may be sent
+        bucket = self._bucket("requests", self.limits()[0])
+        if bucket is not None:
+            bucket.acquire()
+
+    def acquire_values(self, values: int) -> None:
+        # blocks until `values` more data values may be sent
+        bucket = self._bucket("values", self.limits()[1])
+        if bucket is not None:
+            bucket.acquire(values)
+
+
+class ConcurrencyGovernor:
+    """
+    Bounds the batches being imported at once with additive increase,
+    multiplicative decrease: the limit starts at one and grows by one per
+    `limit` successful imports up to `max_concurrency`, and halves whenever
+    an import fails with a server error or takes `latency_factor` times
+    longer per value than the fastest recent import.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        latency_factor: float = GOVERNOR_LATENCY_FACTOR,
+    ):
+        self.max_concurrency = max_concurrency
+        self.latency_factor = latency_factor
+        self.limit = 1
+        # successful imports since the limit last changed
+        self._successes = 0
+        self._in_flight = 0
+        # seconds per value of the fastest recent import
+        self._baseline: Optional[float] = None
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self, latency: float, values: int, failed: bool) -> None:
+        with self._condition:
+            self._in_flight -= 1
+            per_value = latency / max(values, 1)
+            if not failed:
+                self._baseline = (
+                    per_value
+                    if self._baseline is None
+                    else min(per_value, self._baseline * BASELINE_DRIFT)
+                )
+            overloaded = failed or (
+                self._baseline is not None
+                and per_value > self._baseline * self.latency_factor
+            )
+            previous = self.limit
+            if overloaded:
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+            else:
+                self._successes += 1
+                if self._successes >= self.limit:
+                    self.limit = min(self.max_concurrency, self.limit + 1)
+                    self._successes = 0
+            if self.limit != previous:
+                airbyteLogger.info(
+                    f"{'Decreasing' if overloaded else 'Increasing'} concurrent"
+                    f" imports from {previous} to {self.limit}"
+                )
+            self._condition.notify_all()
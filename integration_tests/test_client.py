@@ -1,11 +1,29 @@
+import gzip
+import json
+import time
+from pathlib import Path
+from typing import Any, cast
+from unittest.mock import patch
+
+import pytest
+from requests.exceptions import ConnectionError, HTTPError, RequestException
 from requests_mock import Mocker
+from requests_mock.adapter import _Matcher
+from requests_mock.request import _RequestObjectProxy
 
 from destination_dhis2 import DataValues, Dhis2Client
-from destination_dhis2.constants import DATA_VALUE_SETS_PATH
+from destination_dhis2.constants import (
+    DATA_VALUE_SETS_PATH,
+    IMPORT_JOB_TYPE,
+    PAGE_SIZE,
+    SYSTEM_TASKS_PATH,
+    TASK_SUMMARIES_PATH,
+)
+from destination_dhis2.stream_writer import StreamWriter
 
 
 def test_dhis2_client(
-    config: dict[str, str],
+    config: dict[str, Any],
     base_url: str,
     requests_mock: Mocker,
     token_refresh_endpoint: str,
@@ -42,8 +60,733 @@ def test_dhis2_client(
     for data_value in data_values:
         client.queue_write_operation(data_value)
     assert len(client.write_buffer) == 2
-    assert client.write_buffer == data_values
+    assert list(client.write_buffer) == data_values
     assert client.buffer_is_full() is False
 
     client.flush()
     assert len(client.write_buffer) == 0
+
+
+def test_dhis2_client_retries_unauthorized(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+) -> None:
+    client = Dhis2Client(**config)
+    some_endpoint = "/some/endpoint"
+
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        response_list=[
+            {"json": {"access_token": "revoked", "expires_in": 43199}},
+            {"json": {"access_token": "fresh", "expires_in": 43199}},
+        ],
+    )
+    requests_mock.get(
+        url=client._join_url_fragments(some_endpoint),
+        response_list=[{"status_code": 401}, {"text": "request succeeded"}],
+    )
+
+    response = client.request("GET", some_endpoint)
+    assert response.text == "request succeeded"
+    assert (
+        cast(_RequestObjectProxy, requests_mock.last_request).headers["Authorization"]
+        == "Bearer fresh"
+    )
+    assert requests_mock.call_count == 4
+
+    # the refreshed token is reused for subsequent requests
+    client.request("GET", some_endpoint)
+    assert requests_mock.call_count == 5
+
+
+def test_dhis2_client_concurrent_flush(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+) -> None:
+    client = Dhis2Client(**config, max_concurrent_requests=3)
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    data_value_sets = requests_mock.post(
+        url=client._join_url_fragments(DATA_VALUE_SETS_PATH), text="ok"
+    )
+
+    for data_value in data_values * 5:
+        client.queue_write_operation(data_value)
+        client.submit()
+    assert len(client.write_buffer) == 0
+    assert len(client._pending) <= 3
+
+    client.flush()
+    assert len(client._pending) == 0
+    assert data_value_sets.call_count == 10
+    client.close()
+
+
+def test_dhis2_client_concurrent_flush_fail(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+) -> None:
+    client = Dhis2Client(**config, max_concurrent_requests=2)
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    requests_mock.post(
+        url=client._join_url_fragments(DATA_VALUE_SETS_PATH), status_code=500
+    )
+
+    client.queue_write_operation(data_values[0])
+    # failures of in-flight batches surface on the next flush
+    client.submit()
+    with pytest.raises(HTTPError) as exc_info:
+        client.flush()
+    assert "500 Server Error" in str(exc_info.value)
+    client.close()
+
+
+def test_dhis2_client_retries_batch_write(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+) -> None:
+    client = Dhis2Client(**config)
+    client.retry_policy.backoff_cap = 0
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    data_value_sets = requests_mock.post(
+        url=client._join_url_fragments(DATA_VALUE_SETS_PATH),
+        response_list=[{"status_code": 502}, {"exc": ConnectionError}, {"text": "ok"}],
+    )
+
+    for data_value in data_values:
+        client.queue_write_operation(data_value)
+    client.flush()
+    assert data_value_sets.call_count == 3
+    assert client.retry_policy.retries == 2
+    client.close()
+
+
+def test_dhis2_client_adaptive_batching(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+) -> None:
+    client = Dhis2Client(
+        **config, adaptive_batching=True, min_batch_size=1, max_batch_size=1000
+    )
+    assert client.batch_size == PAGE_SIZE
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    requests_mock.post(
+        url=client._join_url_fragments(DATA_VALUE_SETS_PATH), status_code=409
+    )
+
+    client.queue_write_operation(data_values[0])
+    with pytest.raises(HTTPError):
+        client.flush()
+    # the failed import halved the batch size
+    assert client.batch_size == PAGE_SIZE // 2
+    assert client.batch_sizer is not None
+    assert client.batch_sizer.bytes_per_value is not None
+    client.close()
+
+
+def test_dhis2_client_adaptive_batching_conflicts(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+) -> None:
+    client = Dhis2Client(
+        **config, adaptive_batching=True, min_batch_size=1, max_batch_size=1000
+    )
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    requests_mock.post(
+        url=client._join_url_fragments(DATA_VALUE_SETS_PATH),
+        status_code=409,
+        json={
+            "status": "WARNING",
+            "importCount": {"imported": 1, "ignored": 1},
+            "conflicts": [
+                {"object": "Psxm301oJH1", "value": "Value not valid", "indexes": [0]}
+            ],
+        },
+    )
+
+    for _ in range(3):
+        for data_value in data_values:
+            client.queue_write_operation(data_value)
+        client.flush()
+    # conflicts in the data are not failed imports
+    assert client.batch_size == PAGE_SIZE
+    assert client.metrics.failed_batches == 0
+    assert client.metrics.values == 3 * len(data_values)
+    assert client.import_count["imported"] == 3
+    client.close()
+
+
+def test_dhis2_client_chunked_requests(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+) -> None:
+    client = Dhis2Client(**config, chunked_requests=True)
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    data_value_sets = requests_mock.post(
+        url=client._join_url_fragments(DATA_VALUE_SETS_PATH), text="ok"
+    )
+
+    client._batch_write(data_values)
+    request = cast(_RequestObjectProxy, data_value_sets.last_request)
+    assert request.headers["Transfer-Encoding"] == "chunked"
+    assert json.loads(b"".join(request.body)) == {"dataValues": data_values}
+    client.close()
+
+
+def test_dhis2_client_compressed_csv(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+) -> None:
+    client = Dhis2Client(**config, payload_format="csv", compress_requests=True)
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    data_value_sets = requests_mock.post(
+        url=client._join_url_fragments(DATA_VALUE_SETS_PATH), text="ok"
+    )
+
+    client._batch_write(data_values)
+    request = cast(_RequestObjectProxy, data_value_sets.last_request)
+    assert request.headers["Content-Type"] == "application/csv"
+    assert request.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(request.body).decode().splitlines() == [
+        "dataelement,period,orgunit,categoryoptioncombo,attributeoptioncombo,value",
+        "Psxm301oJH1,202204,i6724gjuOkw,,,12",
+        "Yt0klR6lDPn,202204,i6724gjuOkw,,,14",
+    ]
+    client.close()
+
+
+def test_dhis2_client_resubmits_accepted_values(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+    tmp_path: Path,
+) -> None:
+    dead_letter_path = tmp_path / "rejected.jsonl"
+    client = Dhis2Client(**config, dead_letter_path=str(dead_letter_path))
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    data_value_sets = requests_mock.post(
+        url=client._join_url_fragments(DATA_VALUE_SETS_PATH),
+        response_list=[
+            # an atomic import rejects the whole batch over one conflict
+            {
+                "status_code": 409,
+                "json": {
+                    "status": "ERROR",
+                    "response": {
+                        "status": "ERROR",
+                        "importCount": {"imported": 0, "ignored": 2},
+                        "conflicts": [
+                            {
+                                "object": "Psxm301oJH1",
+                                "value": "Data element not found",
+                                "indexes": [0],
+                            }
+                        ],
+                    },
+                },
+            },
+            {
+                "json": {
+                    "status": "OK",
+                    "response": {"status": "SUCCESS", "importCount": {"imported": 1}},
+                }
+            },
+        ],
+    )
+
+    for data_value in data_values:
+        client.queue_write_operation(data_value)
+    client.flush()
+
+    # only the value that was not at fault is sent again
+    assert data_value_sets.call_count == 2
+    assert cast(_RequestObjectProxy, data_value_sets.last_request).json() == {
+        "dataValues": data_values[1:]
+    }
+    assert client.import_count == {
+        "imported": 1,
+        "updated": 0,
+        "ignored": 1,
+        "deleted": 0,
+    }
+    assert client.dead_letters.count == 1
+    assert [json.loads(line) for line in dead_letter_path.read_text().splitlines()] == [
+        {"dataValue": data_values[0], "reason": "Data element not found"}
+    ]
+    client.close()
+
+
+def test_dhis2_client_import_error(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+) -> None:
+    client = Dhis2Client(**config)
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    requests_mock.post(
+        url=client._join_url_fragments(DATA_VALUE_SETS_PATH),
+        json={
+            "status": "ERROR",
+            "description": "Data set not found or not accessible",
+            "importCount": {"ignored": 2},
+        },
+    )
+
+    for data_value in data_values:
+        client.queue_write_operation(data_value)
+    # errors that cannot be traced back to values fail the batch
+    with pytest.raises(RequestException) as exc_info:
+        client.flush()
+    assert "Data set not found or not accessible" in str(exc_info.value)
+    client.close()
+
+
+def test_dhis2_client_import_params(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+    tmp_path: Path,
+) -> None:
+    client = Dhis2Client(
+        **config,
+        import_strategy="CREATE",
+        skip_existing_check=True,
+        org_unit_id_scheme="CODE",
+        dry_run=True,
+        change_store_path=str(tmp_path / "changes.sqlite"),
+    )
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    data_value_sets = requests_mock.post(
+        url=client._join_url_fragments(DATA_VALUE_SETS_PATH),
+        json={"status": "SUCCESS", "importCount": {"imported": 2}},
+    )
+
+    for data_value in data_values:
+        client.queue_write_operation(data_value)
+    client.flush()
+    assert cast(_RequestObjectProxy, data_value_sets.last_request).qs == {
+        "importstrategy": ["create"],
+        "skipexistingcheck": ["true"],
+        "orgunitidscheme": ["code"],
+        "dryrun": ["true"],
+    }
+    # nothing was saved, so nothing may be skipped next time
+    assert client.change_store is not None
+    data_value = data_values[0]
+    assert not client.change_store.is_unchanged(
+        data_value["dataElement"],
+        data_value["completeDate"],
+        data_value["period"],
+        data_value["orgUnit"],
+        data_value["value"],
+    )
+    client.close()
+
+
+def test_dhis2_client_skips_unchanged_values(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+    tmp_path: Path,
+) -> None:
+    change_store_path = str(tmp_path / "changes.sqlite")
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    data_value_sets = requests_mock.post(
+        url=Dhis2Client(**config)._join_url_fragments(DATA_VALUE_SETS_PATH),
+        json={
+            "status": "WARNING",
+            "importCount": {"imported": 1, "ignored": 1},
+            "conflicts": [
+                {"object": "Psxm301oJH1", "value": "Period is locked", "indexes": [0]}
+            ],
+        },
+    )
+
+    for _ in range(2):
+        client = Dhis2Client(**config, change_store_path=change_store_path)
+        writer = StreamWriter("dataElements", client)
+        for data_value in data_values:
+            writer.write(data_value)
+        writer.submit()
+        client.flush()
+        client.close()
+
+    # the rejected value is sent again, the imported one is not
+    assert data_value_sets.call_count == 2
+    assert data_value_sets.request_history[0].json() == {"dataValues": data_values}
+    assert cast(_RequestObjectProxy, data_value_sets.last_request).json() == {
+        "dataValues": data_values[:1]
+    }
+
+
+def test_dhis2_client_async_imports(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+) -> None:
+    client = Dhis2Client(**config, async_imports=True)
+    assert client.import_jobs is not None
+    client.import_jobs.sleep = lambda _: None
+    data_value_sets, tasks = _mock_import_job(
+        requests_mock, client, token_refresh_endpoint, sample_access_token
+    )
+
+    for data_value in data_values:
+        client.queue_write_operation(data_value)
+    # flushing waits until the job has completed
+    client.flush()
+    assert cast(_RequestObjectProxy, data_value_sets.last_request).qs == {
+        "async": ["true"]
+    }
+    assert tasks.call_count == 2
+    assert client.import_count["imported"] == 2
+    client.close()
+
+
+def test_dhis2_client_async_imports_adaptive_batching(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+) -> None:
+    client = Dhis2Client(**config, async_imports=True, adaptive_batching=True)
+    assert client.import_jobs is not None and client.batch_sizer is not None
+    # each poll of the job status takes 0.1 seconds
+    client.import_jobs.sleep = lambda _: time.sleep(0.1)
+    _mock_import_job(requests_mock, client, token_refresh_endpoint, sample_access_token)
+
+    with patch.object(client.batch_sizer, "record") as record:
+        for data_value in data_values:
+            client.queue_write_operation(data_value)
+        client.flush()
+    # the batch is timed until its job completed, not only the POST queueing it
+    assert record.call_args.kwargs["latency"] >= 0.2
+    client.close()
+
+
+def _mock_import_job(
+    requests_mock: Mocker,
+    client: Dhis2Client,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+) -> tuple[_Matcher, _Matcher]:
+    # an import queued as a job that completes on the second status poll
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    data_value_sets = requests_mock.post(
+        url=client._join_url_fragments(DATA_VALUE_SETS_PATH),
+        json={
+            "status": "OK",
+            "response": {"id": "YR1UxOUXmzT", "jobType": IMPORT_JOB_TYPE},
+        },
+    )
+    tasks = requests_mock.get(
+        url=client._join_url_fragments(f"{SYSTEM_TASKS_PATH}/{IMPORT_JOB_TYPE}"),
+        response_list=[
+            {"json": {"YR1UxOUXmzT": [{"completed": False}]}},
+            {"json": {"YR1UxOUXmzT": [{"completed": True}]}},
+        ],
+    )
+    requests_mock.get(
+        url=client._join_url_fragments(
+            f"{TASK_SUMMARIES_PATH}/{IMPORT_JOB_TYPE}/YR1UxOUXmzT"
+        ),
+        json={"status": "SUCCESS", "importCount": {"imported": 2}},
+    )
+    return data_value_sets, tasks
+
+
+def test_dhis2_client_resumes_spool(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+    tmp_path: Path,
+) -> None:
+    spool_path = str(tmp_path / "spool")
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    data_value_sets = requests_mock.post(
+        url=Dhis2Client(**config)._join_url_fragments(DATA_VALUE_SETS_PATH),
+        response_list=[
+            {"status_code": 500},
+            {"json": {"status": "SUCCESS", "importCount": {"imported": 2}}},
+        ],
+    )
+
+    client = Dhis2Client(**config, spool_path=spool_path)
+    for data_value in data_values:
+        client.queue_write_operation(data_value)
+    # spooled values are durable before they are imported,
+    # and stay so when the import fails
+    client.submit()
+    assert client.spool is not None
+    assert len(client.spool.segments()) == 1
+    with pytest.raises(HTTPError):
+        client.flush()
+    client.close()
+
+    # the next sync imports the batch the failed one left behind
+    client = Dhis2Client(**config, spool_path=spool_path)
+    assert client.resume_spool() == 1
+    client.flush()
+    assert client.spool is not None
+    assert client.spool.segments() == []
+    assert data_value_sets.call_count == 2
+    assert cast(_RequestObjectProxy, data_value_sets.last_request).json() == {
+        "dataValues": data_values
+    }
+    client.close()
+
+
+def test_dhis2_client_dead_letters_rejected_spooled_batch(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+    tmp_path: Path,
+) -> None:
+    spool_path = str(tmp_path / "spool")
+    dead_letter_path = tmp_path / "dead_letters.jsonl"
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    data_value_sets = requests_mock.post(
+        url=Dhis2Client(**config)._join_url_fragments(DATA_VALUE_SETS_PATH),
+        response_list=[
+            {"status_code": 400, "json": {"status": "ERROR", "message": "Bad"}},
+            {"json": {"status": "SUCCESS", "importCount": {"imported": 2}}},
+        ],
+    )
+
+    client = Dhis2Client(
+        **config, spool_path=spool_path, dead_letter_path=str(dead_letter_path)
+    )
+    for data_value in data_values:
+        client.queue_write_operation(data_value)
+    # a batch DHIS2 will never import does not stay in the spool
+    client.flush()
+    assert client.spool is not None
+    assert client.spool.segments() == []
+    assert client.dead_letters.count == 2
+    dead_letters = [
+        json.loads(line) for line in dead_letter_path.read_text().splitlines()
+    ]
+    assert [entry["dataValue"] for entry in dead_letters] == data_values
+    assert dead_letters[0]["reason"].startswith("Batch rejected: ")
+    client.close()
+
+    # so the next sync is not held up by it
+    client = Dhis2Client(**config, spool_path=spool_path)
+    assert client.resume_spool() == 0
+    for data_value in data_values:
+        client.queue_write_operation(data_value)
+    client.flush()
+    assert data_value_sets.call_count == 2
+    client.close()
+
+
+def test_dhis2_client_adaptive_concurrency(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+) -> None:
+    client = Dhis2Client(
+        **config,
+        adaptive_concurrency=True,
+        max_concurrent_requests=4,
+        values_per_second=1000,
+    )
+    assert client.governor is not None
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    requests_mock.post(
+        url=client._join_url_fragments(DATA_VALUE_SETS_PATH),
+        response_list=[
+            {"json": {"status": "SUCCESS", "importCount": {"imported": 1}}},
+            {"status_code": 500},
+        ],
+    )
+
+    client.queue_write_operation(data_values[0])
+    client.flush()
+    assert client.governor.limit == 2
+
+    # a server error halves the concurrency and releases the import's slot
+    client.queue_write_operation(data_values[1])
+    with pytest.raises(HTTPError):
+        client.flush()
+    assert client.governor.limit == 1
+    assert client.governor._in_flight == 0
+    client.close()
+
+
+def test_dhis2_client_groups_data_values(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+) -> None:
+    client = Dhis2Client(**config, group_data_values=True, min_group_size=2)
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    data_value_sets = requests_mock.post(
+        url=client._join_url_fragments(DATA_VALUE_SETS_PATH),
+        json={"status": "SUCCESS", "importCount": {"imported": 1}},
+    )
+
+    for data_element, org_unit in [("de2", "ouA"), ("de1", "ouB"), ("de1", "ouA")]:
+        client.queue_write_operation(
+            {
+                "dataElement": data_element,
+                "completeDate": "2022-06-03",
+                "period": "202204",
+                "orgUnit": org_unit,
+                "value": "1",
+            }
+        )
+    client.flush()
+
+    payloads = sorted(
+        (request.json() for request in data_value_sets.request_history),
+        key=lambda payload: len(payload["dataValues"]),
+    )
+    assert payloads == [
+        {
+            "period": "202204",
+            "orgUnit": "ouB",
+            "dataValues": [
+                {"dataElement": "de1", "completeDate": "2022-06-03", "value": "1"}
+            ],
+        },
+        {
+            "period": "202204",
+            "orgUnit": "ouA",
+            "dataValues": [
+                {"dataElement": "de1", "completeDate": "2022-06-03", "value": "1"},
+                {"dataElement": "de2", "completeDate": "2022-06-03", "value": "1"},
+            ],
+        },
+    ]
+    assert client.grouping["sets"] == 2
+    assert client.grouping["values"] == 3
+    # the batch of three values took two requests
+    assert client.grouping["extra_requests"] == 1
+    client.close()
+
+
+def test_dhis2_client_groups_data_values_adaptive_batching(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+) -> None:
+    client = Dhis2Client(
+        **config,
+        group_data_values=True,
+        min_group_size=2,
+        adaptive_batching=True,
+        max_batch_size=2 * PAGE_SIZE,
+    )
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    requests_mock.post(
+        url=client._join_url_fragments(DATA_VALUE_SETS_PATH),
+        json={"status": "SUCCESS", "importCount": {"imported": 1}},
+    )
+
+    for i in range(PAGE_SIZE):
+        client.queue_write_operation(
+            {
+                "dataElement": f"de{i}",
+                "completeDate": "2022-06-03",
+                "period": "202204",
+                "orgUnit": f"ou{i % 2}",
+                "value": "1",
+            }
+        )
+    client.flush()
+    # the full batch was sent as two smaller sets, which still grow it
+    assert client.grouping["sets"] == 2
+    assert client.batch_size > PAGE_SIZE
+    client.close()
@@ -1,18 +1,30 @@
 import json
-from typing import Any, Mapping, cast
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Iterator, Mapping, cast
 
 from airbyte_cdk.models import (  # type: ignore # see this https://github.com/airbytehq/airbyte/pull/22963
     AirbyteMessage,
+    AirbyteRecordMessage,
+    AirbyteStateMessage,
+    AirbyteStateType,
+    AirbyteStream,
+    AirbyteStreamState,
     ConfiguredAirbyteCatalog,
     ConfiguredAirbyteStream,
+    DestinationSyncMode,
+    StreamDescriptor,
+    SyncMode,
     Type,
 )
 from pytest import LogCaptureFixture, fixture
 from requests_mock import Mocker
 from requests_mock.request import _RequestObjectProxy
 
-from destination_dhis2 import DestinationDhis2, Dhis2Client
-from destination_dhis2.constants import DATA_VALUE_SETS_PATH
+from destination_dhis2 import DataValueBatch, DataValues, DestinationDhis2, Dhis2Client
+from destination_dhis2.constants import DATA_VALUE_SETS_PATH, TOKEN_REFRESH_PATH
+from destination_dhis2.spool import Spool, spool_directories
 
 
 @fixture(scope="session", autouse=True)
@@ -81,3 +93,463 @@ def test_write(
     assert cast(_RequestObjectProxy, requests_mock.last_request).json() == {
         "dataValues": input_messages
     }
+
+
+def test_write_metrics(
+    config: Mapping[str, Any],
+    configured_catalog_fixture: ConfiguredAirbyteCatalog,
+    input_messages_fixture: list[AirbyteMessage],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    caplog: LogCaptureFixture,
+    tmp_path: Path,
+) -> None:
+    metrics_path = tmp_path / "metrics.prom"
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    requests_mock.post(
+        url=Dhis2Client(**config)._join_url_fragments(DATA_VALUE_SETS_PATH),
+        text="request succeeded",
+    )
+
+    list(
+        DestinationDhis2().write(
+            {**config, "metrics_interval": 1e-6, "metrics_path": str(metrics_path)},
+            configured_catalog_fixture,
+            input_messages_fixture,
+        )
+    )
+
+    assert any(m.startswith("DHIS2 sync metrics: {") for m in caplog.messages)
+    summary = next(m for m in caplog.messages if m.startswith("DHIS2 sync summary: "))
+    metrics = json.loads(summary[len("DHIS2 sync summary: ") :])
+    assert metrics["records"] == 4
+    assert metrics["values"] == 4
+    assert metrics["batches"] == 1
+    assert metrics["token_refreshes"] == 1
+    prometheus = metrics_path.read_text()
+    assert "dhis2_destination_records_total 4\n" in prometheus
+    assert 'dhis2_destination_batch_latency_seconds_bucket{le="+Inf"} 1\n' in prometheus
+
+
+def test_write_multiple_streams(
+    config: Mapping[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+) -> None:
+    destination = DestinationDhis2()
+    client = Dhis2Client(**config)
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    data_value_sets = requests_mock.post(
+        url=client._join_url_fragments(DATA_VALUE_SETS_PATH), text="ok"
+    )
+
+    configured_catalog = ConfiguredAirbyteCatalog(
+        streams=[
+            ConfiguredAirbyteStream(
+                stream=AirbyteStream(
+                    name="monthly",
+                    json_schema={},
+                    supported_sync_modes=[SyncMode.full_refresh],
+                ),
+                sync_mode=SyncMode.full_refresh,
+                destination_sync_mode=DestinationSyncMode.overwrite,
+            ),
+            ConfiguredAirbyteStream(
+                stream=AirbyteStream(
+                    name="facilities",
+                    json_schema={
+                        "dhis2": {"batch_size": 1, "field_mapping": {"orgUnit": "ou"}}
+                    },
+                    supported_sync_modes=[SyncMode.full_refresh],
+                ),
+                sync_mode=SyncMode.full_refresh,
+                destination_sync_mode=DestinationSyncMode.overwrite,
+            ),
+        ]
+    )
+    facility_record: dict[str, Any] = {**data_values[1], "ou": "facility1"}
+    del facility_record["orgUnit"]
+    input_messages = [
+        AirbyteMessage(
+            type=Type.RECORD,
+            record=AirbyteRecordMessage(
+                stream="monthly", data=data_values[0], emitted_at=0
+            ),
+        ),
+        AirbyteMessage(
+            type=Type.RECORD,
+            record=AirbyteRecordMessage(
+                stream="facilities", data=facility_record, emitted_at=0
+            ),
+        ),
+        # only covers the facilities stream
+        AirbyteMessage(
+            type=Type.STATE,
+            state=AirbyteStateMessage(
+                type=AirbyteStateType.STREAM,
+                stream=AirbyteStreamState(
+                    stream_descriptor=StreamDescriptor(name="facilities")
+                ),
+            ),
+        ),
+    ]
+
+    result = list(destination.write(config, configured_catalog, input_messages))
+    assert [message.type for message in result] == [Type.STATE]
+
+    # the facilities batch was full after one record,
+    # the monthly stream was only flushed at the end of the sync
+    payloads = [request.json() for request in data_value_sets.request_history]
+    assert payloads == [
+        {"dataValues": [data_values[1] | {"orgUnit": "facility1"}]},
+        {"dataValues": [data_values[0]]},
+    ]
+
+
+def _linger_messages(data_values: DataValues) -> list[AirbyteMessage]:
+    # a state after each of five records
+    messages = []
+    for i in range(5):
+        messages.append(
+            AirbyteMessage(
+                type=Type.RECORD,
+                record=AirbyteRecordMessage(
+                    stream="dataElements",
+                    data=data_values[0] | {"dataElement": f"de{i}"},
+                    emitted_at=0,
+                ),
+            )
+        )
+        messages.append(
+            AirbyteMessage(
+                type=Type.STATE, state=AirbyteStateMessage(data={"cursor": i})
+            )
+        )
+    return messages
+
+
+def _linger_catalog(batch_size: int) -> ConfiguredAirbyteCatalog:
+    return ConfiguredAirbyteCatalog(
+        streams=[
+            ConfiguredAirbyteStream(
+                stream=AirbyteStream(
+                    name="dataElements",
+                    json_schema={"dhis2": {"batch_size": batch_size}},
+                    supported_sync_modes=[SyncMode.full_refresh],
+                ),
+                sync_mode=SyncMode.full_refresh,
+                destination_sync_mode=DestinationSyncMode.overwrite,
+            )
+        ]
+    )
+
+
+def test_write_state_linger(
+    config: Mapping[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+) -> None:
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    data_value_sets = requests_mock.post(
+        url=Dhis2Client(**config)._join_url_fragments(DATA_VALUE_SETS_PATH), text="ok"
+    )
+
+    result = list(
+        DestinationDhis2().write(
+            {**config, "state_linger": 3600},
+            _linger_catalog(batch_size=2),
+            _linger_messages(data_values),
+        )
+    )
+
+    # only full batches are sent before the end, the states in between are
+    # released once theirs are imported or replaced by a later one
+    assert [len(r.json()["dataValues"]) for r in data_value_sets.request_history] == [
+        2,
+        2,
+        1,
+    ]
+    cursors = [message.state.data["cursor"] for message in result]
+    assert cursors == sorted(cursors)
+    assert cursors[-1] == 4
+    assert len(cursors) < 5
+
+
+def test_write_state_max_records(
+    config: Mapping[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+    caplog: LogCaptureFixture,
+) -> None:
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    data_value_sets = requests_mock.post(
+        url=Dhis2Client(**config)._join_url_fragments(DATA_VALUE_SETS_PATH), text="ok"
+    )
+
+    result = list(
+        DestinationDhis2().write(
+            {**config, "state_linger": 3600, "state_max_records": 2},
+            _linger_catalog(batch_size=100),
+            _linger_messages(data_values),
+        )
+    )
+
+    # flushed two records after the oldest held state
+    assert [len(r.json()["dataValues"]) for r in data_value_sets.request_history] == [
+        3,
+        2,
+    ]
+    # the state after the flush had nothing left to wait for
+    assert [message.state.data["cursor"] for message in result] == [1, 2, 4]
+    assert (
+        "Skipped 2 state messages replaced by a later one before their records were durable"
+        in caplog.messages
+    )
+
+
+class Dhis2Handler(BaseHTTPRequestHandler):
+    # the payloads imported by every shard process
+    payloads: list[dict[str, Any]] = []
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path == TOKEN_REFRESH_PATH:
+            response = {"access_token": "token", "expires_in": 43199}
+        else:
+            payload = json.loads(body)
+            self.payloads.append(payload)
+            response = {
+                "status": "SUCCESS",
+                "importCount": {"imported": len(payload["dataValues"])},
+            }
+        content = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+@fixture
+def dhis2_server() -> Iterator[str]:
+    # shard processes do not see requests_mock, so they talk to a real server
+    Dhis2Handler.payloads = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Dhis2Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_write_sharded(
+    config: Mapping[str, Any],
+    dhis2_server: str,
+    caplog: LogCaptureFixture,
+    tmp_path: Path,
+) -> None:
+    configured_catalog = ConfiguredAirbyteCatalog(
+        streams=[
+            ConfiguredAirbyteStream(
+                stream=AirbyteStream(
+                    name="monthly",
+                    json_schema={"dhis2": {"field_mapping": {"orgUnit": "ou"}}},
+                    supported_sync_modes=[SyncMode.full_refresh],
+                ),
+                sync_mode=SyncMode.full_refresh,
+                destination_sync_mode=DestinationSyncMode.overwrite,
+            )
+        ]
+    )
+    records = [
+        {
+            "dataElement": "Psxm301oJH1",
+            "completeDate": "2022-06-03",
+            "period": "202204",
+            "ou": f"ou{i:09d}",
+            "value": str(i),
+        }
+        for i in range(100)
+    ]
+    input_messages = [
+        AirbyteMessage(
+            type=Type.RECORD,
+            record=AirbyteRecordMessage(stream="monthly", data=record, emitted_at=0),
+        )
+        for record in records
+    ]
+    input_messages.insert(
+        50,
+        AirbyteMessage(type=Type.STATE, state=AirbyteStateMessage(data={"n": 50})),
+    )
+
+    metrics_path = tmp_path / "metrics.prom"
+    result = list(
+        DestinationDhis2().write(
+            {
+                **config,
+                "base_url": dhis2_server,
+                "shards": 3,
+                "metrics_path": str(metrics_path),
+            },
+            configured_catalog,
+            input_messages,
+        )
+    )
+    assert [message.type for message in result] == [Type.STATE]
+
+    imported = [
+        data_value["value"]
+        for payload in Dhis2Handler.payloads
+        for data_value in payload["dataValues"]
+    ]
+    assert sorted(imported, key=int) == [record["value"] for record in records]
+    # each shard flushed at the state barrier and at the end
+    assert len(Dhis2Handler.payloads) == 6
+    assert "DHIS2 imported 100, updated 0, ignored 0 and deleted 0 values," in " ".join(
+        caplog.messages
+    )
+    # the metrics of every shard are combined
+    assert "dhis2_destination_values_total 100\n" in metrics_path.read_text()
+
+
+def test_write_sharded_state_of_unknown_stream(
+    config: Mapping[str, Any], dhis2_server: str
+) -> None:
+    state = AirbyteMessage(
+        type=Type.STATE,
+        state=AirbyteStateMessage(
+            type=AirbyteStateType.STREAM,
+            stream=AirbyteStreamState(stream_descriptor=StreamDescriptor(name="other")),
+        ),
+    )
+
+    result = list(
+        DestinationDhis2().write(
+            {**config, "base_url": dhis2_server, "shards": 2},
+            _monthly_catalog(),
+            [state],
+        )
+    )
+    assert result == [state]
+
+
+def _spool(directory: Path, data_values: DataValues) -> None:
+    # a batch left behind by an interrupted sync
+    batch = DataValueBatch()
+    batch.extend(data_values)
+    Spool(str(directory)).write(batch)
+
+
+def _monthly_catalog() -> ConfiguredAirbyteCatalog:
+    return ConfiguredAirbyteCatalog(
+        streams=[
+            ConfiguredAirbyteStream(
+                stream=AirbyteStream(
+                    name="monthly",
+                    json_schema={},
+                    supported_sync_modes=[SyncMode.full_refresh],
+                ),
+                sync_mode=SyncMode.full_refresh,
+                destination_sync_mode=DestinationSyncMode.overwrite,
+            )
+        ]
+    )
+
+
+def test_write_resumes_spools_of_more_shards(
+    config: Mapping[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+    tmp_path: Path,
+) -> None:
+    spool_path = tmp_path / "spool"
+    # left by a sync with 4 shards
+    _spool(spool_path / "shard-3", data_values[:1])
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    data_value_sets = requests_mock.post(
+        url=Dhis2Client(**config)._join_url_fragments(DATA_VALUE_SETS_PATH),
+        json={"status": "SUCCESS", "importCount": {"imported": 1}},
+    )
+
+    list(
+        DestinationDhis2().write(
+            {**config, "spool_path": str(spool_path)},
+            _monthly_catalog(),
+            [
+                AirbyteMessage(
+                    type=Type.RECORD,
+                    record=AirbyteRecordMessage(
+                        stream="monthly", data=data_values[1], emitted_at=0
+                    ),
+                )
+            ],
+        )
+    )
+
+    # the leftover batch goes in before the values of this sync
+    payloads = [request.json() for request in data_value_sets.request_history]
+    assert payloads == [
+        {"dataValues": data_values[:1]},
+        {"dataValues": data_values[1:]},
+    ]
+    for directory in spool_directories(str(spool_path)):
+        assert Spool(directory).segments() == []
+
+
+def test_write_sharded_resumes_spools_of_fewer_shards(
+    config: Mapping[str, Any],
+    dhis2_server: str,
+    data_values: DataValues,
+    tmp_path: Path,
+) -> None:
+    spool_path = tmp_path / "spool"
+    # left by a sync without shards, and by one with 4
+    _spool(spool_path, data_values[:1])
+    _spool(spool_path / "shard-3", data_values[1:])
+
+    list(
+        DestinationDhis2().write(
+            {
+                **config,
+                "base_url": dhis2_server,
+                "spool_path": str(spool_path),
+                "shards": 2,
+            },
+            _monthly_catalog(),
+            [],
+        )
+    )
+
+    assert sorted(
+        data_value["dataElement"]
+        for payload in Dhis2Handler.payloads
+        for data_value in payload["dataValues"]
+    ) == sorted(data_value["dataElement"] for data_value in data_values)
+    for directory in spool_directories(str(spool_path)):
+        assert Spool(directory).segments() == []
@@ -5,7 +5,7 @@
 
 import sys
 
-from destination_dhis2 import DestinationDhis2
+from destination_dhis2.run import run
 
 if __name__ == "__main__":
-    DestinationDhis2().run(sys.argv[1:])
+    run(sys.argv[1:])
@@ -9,6 +9,11 @@ MAIN_REQUIREMENTS = [
     "airbyte-cdk",
 ]
 
+# optional, used for faster JSON encoding when installed
+SPEEDUP_REQUIREMENTS = [
+    "orjson",
+]
+
 TEST_REQUIREMENTS = [
     "pytest~=7.2.2",
     "requests-mock~=1.10.0",
@@ -25,5 +30,6 @@ setup(
     package_data={"": ["*.json"]},
     extras_require={
         "tests": TEST_REQUIREMENTS,
+        "speedups": SPEEDUP_REQUIREMENTS,
     },
 )
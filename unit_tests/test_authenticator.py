@@ -1,8 +1,11 @@
+import threading
 from typing import Any, Mapping
 
+import pendulum
 import pytest
 from requests.exceptions import RequestException
 from requests_mock import Mocker
+from requests_mock.request import _RequestObjectProxy
 
 from destination_dhis2 import Dhis2Authenticator
 
@@ -32,3 +35,92 @@ def test_dhis2_authenticator_fail(
         Dhis2Authenticator(**oauth_configs).get_auth_header()
     assert "Error while refreshing access token" in str(exc_info.value)
     assert "RequestException" in str(exc_info)
+
+
+def test_dhis2_authenticator_reuses_token(
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    oauth_configs: Mapping[str, Any],
+    sample_access_token: str,
+) -> None:
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    authenticator = Dhis2Authenticator(**oauth_configs)
+    authenticator.get_auth_header()
+    authenticator.get_auth_header()
+    assert requests_mock.call_count == 1
+
+
+def test_dhis2_authenticator_expiry_margin(
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    oauth_configs: Mapping[str, Any],
+    sample_access_token: str,
+) -> None:
+    # a token expiring within the margin is never reused
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 30},
+    )
+    authenticator = Dhis2Authenticator(**oauth_configs, expiry_margin=60)
+    authenticator.get_auth_header()
+    authenticator.get_auth_header()
+    assert requests_mock.call_count == 2
+
+
+def test_dhis2_authenticator_background_refresh(
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    oauth_configs: Mapping[str, Any],
+) -> None:
+    # the refresh only completes once the stale token was handed out
+    refreshed = threading.Event()
+
+    def second_token(request: _RequestObjectProxy, context: Any) -> dict[str, Any]:
+        refreshed.wait(timeout=5)
+        return {"access_token": "second", "expires_in": 600}
+
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        response_list=[
+            {"json": {"access_token": "first", "expires_in": 600}},
+            {"json": second_token},
+        ],
+    )
+    authenticator = Dhis2Authenticator(**oauth_configs, refresh_window=300)
+    assert authenticator.get_access_token() == "first"
+
+    # fast-forward into the refresh window
+    authenticator._stale_at = pendulum.now().subtract(seconds=1)
+    # stale but not expired, the current token is still handed out
+    # without waiting for the refresh
+    assert authenticator.get_access_token() == "first"
+    refreshed.set()
+    # wait for the background refresh to release the lock
+    with authenticator._refresh_lock:
+        pass
+    assert authenticator.get_access_token() == "second"
+    assert requests_mock.call_count == 2
+
+
+def test_dhis2_authenticator_invalidate(
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    oauth_configs: Mapping[str, Any],
+) -> None:
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        response_list=[
+            {"json": {"access_token": "first", "expires_in": 43199}},
+            {"json": {"access_token": "second", "expires_in": 43199}},
+        ],
+    )
+    authenticator = Dhis2Authenticator(**oauth_configs)
+    assert authenticator.get_access_token() == "first"
+    # a stale rejection does not discard the current token
+    authenticator.invalidate_access_token("outdated")
+    assert authenticator.get_access_token() == "first"
+    authenticator.invalidate_access_token("first")
+    assert authenticator.get_access_token() == "second"
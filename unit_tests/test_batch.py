@@ -0,0 +1,71 @@
+from typing import Any, cast
+
+from destination_dhis2 import DataValue, DataValueBatch, DataValues, Dhis2Client
+
+
+def test_data_value_batch(data_values: DataValues) -> None:
+    batch = DataValueBatch(capacity=1)
+    assert len(batch) == 0
+    assert list(batch) == []
+
+    # grows past the preallocated capacity
+    batch.extend(data_values)
+    assert len(batch) == 2
+    assert list(batch) == data_values
+
+
+def test_data_value_batch_coalesces_duplicates(data_values: DataValues) -> None:
+    batch = DataValueBatch(capacity=1, coalesce=True)
+    later_value = data_values[0].copy()
+    later_value.update({"completeDate": "2022-06-05", "value": "13"})
+    batch.extend(data_values)
+    batch.extend([later_value])
+    assert len(batch) == 2
+    # the last value wins and keeps the position of the first
+    assert list(batch) == [later_value, data_values[1]]
+    assert batch.coalesced == 1
+    assert ("Psxm301oJH1", "202204", "i6724gjuOkw", None, None) in batch
+
+    batch = DataValueBatch(coalesce=False)
+    batch.extend(data_values + data_values)
+    assert len(batch) == 4
+    assert batch.coalesced == 0
+    assert ("Psxm301oJH1", "202204", "i6724gjuOkw", None, None) not in batch
+
+
+def test_data_value_batch_option_combos(data_values: DataValues) -> None:
+    batch = DataValueBatch(capacity=1, coalesce=True)
+    batch.extend(data_values[:1])
+    assert not batch.has_option_combos
+    # another disaggregation of the same key is a value of its own
+    female = data_values[0].copy()
+    female.update({"categoryOptionCombo": "Prlt0C1RF0s", "value": "6"})
+    batch.extend([female])
+    assert len(batch) == 2
+    assert batch.coalesced == 0
+    assert batch.has_option_combos
+    # combos left to their defaults are not materialised
+    assert list(batch) == [data_values[0], female]
+    assert list(batch.rows())[1][5:] == ("Prlt0C1RF0s", None)
+
+
+def test_data_value_batch_drops_extra_fields(
+    config: dict[str, Any], data_values: DataValues
+) -> None:
+    client = Dhis2Client(**config)
+    client.queue_write_operation(
+        cast(DataValue, data_values[0] | {"comment": "ignored"})
+    )
+    assert list(client.write_buffer) == data_values[:1]
+    client.close()
+
+
+def test_write_buffer_is_per_client(
+    config: dict[str, Any], data_values: DataValues
+) -> None:
+    client, other_client = Dhis2Client(**config), Dhis2Client(**config)
+    client.queue_write_operation(data_values[0])
+    assert len(client.write_buffer) == 1
+    assert len(other_client.write_buffer) == 0
+    client.close()
+    other_client.close()
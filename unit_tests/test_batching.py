@@ -0,0 +1,50 @@
+import pytest
+
+from destination_dhis2.batching import AdaptiveBatchSizer
+
+
+def test_adaptive_batch_sizer_grows_when_fast() -> None:
+    sizer = AdaptiveBatchSizer(initial_size=1000, max_size=2000, target_latency=10)
+    sizer.record(values=1000, latency=1, payload_bytes=0, failed=False)
+    assert sizer.batch_size == 1500
+    sizer.record(values=1500, latency=1, payload_bytes=0, failed=False)
+    assert sizer.batch_size == 2000
+
+    # partial batches do not grow the size
+    sizer = AdaptiveBatchSizer(initial_size=1000, target_latency=10)
+    sizer.record(values=10, latency=1, payload_bytes=0, failed=False)
+    assert sizer.batch_size == 1000
+    # unless they were split off a full batch
+    sizer.record(values=10, latency=1, payload_bytes=0, failed=False, split_from=1000)
+    assert sizer.batch_size == 1500
+
+
+def test_adaptive_batch_sizer_shrinks_when_slow() -> None:
+    sizer = AdaptiveBatchSizer(initial_size=1000, min_size=300, target_latency=10)
+    sizer.record(values=1000, latency=20, payload_bytes=0, failed=False)
+    assert sizer.batch_size == 500
+    sizer.record(values=500, latency=20, payload_bytes=0, failed=False)
+    assert sizer.batch_size == 300
+
+
+def test_adaptive_batch_sizer_shrinks_on_errors() -> None:
+    sizer = AdaptiveBatchSizer(initial_size=1000, target_latency=10)
+    sizer.record(values=1000, latency=1, payload_bytes=0, failed=True)
+    assert sizer.batch_size == 500
+    # the error rate keeps batches shrinking for a while after a failure
+    sizer.record(values=500, latency=1, payload_bytes=0, failed=False)
+    assert sizer.batch_size == 250
+
+
+def test_adaptive_batch_sizer_byte_ceiling() -> None:
+    sizer = AdaptiveBatchSizer(
+        initial_size=1000, min_size=10, max_bytes=50_000, target_latency=10
+    )
+    # 100 bytes per value caps batches at 500 values
+    sizer.record(values=1000, latency=5, payload_bytes=100_000, failed=False)
+    assert sizer.batch_size == 500
+
+
+def test_adaptive_batch_sizer_bounds() -> None:
+    with pytest.raises(ValueError):
+        AdaptiveBatchSizer(min_size=100, max_size=10)
@@ -0,0 +1,137 @@
+import multiprocessing
+from pathlib import Path
+from typing import Any
+from unittest.mock import MagicMock
+
+from destination_dhis2 import DataValues
+from destination_dhis2.batch import DataValueBatch
+from destination_dhis2.change_store import ChangeStore
+from destination_dhis2.stream_writer import StreamWriter
+
+
+def test_change_store(tmp_path: Path, data_values: DataValues) -> None:
+    path = str(tmp_path / "changes.sqlite")
+    batch = DataValueBatch()
+    batch.extend(data_values)
+    row = next(batch.rows())
+
+    store = ChangeStore(path)
+    assert not store.is_unchanged(*row)
+    store.update(batch.rows())
+    # sent during this sync, so a later value for the key is never skipped
+    assert not store.is_unchanged(*row)
+    store.close()
+
+    # survives a restart, and a new value or complete date is a change
+    store = ChangeStore(path)
+    assert store.is_unchanged(*row)
+    data_element, complete_date, period, org_unit, value, _, _ = row
+    assert store.is_unchanged(data_element, complete_date, period, org_unit, value)
+    assert not store.is_unchanged(data_element, complete_date, period, org_unit, "13")
+    assert not store.is_unchanged(data_element, "2022-07-01", period, org_unit, value)
+    assert not store.is_unchanged(
+        data_element, complete_date, "202205", org_unit, value
+    )
+    # as is another disaggregation of the value
+    assert not store.is_unchanged(
+        data_element, complete_date, period, org_unit, value, "Prlt0C1RF0s"
+    )
+
+    store.update([(data_element, complete_date, period, org_unit, "13", None, None)])
+    store.close()
+    store = ChangeStore(path)
+    assert store.is_unchanged(data_element, complete_date, period, org_unit, "13")
+    assert not store.is_unchanged(*row)
+    store.close()
+
+
+def test_stream_writer_skips_unchanged_values(
+    tmp_path: Path, data_values: DataValues
+) -> None:
+    store = ChangeStore(str(tmp_path / "changes.sqlite"))
+    batch = DataValueBatch()
+    batch.extend(data_values[:1])
+    store.update(batch.rows())
+    client = MagicMock(metadata=None, change_store=store)
+    writer = StreamWriter("dataElements", client, batch_size=10)
+
+    for data_value in data_values:
+        writer.write(data_value)
+    assert list(writer.buffer) == data_values[1:]
+    assert writer.unchanged_count == 1
+    store.close()
+
+
+def test_stream_writer_replaces_queued_values(
+    tmp_path: Path, data_values: DataValues
+) -> None:
+    store = ChangeStore(str(tmp_path / "changes.sqlite"))
+    batch = DataValueBatch()
+    batch.extend(data_values[:1])
+    store.update(batch.rows())
+    client = MagicMock(metadata=None, change_store=store, coalesce_duplicates=True)
+    writer = StreamWriter("dataElements", client, batch_size=10)
+
+    # the value DHIS2 holds still replaces a changed one queued before it
+    writer.write({**data_values[0], "value": "13"})
+    writer.write(data_values[0])
+    assert list(writer.buffer) == data_values[:1]
+    assert writer.unchanged_count == 0
+    store.close()
+
+
+def test_stream_writer_sends_values_reverted_during_the_sync(
+    tmp_path: Path, data_values: DataValues
+) -> None:
+    store = ChangeStore(str(tmp_path / "changes.sqlite"))
+    batch = DataValueBatch()
+    batch.extend(data_values[:1])
+    store.update(batch.rows())
+    client = MagicMock(metadata=None, change_store=store)
+    writer = StreamWriter("dataElements", client, batch_size=1)
+
+    # DHIS2 holds the first value, which the sync changes and then reverts
+    changed: dict[str, Any] = {**data_values[0], "value": "13"}
+    writer.write(changed)
+    store.update(client.submit.call_args.args[0].rows())
+    writer.write(data_values[0])
+    assert [list(call.args[0]) for call in client.submit.call_args_list] == [
+        [changed],
+        data_values[:1],
+    ]
+    assert writer.unchanged_count == 0
+    store.close()
+
+
+def _import_values(path: str, shard: int) -> None:
+    # a shard recording its imports one batch at a time
+    store = ChangeStore(path)
+    for batch in range(50):
+        store.update(
+            (f"de{i}", "2022-06-03", "202204", f"ou{shard}", str(batch), None, None)
+            for i in range(20)
+        )
+        store.is_unchanged("de0", "2022-06-03", "202204", f"ou{shard}", str(batch))
+    store.close()
+
+
+def test_change_store_shared_by_shards(tmp_path: Path) -> None:
+    path = str(tmp_path / "changes.sqlite")
+    # started together, as the shard processes of a sync are
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_import_values, args=(path, shard)) for shard in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert [process.exitcode for process in processes] == [0, 0, 0, 0]
+
+    store = ChangeStore(path)
+    for shard in range(4):
+        for i in range(20):
+            assert store.is_unchanged(
+                f"de{i}", "2022-06-03", "202204", f"ou{shard}", "49"
+            )
+    store.close()
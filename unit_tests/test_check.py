@@ -1,10 +1,11 @@
+from pathlib import Path
 from unittest.mock import MagicMock
 
 from airbyte_cdk.models import (  # type: ignore # see this https://github.com/airbytehq/airbyte/pull/22963
     AirbyteConnectionStatus,
     Status,
 )
-from requests.exceptions import ConnectTimeout, RequestException
+from requests.exceptions import ConnectionError, ConnectTimeout, RequestException
 from requests_mock import Mocker
 
 from destination_dhis2 import DestinationDhis2
@@ -49,6 +50,21 @@ def test_check_connection_authenticator_fail(
     assert "RequestException" in str(resp.message)
 
 
+def test_check_connection_is_not_retried(
+    config: dict[str, str],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+) -> None:
+    destination = DestinationDhis2()
+    # fake an unreachable server
+    token_refresh = requests_mock.post(url=token_refresh_endpoint, exc=ConnectionError)
+
+    resp = destination.check(MagicMock(), config)
+    assert resp.status == AirbyteConnectionStatus(status=Status.FAILED).status
+    assert "Error while refreshing access token" in str(resp.message)
+    assert token_refresh.call_count == 1
+
+
 def test_check_connection_raise_for_status(
     config: dict[str, str],
     requests_mock: Mocker,
@@ -117,3 +133,29 @@ def test_check_connection_fail_with_message(
     assert resp.status == AirbyteConnectionStatus(status=Status.FAILED).status
     assert "Exception in check command" in str(resp.message)
     assert "max-results cannot be negative" in str(resp.message)
+
+
+def test_check_connection_skips_write_path(
+    config: dict[str, str],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_elements_url: str,
+    tmp_path: Path,
+) -> None:
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    requests_mock.get(url=data_elements_url, text="Success")
+    write_options = {
+        "shards": 2,
+        "spool_path": str(tmp_path / "spool"),
+        "change_store_path": str(tmp_path / "changes.sqlite"),
+    }
+
+    resp = DestinationDhis2().check(MagicMock(), {**config, **write_options})
+    assert resp == AirbyteConnectionStatus(status=Status.SUCCEEDED)
+    # a token refresh and the check itself, nothing is created on disk
+    assert requests_mock.call_count == 2
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,92 @@
+from typing import Optional, cast
+
+from airbyte_cdk.models import (  # type: ignore # see this https://github.com/airbytehq/airbyte/pull/22963
+    AirbyteMessage,
+    AirbyteStateMessage,
+    AirbyteStateType,
+    AirbyteStreamState,
+    StreamDescriptor,
+    Type,
+)
+
+from destination_dhis2.checkpoint import CheckpointPolicy, state_key
+from destination_dhis2.stream_writer import StreamWriter
+
+
+def _state(cursor: int, stream: Optional[str] = None) -> AirbyteMessage:
+    if stream is None:
+        return AirbyteMessage(
+            type=Type.STATE, state=AirbyteStateMessage(data={"cursor": cursor})
+        )
+    return AirbyteMessage(
+        type=Type.STATE,
+        state=AirbyteStateMessage(
+            type=AirbyteStateType.STREAM,
+            stream=AirbyteStreamState(
+                stream_descriptor=StreamDescriptor(name=stream),
+                stream_state={"cursor": cursor},
+            ),
+        ),
+    )
+
+
+class _Writer:
+    # the parts of a StreamWriter the policy reads
+    def __init__(self, buffered: int):
+        self.buffer = [None] * buffered
+        self.submitted_batches = 0
+
+
+def _writer(buffered: int) -> StreamWriter:
+    return cast(StreamWriter, _Writer(buffered))
+
+
+def test_state_key() -> None:
+    assert state_key(_state(1)) is None
+    assert state_key(_state(1, "facilities")) == ("facilities", None)
+
+
+def test_checkpoint_every_state() -> None:
+    policy = CheckpointPolicy()
+    assert not policy.due()
+    policy.hold(_state(1), [_writer(1)], 0)
+    assert policy.due()
+    assert policy.release() == [_state(1)]
+    assert len(policy) == 0
+
+
+def test_linger_and_max_records() -> None:
+    now = [0.0]
+    policy = CheckpointPolicy(linger=10, max_records=3, clock=lambda: now[0])
+    policy.hold(_state(1), [], 0)
+    now[0] = 5
+    policy.records += 2
+    # the later state lingers from when the one it replaces was held
+    policy.hold(_state(2), [], 0)
+    assert not policy.due()
+    now[0] = 10
+    assert policy.due()
+
+    now[0] = 0
+    policy.records += 1
+    assert policy.due()
+    assert policy.coalesced == 1
+    assert policy.release() == [_state(2)]
+
+
+def test_ready() -> None:
+    policy = CheckpointPolicy(linger=60)
+    writer, other_writer = _writer(3), _writer(0)
+    policy.hold(_state(1, "facilities"), [writer], 4)
+    policy.hold(_state(1, "monthly"), [other_writer], 4)
+    # the monthly records were all in batches already handed over
+    assert policy.ready(submitted=4, durable=3) == []
+    assert policy.ready(submitted=4, durable=4) == [_state(1, "monthly")]
+
+    # the facilities records are still buffered
+    assert policy.ready(submitted=5, durable=5) == []
+    assert policy.writers() == {writer}
+    writer.submitted_batches += 1
+    assert policy.ready(submitted=6, durable=5) == []
+    assert policy.ready(submitted=7, durable=6) == [_state(1, "facilities")]
+    assert len(policy) == 0
@@ -0,0 +1,64 @@
+from destination_dhis2 import DataValueBatch
+from destination_dhis2.grouping import HOISTED_FIELDS_SIZE, group_batch
+
+
+def _batch(rows: list[tuple[str, str, str, str, str]]) -> DataValueBatch:
+    batch = DataValueBatch()
+    for row in rows:
+        batch.append(*row)
+    return batch
+
+
+def test_group_batch() -> None:
+    batch = _batch(
+        [("de2", "2022-06-03", "202204", "ouB", "1")]
+        + [(f"de{i}", "2022-06-03", "202205", "ouA", str(i)) for i in range(3, 0, -1)]
+        + [("de1", "2022-06-03", "202204", "ouC", "2")]
+        + [(f"de{i}", "2022-06-03", "202204", "ouA", str(i)) for i in range(3)]
+    )
+
+    batches, stats = group_batch(batch, min_group_size=3)
+    assert [[row[:5] for row in b.rows()] for b in batches] == [
+        [(f"de{i}", "2022-06-03", "202204", "ouA", str(i)) for i in range(3)],
+        [(f"de{i}", "2022-06-03", "202205", "ouA", str(i)) for i in range(1, 4)],
+        # the groups too small for a set of their own, sorted
+        [
+            ("de2", "2022-06-03", "202204", "ouB", "1"),
+            ("de1", "2022-06-03", "202204", "ouC", "2"),
+        ],
+    ]
+    assert [b.shared_header() for b in batches] == [
+        ("202204", "ouA"),
+        ("202205", "ouA"),
+        None,
+    ]
+    assert stats == {
+        "sets": 2,
+        "values": 6,
+        "bytes_saved": 2 * 2 * (HOISTED_FIELDS_SIZE + len("202204") + len("ouA")),
+        # three requests instead of one
+        "extra_requests": 2,
+    }
+
+
+def test_group_batch_single_small_group() -> None:
+    batch = _batch([("de1", "2022-06-03", "202204", "ouA", "1")] * 2)
+    batches, stats = group_batch(batch, min_group_size=50)
+    assert len(batches) == 1
+    assert stats["sets"] == 1
+    assert stats["values"] == 2
+    assert stats["extra_requests"] == 0
+
+
+def test_group_batch_sorts_only() -> None:
+    batch = _batch(
+        [
+            ("de1", "2022-06-03", "202205", "ouA", "1"),
+            ("de1", "2022-06-03", "202204", "ouB", "2"),
+            ("de1", "2022-06-03", "202204", "ouA", "3"),
+        ]
+    )
+    batches, stats = group_batch(batch, min_group_size=None)
+    assert [row[4] for row in batches[0].rows()] == ["3", "2", "1"]
+    assert stats["sets"] == 0
+    assert stats["extra_requests"] == 0
@@ -0,0 +1,94 @@
+import json
+from typing import Any
+
+import pytest
+import requests
+from requests.exceptions import RequestException
+from requests_mock import Mocker
+
+from destination_dhis2 import Dhis2Client
+from destination_dhis2.constants import (
+    IMPORT_JOB_TYPE,
+    SYSTEM_TASKS_PATH,
+    TASK_SUMMARIES_PATH,
+)
+from destination_dhis2.import_jobs import ImportJobPoller, parse_job_id
+
+
+def _response(body: object) -> requests.Response:
+    response = requests.Response()
+    response._content = json.dumps(body).encode()
+    return response
+
+
+def test_parse_job_id() -> None:
+    job = {"id": "YR1UxOUXmzT", "jobType": IMPORT_JOB_TYPE}
+    # DHIS2 2.37 and earlier
+    assert parse_job_id(_response({"status": "OK", "response": job})) == "YR1UxOUXmzT"
+    # a bare job configuration
+    assert parse_job_id(_response(job)) == "YR1UxOUXmzT"
+
+    with pytest.raises(RequestException):
+        parse_job_id(_response({"status": "OK", "importCount": {"imported": 1}}))
+
+
+@pytest.fixture
+def poller_client(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+) -> Dhis2Client:
+    client = Dhis2Client(**config)
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    return client
+
+
+def test_import_job_poller(poller_client: Dhis2Client, requests_mock: Mocker) -> None:
+    delays: list[float] = []
+    poller = ImportJobPoller(poller_client, interval=0.5, cap=2, sleep=delays.append)
+    tasks = requests_mock.get(
+        url=poller_client._join_url_fragments(f"{SYSTEM_TASKS_PATH}/{IMPORT_JOB_TYPE}"),
+        response_list=[
+            {"json": {"job": [{"completed": False}], "other": [{"completed": True}]}},
+            {"json": {"job": [{"completed": False}]}},
+            {"json": {"job": [{"completed": False}]}},
+            {"json": {"job": [{"completed": True}, {"completed": False}]}},
+        ],
+    )
+    requests_mock.get(
+        url=poller_client._join_url_fragments(
+            f"{TASK_SUMMARIES_PATH}/{IMPORT_JOB_TYPE}/job"
+        ),
+        json={"status": "SUCCESS", "importCount": {"imported": 2}},
+    )
+
+    summary = poller.wait("job")
+    assert summary is not None
+    assert summary.import_count["imported"] == 2
+    assert tasks.call_count == 4
+    # backs off between checks
+    assert delays == [0.5, 1, 2, 2]
+    poller_client.close()
+
+
+def test_import_job_poller_backoff_and_timeout(
+    poller_client: Dhis2Client, requests_mock: Mocker
+) -> None:
+    delays: list[float] = []
+    poller = ImportJobPoller(
+        poller_client, interval=0.25, cap=1, timeout=0, sleep=delays.append
+    )
+    requests_mock.get(
+        url=poller_client._join_url_fragments(f"{SYSTEM_TASKS_PATH}/{IMPORT_JOB_TYPE}"),
+        json={"job": [{"completed": False}]},
+    )
+
+    with pytest.raises(RequestException) as exc_info:
+        poller.wait("job")
+    assert "job" in str(exc_info.value)
+    assert delays == [0.25]
+    poller_client.close()
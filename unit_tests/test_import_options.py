@@ -0,0 +1,94 @@
+from typing import Any
+
+import pytest
+from requests.exceptions import ConnectTimeout, ReadTimeout
+from requests_mock import Mocker
+
+from destination_dhis2 import DataValueBatch, DataValues, Dhis2Client
+from destination_dhis2.constants import DATA_VALUE_SETS_PATH
+from destination_dhis2.import_options import import_params
+
+
+def test_import_params() -> None:
+    # DHIS2's defaults are not sent
+    assert import_params() == {}
+    assert import_params(
+        import_strategy="CREATE",
+        skip_existing_check=True,
+        skip_audit=True,
+        dry_run=True,
+        id_scheme="CODE",
+        data_element_id_scheme="ATTRIBUTE:DnrLSdo4hMl",
+        org_unit_id_scheme="UID",
+        preheat_cache=True,
+    ) == {
+        "importStrategy": "CREATE",
+        "skipExistingCheck": "true",
+        "skipAudit": "true",
+        "dryRun": "true",
+        "idScheme": "CODE",
+        "dataElementIdScheme": "ATTRIBUTE:DnrLSdo4hMl",
+        "orgUnitIdScheme": "UID",
+        "preheatCache": "true",
+    }
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"import_strategy": "DELETE"},
+        {"id_scheme": "uid"},
+        {"org_unit_id_scheme": "ATTRIBUTE:short"},
+        # both could store a data value twice
+        {"skip_existing_check": True},
+        {
+            "skip_existing_check": True,
+            "import_strategy": "CREATE",
+            "coalesce_duplicates": False,
+        },
+    ],
+)
+def test_import_params_invalid(options: dict) -> None:
+    with pytest.raises(ValueError):
+        import_params(**options)
+
+
+def test_metadata_validation_requires_uids(config: dict[str, Any]) -> None:
+    with pytest.raises(ValueError):
+        Dhis2Client(**config, validate_metadata=True, org_unit_id_scheme="CODE")
+
+
+def test_skip_existing_check_is_not_replayed(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+    data_values: DataValues,
+) -> None:
+    client = Dhis2Client(**config, import_strategy="CREATE", skip_existing_check=True)
+    client.retry_policy._sleep = lambda _: None
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    data_value_sets = requests_mock.post(
+        url=client._join_url_fragments(DATA_VALUE_SETS_PATH),
+        response_list=[
+            # never sent, so safe to send again
+            {"exc": ConnectTimeout},
+            {"status_code": 429},
+            # DHIS2 may have stored the values, sending them again could
+            # store them twice
+            {"exc": ReadTimeout},
+            {"status_code": 503},
+        ],
+    )
+    batch = DataValueBatch()
+    batch.extend(data_values)
+
+    with pytest.raises(ReadTimeout):
+        client._batch_write(batch)
+    assert data_value_sets.call_count == 3
+    assert client._batch_write(batch).status_code == 503
+    assert data_value_sets.call_count == 4
+    client.close()
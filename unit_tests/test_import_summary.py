@@ -0,0 +1,68 @@
+from destination_dhis2 import DataValueBatch, DataValues
+from destination_dhis2.import_summary import ImportSummary
+
+
+def test_import_summary_from_json() -> None:
+    # DHIS2 2.37 and earlier
+    summary = ImportSummary.from_json(
+        {
+            "responseType": "ImportSummary",
+            "status": "WARNING",
+            "importCount": {"imported": 1, "updated": 2, "ignored": 1},
+            "conflicts": [{"object": "i6724gjuOkw", "value": "Org unit not found"}],
+        }
+    )
+    assert summary is not None
+    assert summary.status == "WARNING"
+    assert summary.import_count == {
+        "imported": 1,
+        "updated": 2,
+        "ignored": 1,
+        "deleted": 0,
+    }
+    assert summary.acknowledged == 3
+
+    # DHIS2 2.38 and later wrap the summary in a web message
+    summary = ImportSummary.from_json(
+        {
+            "httpStatus": "Conflict",
+            "status": "ERROR",
+            "message": "One more conflicts encountered",
+            "response": {
+                "responseType": "ImportSummary",
+                "status": "ERROR",
+                "importCount": {
+                    "imported": 0,
+                    "updated": 0,
+                    "ignored": 2,
+                    "deleted": 0,
+                },
+                "conflicts": [],
+            },
+        }
+    )
+    assert summary is not None
+    assert summary.status == "ERROR"
+    assert summary.description == "One more conflicts encountered"
+
+    assert ImportSummary.from_json({"message": "not an import"}) is None
+
+
+def test_import_summary_rejected_indexes(data_values: DataValues) -> None:
+    batch = DataValueBatch()
+    batch.extend(data_values)
+    batch.append("Yt0klR6lDPn", "2022-06-04", "202204", "other", "1")
+
+    summary = ImportSummary(
+        status="WARNING",
+        import_count={"imported": 0, "updated": 0, "ignored": 0, "deleted": 0},
+        conflicts=[
+            {"object": "Yt0klR6lDPn", "value": "Data element not found"},
+            {"object": "i6724gjuOkw", "value": "Period locked", "indexes": [0]},
+        ],
+    )
+    assert summary.rejected_indexes(batch) == {
+        0: "Period locked",
+        1: "Data element not found",
+        2: "Data element not found",
+    }
@@ -0,0 +1,207 @@
+from typing import Any
+from unittest.mock import MagicMock
+
+import pytest
+
+from destination_dhis2 import DataValues
+from destination_dhis2.mapping import (
+    ValueType,
+    compile_field,
+    compile_mapping,
+    to_period,
+)
+from destination_dhis2.stream_writer import StreamWriter
+
+
+@pytest.mark.parametrize(
+    "period_type, period",
+    [
+        ("Daily", "20230203"),
+        ("Weekly", "2023W5"),
+        ("Monthly", "202302"),
+        ("BiMonthly", "202301B"),
+        ("Quarterly", "2023Q1"),
+        ("SixMonthly", "2023S1"),
+        ("Yearly", "2023"),
+    ],
+)
+def test_to_period(period_type: str, period: str) -> None:
+    assert to_period("2023-02-03", period_type) == period  # type: ignore[arg-type]
+    assert to_period("2023-02-03T10:15:00Z", period_type) == period  # type: ignore[arg-type]
+
+
+def test_to_period_iso_weeks() -> None:
+    # the first days of January can belong to the last week of the year before
+    assert to_period("2021-01-03", "Weekly") == "2020W53"
+    with pytest.raises(ValueError):
+        to_period("03/02/2023", "Monthly")
+
+
+def test_compile_mapping_renames(data_values: DataValues) -> None:
+    map_record = compile_mapping({"orgUnit": "facility"})
+
+    data_value = data_values[0]
+    record: dict[str, Any] = {**data_value, "facility": "ou1"}
+    assert map_record(record) == (
+        data_value["dataElement"],
+        data_value["completeDate"],
+        data_value["period"],
+        "ou1",
+        data_value["value"],
+        # the combos are optional, and left to their defaults when missing
+        None,
+        None,
+    )
+
+
+def test_compile_mapping_rules() -> None:
+    map_record = compile_mapping(
+        {
+            "dataElement": {"field": "indicator", "values": {"anc1": "Psxm301oJH1"}},
+            "completeDate": {"constant": "2023-03-01"},
+            "period": {"field": "visit_date", "period": "Monthly"},
+            "orgUnit": {"field": "facility", "default": "ImspTQPwCqd"},
+            "value": {"field": "count", "type": "integer"},
+        }
+    )
+    record: dict[str, Any] = {
+        "indicator": "anc1",
+        "visit_date": "2023-02-03",
+        "count": 12.0,
+    }
+    assert map_record({**record, "facility": None}) == (
+        "Psxm301oJH1",
+        "2023-03-01",
+        "202302",
+        "ImspTQPwCqd",
+        "12",
+        None,
+        None,
+    )
+
+    invalid_records: list[tuple[dict[str, Any], str]] = [
+        ({"indicator": "anc2"}, "No mapping for value 'anc2'"),
+        ({"visit_date": "03/02/2023"}, "Not an ISO 8601 date"),
+        ({"count": 12.5}, "Not an integer: 12.5"),
+    ]
+    for invalid, reason in invalid_records:
+        with pytest.raises(ValueError) as exc_info:
+            map_record({**record, **invalid})
+        assert reason in str(exc_info.value)
+
+
+def test_compile_mapping_option_combos(data_values: DataValues) -> None:
+    map_record = compile_mapping(
+        {
+            "categoryOptionCombo": {
+                "field": "sex",
+                "values": {"female": "Prlt0C1RF0s", "male": "V6L425pT3A0"},
+            },
+            "attributeOptionCombo": "partner",
+        }
+    )
+    record: dict[str, Any] = {**data_values[0]}
+    assert map_record(record)[5:] == (None, None)
+    assert map_record({**record, "sex": "female", "partner": "HllvX50cXC0"})[5:] == (
+        "Prlt0C1RF0s",
+        "HllvX50cXC0",
+    )
+    with pytest.raises(ValueError, match="No mapping for value 'other'"):
+        map_record({**record, "sex": "other"})
+
+
+@pytest.mark.parametrize(
+    "value_type, value, expected",
+    [
+        ("string", True, "true"),
+        ("string", 12, "12"),
+        ("integer", "12", "12"),
+        ("integer", "12.0", "12"),
+        ("number", 12.0, "12"),
+        ("number", 12.5, "12.5"),
+        ("number", " 1e3", "1e3"),
+        ("boolean", "TRUE", "true"),
+        ("boolean", 0, "false"),
+    ],
+)
+def test_value_types(value_type: ValueType, value: object, expected: str) -> None:
+    map_value = compile_field({"value": {"type": value_type}}, "value")
+    assert map_value({"value": value}) == expected
+
+
+@pytest.mark.parametrize(
+    "value_type, value", [("integer", True), ("number", "n/a"), ("boolean", "yes")]
+)
+def test_invalid_values(value_type: ValueType, value: object) -> None:
+    map_value = compile_field({"value": {"type": value_type}}, "value")
+    with pytest.raises(ValueError):
+        map_value({"value": value})
+
+
+def test_missing_field() -> None:
+    # e.g. records routed by their orgUnit, which then go to the dead letters
+    map_org_unit = compile_field({"orgUnit": "facility"}, "orgUnit")
+    with pytest.raises(ValueError, match="Missing field 'facility'"):
+        map_org_unit({"orgUnit": "ou1"})
+
+
+@pytest.mark.parametrize(
+    "mapping",
+    [
+        {"dataSet": "ds"},
+        {"value": {"typo": "integer"}},
+        {"value": {"type": "date"}},
+        {"period": {"period": "Hourly"}},
+        {"orgUnit": {"constant": "ou1", "field": "facility"}},
+    ],
+)
+def test_invalid_mappings(mapping: dict) -> None:
+    with pytest.raises(ValueError):
+        compile_mapping(mapping)
+
+
+def test_stream_writer_mapping(data_values: DataValues) -> None:
+    client = MagicMock(metadata=None, change_store=None)
+    writer = StreamWriter(
+        "dataElements",
+        client,
+        batch_size=10,
+        field_mapping={"orgUnit": "facility", "value": "count"},
+        # overrides the field_mapping of the same field
+        mapping={"value": {"field": "total", "type": "integer"}},
+    )
+    data_value = data_values[0]
+    record: dict[str, Any] = {**data_value, "facility": "ou1", "total": "13"}
+    writer.write(record)
+    assert list(writer.buffer) == [data_value | {"orgUnit": "ou1", "value": "13"}]
+
+    # records the mapping cannot convert are dead letters
+    invalid = {**record, "total": "n/a"}
+    writer.write(invalid)
+    assert len(writer.buffer) == 1
+    assert writer.invalid_count == 1
+    client.dead_letters.put.assert_called_once_with(
+        [(invalid, "Not an integer: 'n/a'")]
+    )
+
+
+def test_stream_writer_missing_fields(data_values: DataValues) -> None:
+    client = MagicMock(metadata=None, change_store=None)
+    writer = StreamWriter(
+        "dataElements",
+        client,
+        batch_size=10,
+        mapping={"period": {"field": "visit_date", "period": "Monthly"}},
+    )
+    data_value = data_values[0]
+    # a record without a mapped field, and one with a value no rule can read
+    missing: dict[str, Any] = {**data_value}
+    unhashable: dict[str, Any] = {**data_value, "visit_date": ["2023-02-03"]}
+    writer.write(missing)
+    writer.write(unhashable)
+    assert len(writer.buffer) == 0
+    assert writer.invalid_count == 2
+    assert [call.args[0] for call in client.dead_letters.put.call_args_list] == [
+        [(missing, "Missing field 'visit_date'")],
+        [(unhashable, "Invalid field value: unhashable type: 'list'")],
+    ]
@@ -0,0 +1,62 @@
+import io
+import json
+
+from airbyte_cdk.models import (  # type: ignore # see this https://github.com/airbytehq/airbyte/pull/22963
+    AirbyteMessage,
+    Type,
+)
+
+from destination_dhis2 import DataValues, DestinationDhis2
+from destination_dhis2.messages import decode_messages
+
+
+def test_decode_messages(data_values: DataValues) -> None:
+    lines = [
+        {
+            "type": "RECORD",
+            "record": {
+                "stream": "dataElements",
+                "data": data_value,
+                "emitted_at": 1678386960000,
+            },
+        }
+        for data_value in data_values
+    ] + [
+        {"type": "STATE", "state": {"data": {"cursor": "202204"}}},
+        {"type": "LOG", "log": {"level": "INFO", "message": "done"}},
+    ]
+    raw = "\n".join(json.dumps(line) for line in lines)
+    # undecodable lines and records missing required fields are skipped
+    raw += '\nnot json\n{"type": "RECORD", "record": {"stream": "dataElements"}}\n'
+
+    # small reads split the input over several chunks
+    messages = list(decode_messages(io.BytesIO(raw.encode()), chunk_size=64))
+    assert [message.type for message in messages] == [
+        Type.RECORD,
+        Type.RECORD,
+        Type.STATE,
+        Type.LOG,
+    ]
+    assert [message.record.data for message in messages[:2]] == data_values
+    assert messages[0].record.stream == "dataElements"
+    # the same messages the CDK would have parsed
+    assert [message.json(exclude_unset=True) for message in messages] == [
+        AirbyteMessage.parse_obj(line).json(exclude_unset=True) for line in lines
+    ]
+
+
+def test_destination_parses_raw_stdin(data_values: DataValues) -> None:
+    raw = json.dumps(
+        {
+            "type": "RECORD",
+            "record": {
+                "stream": "dataElements",
+                "data": data_values[0],
+                "emitted_at": 1678386960000,
+            },
+        }
+    )
+    input_stream = io.TextIOWrapper(io.BytesIO(raw.encode()), encoding="utf-8")
+    messages = list(DestinationDhis2()._parse_input_stream(input_stream))
+    assert len(messages) == 1
+    assert messages[0].record.data == data_values[0]
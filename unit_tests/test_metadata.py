@@ -0,0 +1,147 @@
+from pathlib import Path
+from typing import Any, cast
+from unittest.mock import MagicMock
+
+import pytest
+from requests_mock import Mocker
+from requests_mock.request import _RequestObjectProxy
+
+from destination_dhis2 import DataValues, Dhis2Client
+from destination_dhis2.constants import (
+    DATA_ELEMENTS_PATH,
+    DATA_SETS_PATH,
+    ORGANISATION_UNITS_PATH,
+)
+from destination_dhis2.metadata import PERIOD_PATTERN, MetadataIndex
+from destination_dhis2.stream_writer import StreamWriter
+
+
+@pytest.fixture
+def metadata_client(
+    config: dict[str, Any],
+    requests_mock: Mocker,
+    token_refresh_endpoint: str,
+    sample_access_token: str,
+) -> Dhis2Client:
+    client = Dhis2Client(**config)
+    requests_mock.post(
+        url=token_refresh_endpoint,
+        json={"access_token": sample_access_token, "expires_in": 43199},
+    )
+    requests_mock.get(
+        url=client._join_url_fragments(DATA_ELEMENTS_PATH),
+        response_list=[
+            {
+                "json": {
+                    "pager": {"page": 1, "pageCount": 2},
+                    "dataElements": [{"id": "Psxm301oJH1"}],
+                }
+            },
+            {
+                "json": {
+                    "pager": {"page": 2, "pageCount": 2},
+                    "dataElements": [{"id": "Yt0klR6lDPn"}],
+                }
+            },
+        ],
+    )
+    requests_mock.get(
+        url=client._join_url_fragments(ORGANISATION_UNITS_PATH),
+        json={"organisationUnits": [{"id": "i6724gjuOkw"}, {"id": "other"}]},
+    )
+    requests_mock.get(
+        url=client._join_url_fragments(DATA_SETS_PATH),
+        json={
+            "dataSets": [
+                {
+                    "id": "monthly",
+                    "dataSetElements": [{"dataElement": {"id": "Psxm301oJH1"}}],
+                    "organisationUnits": [{"id": "i6724gjuOkw"}],
+                }
+            ]
+        },
+    )
+    return client
+
+
+def test_metadata_index_load(
+    metadata_client: Dhis2Client, requests_mock: Mocker, tmp_path: Path
+) -> None:
+    cache_path = str(tmp_path / "metadata.json")
+    index = MetadataIndex.load(metadata_client, cache_path=cache_path)
+    assert index.data_elements == {"Psxm301oJH1", "Yt0klR6lDPn"}
+    assert index.org_units == {"i6724gjuOkw", "other"}
+    assert index.data_element_sets == {"Psxm301oJH1": {"monthly"}}
+    # two pages of data elements, org units, data sets
+    call_count = requests_mock.call_count
+    assert call_count == 5
+
+    # a fresh cache is used without any request
+    index = MetadataIndex.load(metadata_client, cache_path=cache_path)
+    assert index.data_elements == {"Psxm301oJH1", "Yt0klR6lDPn"}
+    assert requests_mock.call_count == call_count
+
+    # an expired cache only fetches what changed since the last refresh
+    requests_mock.get(
+        url=metadata_client._join_url_fragments(DATA_ELEMENTS_PATH),
+        json={"dataElements": [{"id": "eknEEuIgoHa"}]},
+    )
+    index = MetadataIndex.load(metadata_client, cache_path=cache_path, ttl=0)
+    assert index.data_elements == {"Psxm301oJH1", "Yt0klR6lDPn", "eknEEuIgoHa"}
+    # query strings are lower-cased by requests_mock
+    assert (
+        cast(_RequestObjectProxy, requests_mock.last_request)
+        .qs["filter"][0]
+        .startswith("lastupdated:ge:")
+    )
+    metadata_client.close()
+
+
+def test_metadata_index_validate(metadata_client: Dhis2Client) -> None:
+    index = MetadataIndex.load(metadata_client, check_assignments=True)
+    assert index.validate("Psxm301oJH1", "202204", "i6724gjuOkw") is None
+    assert "Data element not found" in str(
+        index.validate("unknown", "202204", "i6724gjuOkw")
+    )
+    assert "Organisation unit not found" in str(
+        index.validate("Psxm301oJH1", "202204", "unknown")
+    )
+    assert "Invalid period" in str(
+        index.validate("Psxm301oJH1", "April 2022", "i6724gjuOkw")
+    )
+    assert "not assigned" in str(index.validate("Psxm301oJH1", "202204", "other"))
+    assert "not assigned" in str(index.validate("Yt0klR6lDPn", "202204", "i6724gjuOkw"))
+
+    index.check_assignments = False
+    assert index.validate("Yt0klR6lDPn", "202204", "other") is None
+    metadata_client.close()
+
+
+@pytest.mark.parametrize(
+    "period",
+    ["2022", "202204", "20220403", "2022W5", "2022SunW12", "2022BiW3", "202203B"]
+    + ["2022Q2", "2022S1", "2022AprilS2", "2022NovS1", "2022April", "2022Oct"],
+)
+def test_period_pattern(period: str) -> None:
+    assert PERIOD_PATTERN.match(period)
+
+
+@pytest.mark.parametrize("period", ["22", "2022-04", "2022Q5", "April2022", ""])
+def test_period_pattern_invalid(period: str) -> None:
+    assert not PERIOD_PATTERN.match(period)
+
+
+def test_stream_writer_skips_invalid_records(
+    metadata_client: Dhis2Client, data_values: DataValues
+) -> None:
+    metadata_client.validate_metadata = True
+    metadata_client.load_metadata()
+    metadata_client.submit = MagicMock()  # type: ignore[assignment]
+    writer = StreamWriter("dataElements", metadata_client)
+
+    writer.write(data_values[0])
+    writer.write({**data_values[1], "orgUnit": "unknown"})
+    assert list(writer.buffer) == data_values[:1]
+    assert writer.invalid_count == 1
+    assert metadata_client.dead_letters.count == 1
+    metadata_client.close()
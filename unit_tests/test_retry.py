@@ -0,0 +1,135 @@
+from email.utils import formatdate
+from time import time
+
+import pytest
+import requests
+from requests.exceptions import ConnectionError, RequestException
+from requests_mock import Mocker
+
+from destination_dhis2.retry import (
+    CircuitBreaker,
+    RetryPolicy,
+    is_permanent_failure,
+    parse_retry_after,
+)
+
+
+def _get(url: str) -> requests.Response:
+    return requests.get(url)
+
+
+def test_retry_policy_retries_transient_status(
+    requests_mock: Mocker, base_url: str
+) -> None:
+    delays: list[float] = []
+    requests_mock.get(
+        url=base_url,
+        response_list=[
+            {"status_code": 503},
+            {"status_code": 429, "headers": {"Retry-After": "7"}},
+            {"text": "ok"},
+        ],
+    )
+    policy = RetryPolicy(backoff_base=1, backoff_cap=10, sleep=delays.append)
+
+    response = policy.call(lambda: _get(base_url), "GET /")
+    assert response.text == "ok"
+    assert requests_mock.call_count == 3
+    assert 0 <= delays[0] <= 1
+    # Retry-After takes precedence over the computed backoff
+    assert delays[1] == 7
+    assert policy.retries == 2
+
+
+def test_retry_policy_long_retry_after(requests_mock: Mocker, base_url: str) -> None:
+    delays: list[float] = []
+    requests_mock.get(url=base_url, status_code=503, headers={"Retry-After": "120"})
+    policy = RetryPolicy(backoff_cap=60, sleep=delays.append)
+
+    # not retried before the server asked
+    assert policy.call(lambda: _get(base_url), "GET /").status_code == 503
+    assert requests_mock.call_count == 1
+    assert delays == []
+    assert policy.retries == 0
+
+
+def test_retry_policy_gives_up(requests_mock: Mocker, base_url: str) -> None:
+    requests_mock.get(url=base_url, status_code=502)
+    policy = RetryPolicy(max_retries=2, sleep=lambda _: None)
+
+    response = policy.call(lambda: _get(base_url), "GET /")
+    assert response.status_code == 502
+    assert requests_mock.call_count == 3
+
+
+def test_retry_policy_does_not_retry_client_errors(
+    requests_mock: Mocker, base_url: str
+) -> None:
+    requests_mock.get(url=base_url, status_code=409)
+    policy = RetryPolicy(sleep=lambda _: None)
+
+    assert policy.call(lambda: _get(base_url), "GET /").status_code == 409
+    assert requests_mock.call_count == 1
+
+
+def test_retry_policy_connection_errors(requests_mock: Mocker, base_url: str) -> None:
+    requests_mock.get(url=base_url, exc=ConnectionError)
+    policy = RetryPolicy(max_retries=1, sleep=lambda _: None)
+
+    with pytest.raises(ConnectionError):
+        policy.call(lambda: _get(base_url), "GET /")
+    assert requests_mock.call_count == 2
+
+
+def test_retry_policy_budget(requests_mock: Mocker, base_url: str) -> None:
+    requests_mock.get(url=base_url, status_code=503)
+    policy = RetryPolicy(max_retries=5, retry_budget=3, sleep=lambda _: None)
+
+    policy.call(lambda: _get(base_url), "GET /")
+    assert requests_mock.call_count == 4
+    # the budget is spent, later requests are not retried
+    policy.call(lambda: _get(base_url), "GET /")
+    assert requests_mock.call_count == 5
+
+
+def test_retry_policy_backoff_is_capped() -> None:
+    policy = RetryPolicy(backoff_base=1, backoff_cap=5)
+    assert all(0 <= policy.backoff(attempt) <= 5 for attempt in range(20))
+
+
+def test_parse_retry_after(requests_mock: Mocker, base_url: str) -> None:
+    requests_mock.get(url=base_url, headers={"Retry-After": formatdate(time() + 60)})
+    retry_after = parse_retry_after(_get(base_url))
+    assert retry_after is not None and 55 < retry_after <= 60
+
+    requests_mock.get(url=base_url, headers={"Retry-After": "soon"})
+    assert parse_retry_after(_get(base_url)) is None
+
+
+@pytest.mark.parametrize(
+    "status_code, permanent",
+    [(200, True), (400, True), (409, True), (401, False), (429, False), (500, False)],
+)
+def test_is_permanent_failure(
+    requests_mock: Mocker, base_url: str, status_code: int, permanent: bool
+) -> None:
+    requests_mock.get(base_url, status_code=status_code)
+    assert is_permanent_failure(RequestException(response=_get(base_url))) == permanent
+    # failures without a response, e.g. a connection error, are not
+    assert not is_permanent_failure(RequestException())
+
+
+def test_circuit_breaker() -> None:
+    breaker = CircuitBreaker(threshold=2, cooldown=0)
+    breaker.record_failure()
+    assert breaker.concurrency(4) == 4
+    breaker.record_failure()
+    assert breaker.concurrency(4) == 1
+    breaker.record_success()
+    assert breaker.concurrency(4) == 4
+
+    breaker = CircuitBreaker(threshold=1, cooldown=3600)
+    breaker.record_failure()
+    # stays open until the cooldown has passed
+    breaker.record_success()
+    assert breaker.is_open()
@@ -0,0 +1,203 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+from destination_dhis2 import DataValueBatch, DataValues, serializer
+from destination_dhis2.serializer import (
+    DataValueSetBody,
+    PayloadFormat,
+    iter_data_value_set,
+    payload_size,
+    serialize_data_value_set,
+    serialize_payload,
+)
+
+
+@pytest.fixture(params=["orjson", "json"])
+def backend(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> str:
+    if request.param == "json":
+        monkeypatch.setattr(serializer, "orjson", None)
+    elif serializer.orjson is None:
+        pytest.skip("orjson is not installed")
+    return request.param
+
+
+def test_serialize_data_value_set(backend: str, data_values: DataValues) -> None:
+    batch = DataValueBatch()
+    batch.extend(data_values)
+    assert json.loads(serialize_data_value_set(batch)) == {"dataValues": data_values}
+
+    assert json.loads(serialize_data_value_set(DataValueBatch())) == {"dataValues": []}
+
+
+def test_serialize_escapes_and_non_string_values(backend: str) -> None:
+    batch = DataValueBatch()
+    batch.append('de"1', "2022-06-03", "202204", "ou\\1", 12)  # type: ignore[arg-type]
+    batch.append("de2", "2022-06-03", "202204", "ou1", "Nairobi é")
+    assert json.loads(serialize_data_value_set(batch))["dataValues"] == [
+        {
+            "dataElement": 'de"1',
+            "completeDate": "2022-06-03",
+            "period": "202204",
+            "orgUnit": "ou\\1",
+            "value": 12,
+        },
+        {
+            "dataElement": "de2",
+            "completeDate": "2022-06-03",
+            "period": "202204",
+            "orgUnit": "ou1",
+            "value": "Nairobi é",
+        },
+    ]
+
+
+def test_serialize_hoisted_headers(backend: str, data_values: DataValues) -> None:
+    batch = DataValueBatch()
+    batch.extend(data_values)
+    for data_value in data_values:
+        batch.append(
+            data_value["dataElement"],
+            data_value["completeDate"],
+            "202204",
+            "ou1",
+            data_value["value"],
+        )
+    # values of several (period, orgUnit) pairs keep them on every value
+    assert json.loads(serialize_payload(batch, hoist_headers=True)) == json.loads(
+        serialize_payload(batch)
+    )
+
+    grouped = DataValueBatch()
+    grouped.append("de1", "2022-06-03", "202204", "ou1", "12")
+    grouped.append("de2", "2022-06-03", "202204", "ou1", "Nairobi é")
+    payload = serialize_payload(grouped, hoist_headers=True)
+    assert json.loads(payload) == {
+        "period": "202204",
+        "orgUnit": "ou1",
+        "dataValues": [
+            {"dataElement": "de1", "completeDate": "2022-06-03", "value": "12"},
+            {"dataElement": "de2", "completeDate": "2022-06-03", "value": "Nairobi é"},
+        ],
+    }
+    assert len(payload) < len(serialize_payload(grouped))
+    assert b"".join(DataValueSetBody(grouped, hoist_headers=True)) == payload
+
+
+def test_serialize_option_combos(backend: str, data_values: DataValues) -> None:
+    batch = DataValueBatch()
+    batch.extend(data_values)
+    female = data_values[0].copy()
+    female.update({"categoryOptionCombo": "Prlt0C1RF0s", "value": "6"})
+    partner = data_values[1].copy()
+    partner["attributeOptionCombo"] = "HllvX50cXC0"
+    batch.extend([female, partner])
+    # only the values that set a combo carry it
+    assert json.loads(serialize_payload(batch)) == {
+        "dataValues": data_values + [female, partner]
+    }
+
+    grouped = DataValueBatch()
+    grouped.append("de1", "2022-06-03", "202204", "ou1", "6", "Prlt0C1RF0s")
+    grouped.append("de1", "2022-06-03", "202204", "ou1", "12")
+    assert json.loads(serialize_payload(grouped, hoist_headers=True)) == {
+        "period": "202204",
+        "orgUnit": "ou1",
+        "dataValues": [
+            {
+                "dataElement": "de1",
+                "completeDate": "2022-06-03",
+                "value": "6",
+                "categoryOptionCombo": "Prlt0C1RF0s",
+            },
+            {"dataElement": "de1", "completeDate": "2022-06-03", "value": "12"},
+        ],
+    }
+
+
+def test_iter_data_value_set_chunks(backend: str, data_values: DataValues) -> None:
+    batch = DataValueBatch()
+    batch.extend(data_values * 3)
+    chunks = list(iter_data_value_set(batch, chunk_size=2))
+    # opening, three chunks of at most two values, closing
+    assert len(chunks) == 5
+    assert json.loads(b"".join(chunks)) == {"dataValues": data_values * 3}
+
+
+def test_data_value_set_body(data_values: DataValues) -> None:
+    batch = DataValueBatch()
+    batch.extend(data_values)
+    body = DataValueSetBody(batch, chunk_size=1)
+
+    payload = b"".join(body)
+    assert body.size == len(payload) == payload_size(body)
+    # can be iterated again when a request is retried
+    assert b"".join(body) == payload
+    assert payload == serialize_data_value_set(batch)
+
+
+def _imported_values(payload: bytes, payload_format: str) -> list[dict[str, str]]:
+    # the values DHIS2 would import from a payload, see CSV_HEADER
+    if payload_format == "csv":
+        rows = list(csv.DictReader(io.StringIO(payload.decode())))
+        return [
+            {
+                "dataElement": row["dataelement"],
+                "period": row["period"],
+                "orgUnit": row["orgunit"],
+                "value": row["value"],
+                # empty columns leave the combos to their defaults
+                **(
+                    {"categoryOptionCombo": row["categoryoptioncombo"]}
+                    if row["categoryoptioncombo"]
+                    else {}
+                ),
+                **(
+                    {"attributeOptionCombo": row["attributeoptioncombo"]}
+                    if row["attributeoptioncombo"]
+                    else {}
+                ),
+            }
+            for row in rows
+        ]
+    return [
+        {key: value for key, value in data_value.items() if key != "completeDate"}
+        for data_value in json.loads(payload)["dataValues"]
+    ]
+
+
+@pytest.mark.parametrize("compress", [False, True])
+@pytest.mark.parametrize("payload_format", ["json", "csv"])
+def test_payload_formats_are_equivalent(
+    payload_format: PayloadFormat, compress: bool, data_values: DataValues
+) -> None:
+    batch = DataValueBatch()
+    batch.extend(data_values)
+    batch.append("de,1", "2022-06-03", "202204", "ou1", 'quoted "value"')
+    batch.append("de1", "2022-06-03", "202204", "ou1", "6", "Prlt0C1RF0s")
+    batch.append("de1", "2022-06-03", "202204", "ou1", "7", None, "HllvX50cXC0")
+
+    payload = serialize_payload(batch, payload_format, compress)
+    if compress:
+        assert payload[:2] == b"\x1f\x8b"
+        payload = gzip.decompress(payload)
+    # chunked bodies carry the same bytes
+    assert b"".join(DataValueSetBody(batch, payload_format, chunk_size=1)) == payload
+
+    assert _imported_values(payload, payload_format) == _imported_values(
+        serialize_payload(batch), "json"
+    )
+
+
+def test_csv_payload_is_smaller(data_values: DataValues) -> None:
+    batch = DataValueBatch()
+    batch.extend(data_values * 100)
+    assert len(serialize_payload(batch, "csv")) < len(serialize_payload(batch)) / 2
+
+
+def test_unsupported_payload_format() -> None:
+    with pytest.raises(ValueError):
+        serialize_payload(DataValueBatch(), "xml")  # type: ignore[arg-type]
@@ -0,0 +1,35 @@
+from typing import Any, cast
+
+from requests_mock import Mocker
+from requests_mock.request import _RequestObjectProxy
+
+from destination_dhis2 import Dhis2Client
+from destination_dhis2.session import Dhis2Session
+
+
+def test_dhis2_session_timeouts(requests_mock: Mocker, base_url: str) -> None:
+    session = Dhis2Session(connect_timeout=3, read_timeout=30)
+    requests_mock.get(url=base_url, text="ok")
+
+    session.request("GET", base_url)
+    assert cast(_RequestObjectProxy, requests_mock.last_request).timeout == (3, 30)
+
+    # explicit timeouts take precedence
+    session.request("GET", base_url, timeout=1)
+    assert cast(_RequestObjectProxy, requests_mock.last_request).timeout == 1
+
+
+def test_dhis2_session_pool() -> None:
+    session = Dhis2Session(pool_size=4)
+    assert session.get_adapter("https://test.com") is session.adapter
+    assert session.get_adapter("http://test.com") is session.adapter
+    assert session.adapter._pool_maxsize == 4  # type: ignore[attr-defined]
+    assert session.connection_stats() == {"requests": 0, "connections": 0, "reused": 0}
+
+
+def test_dhis2_client_shares_session(config: dict[str, Any]) -> None:
+    client = Dhis2Client(**config, pool_size=2, connect_timeout=1, read_timeout=5)
+    # token refreshes reuse the pooled data connections
+    assert client._authenticator.session is client.session
+    assert client.session.timeout == (1, 5)
+    client.close()
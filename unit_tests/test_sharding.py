@@ -0,0 +1,91 @@
+from collections import Counter
+
+from destination_dhis2.sharding import (
+    WriteStats,
+    merge_write_stats,
+    shard_config,
+    shard_of,
+)
+from destination_dhis2.telemetry import SyncMetrics
+
+
+def test_shard_of() -> None:
+    # stable across processes and runs, unlike hash()
+    assert shard_of("i6724gjuOkw", 4) == shard_of("i6724gjuOkw", 4)
+    assert 0 <= shard_of("i6724gjuOkw", 4) < 4
+    counts = Counter(shard_of(f"ou{i:09d}", 4) for i in range(10_000))
+    assert sorted(counts) == [0, 1, 2, 3]
+    assert min(counts.values()) > 2000
+
+
+def test_shard_config() -> None:
+    config = {"base_url": "https://test.com", "spool_path": "/local/spool"}
+    assert shard_config(config, 1, 2) == {
+        "base_url": "https://test.com",
+        "spool_path": "/local/spool/shard-1",
+    }
+    assert shard_config({"base_url": "https://test.com"}, 1, 2) == {
+        "base_url": "https://test.com"
+    }
+
+
+def test_shard_config_rate_limits() -> None:
+    config = {
+        "requests_per_second": 10,
+        "values_per_second": 5000,
+        "rate_limit_windows": [
+            {"start": "08:00", "end": "17:00", "requests_per_second": 2},
+            {"start": "17:00", "end": "08:00", "values_per_second": 1000},
+        ],
+    }
+    # the shards share the limits between them
+    assert shard_config(config, 0, 4) == {
+        "requests_per_second": 2.5,
+        "values_per_second": 1250,
+        "rate_limit_windows": [
+            {"start": "08:00", "end": "17:00", "requests_per_second": 0.5},
+            {"start": "17:00", "end": "08:00", "values_per_second": 250},
+        ],
+    }
+    # without touching the config itself
+    assert config["requests_per_second"] == 10
+
+
+def test_merge_write_stats() -> None:
+    metrics = SyncMetrics()
+    metrics.records = 5
+    metrics.record_batch(values=10, payload_bytes=100, latency=0.2, failed=False)
+    stats: WriteStats = {
+        "import_count": {"imported": 2, "updated": 0, "ignored": 0, "deleted": 0},
+        "rejected": 1,
+        "coalesced": 3,
+        "grouping": {
+            "sets": 1,
+            "values": 60,
+            "bytes_saved": 2000,
+            "extra_requests": 1,
+        },
+        "connections": {"requests": 4, "connections": 1, "reused": 3},
+        "invalid": {"monthly": 1},
+        "unchanged": {"monthly": 0, "facilities": 5},
+        "metrics": metrics.snapshot(retries=1),
+    }
+    merged = merge_write_stats([stats, stats])
+    assert merged["metrics"]["records"] == 10
+    assert merged["metrics"]["values"] == 20
+    assert merged["metrics"]["retries"] == 2
+    assert merged["metrics"]["batch_latency"]["count"] == 2
+    assert {key: value for key, value in merged.items() if key != "metrics"} == {
+        "import_count": {"imported": 4, "updated": 0, "ignored": 0, "deleted": 0},
+        "rejected": 2,
+        "coalesced": 6,
+        "grouping": {
+            "sets": 2,
+            "values": 120,
+            "bytes_saved": 4000,
+            "extra_requests": 2,
+        },
+        "connections": {"requests": 8, "connections": 2, "reused": 6},
+        "invalid": {"monthly": 2},
+        "unchanged": {"monthly": 0, "facilities": 10},
+    }
@@ -0,0 +1,35 @@
+from pathlib import Path
+
+from destination_dhis2 import DataValueBatch, DataValues
+from destination_dhis2.spool import Spool
+
+
+def test_spool(tmp_path: Path, data_values: DataValues) -> None:
+    spool = Spool(str(tmp_path / "spool"))
+    assert spool.segments() == []
+    batch = DataValueBatch()
+    batch.extend(data_values)
+
+    first = spool.write(batch)
+    second = spool.write(batch)
+    assert spool.segments() == [first, second]
+    assert list(spool.read(first)) == data_values
+
+    # with the combos of the values that set them
+    female = data_values[0].copy()
+    female["categoryOptionCombo"] = "Prlt0C1RF0s"
+    disaggregated = DataValueBatch()
+    disaggregated.extend([female])
+    assert list(spool.read(spool.write(disaggregated))) == [female]
+    spool.release(spool.segments()[-1])
+
+    spool.release(first)
+    assert spool.segments() == [second]
+    # half written segments are not picked up
+    (tmp_path / "spool" / "000000000009.segment.tmp").write_text("[")
+
+    # a restarted spool keeps counting after the segments left behind
+    spool = Spool(str(tmp_path / "spool"))
+    assert spool.segments() == [second]
+    third = spool.write(batch)
+    assert spool.segments() == [second, third]
@@ -0,0 +1,47 @@
+import json
+import subprocess
+import sys
+from unittest.mock import MagicMock
+
+from destination_dhis2 import DestinationDhis2
+from destination_dhis2.run import spec_message
+
+# microseconds `import destination_dhis2.run` may take, a few ms are typical
+IMPORT_TIME_BUDGET = 50_000
+
+
+def _import_times(*args: str) -> dict[str, int]:
+    # module -> cumulative microseconds, as reported by -X importtime
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, module = line.split("|")
+            if cumulative.strip().isdigit():
+                times[module.strip()] = int(cumulative)
+    return times
+
+
+def test_import_time() -> None:
+    times = _import_times("-c", "import destination_dhis2.run")
+    heavy = [m for m in times if m.split(".")[0] in ("airbyte_cdk", "requests")]
+    assert heavy == []
+    assert times["destination_dhis2.run"] < IMPORT_TIME_BUDGET
+
+
+def test_spec_command() -> None:
+    times = _import_times("main.py", "spec")
+    assert not any(m.startswith("airbyte_cdk") for m in times)
+
+    # the same message the CDK would print
+    message = json.loads(spec_message())
+    spec = DestinationDhis2().spec(MagicMock())
+    assert message == {
+        "type": "SPEC",
+        "spec": json.loads(spec.json(exclude_unset=True)),
+    }
@@ -0,0 +1,62 @@
+from unittest.mock import MagicMock
+
+import pytest
+from airbyte_cdk.models import (  # type: ignore # see this https://github.com/airbytehq/airbyte/pull/22963
+    AirbyteStream,
+    ConfiguredAirbyteStream,
+    DestinationSyncMode,
+    SyncMode,
+)
+
+from destination_dhis2 import DataValues
+from destination_dhis2.constants import PAGE_SIZE
+from destination_dhis2.stream_writer import StreamWriter
+
+
+def _configured_stream(json_schema: dict) -> ConfiguredAirbyteStream:
+    return ConfiguredAirbyteStream(
+        stream=AirbyteStream(
+            name="dataElements",
+            json_schema=json_schema,
+            supported_sync_modes=[SyncMode.full_refresh],
+        ),
+        sync_mode=SyncMode.full_refresh,
+        destination_sync_mode=DestinationSyncMode.overwrite,
+    )
+
+
+def test_stream_writer_options() -> None:
+    client = MagicMock(batch_size=PAGE_SIZE, metadata=None, change_store=None)
+    writer = StreamWriter.from_configured_stream(_configured_stream({}), client)
+    assert writer.name == "dataElements"
+    assert writer.batch_size == PAGE_SIZE
+    # follows the client's adaptive batch size
+    client.batch_size = 500
+    assert writer.batch_size == 500
+
+    writer = StreamWriter.from_configured_stream(
+        _configured_stream({"dhis2": {"batch_size": 10}}), client
+    )
+    assert writer.batch_size == 10
+
+
+def test_stream_writer_unknown_field() -> None:
+    with pytest.raises(ValueError) as exc_info:
+        StreamWriter("dataElements", MagicMock(), field_mapping={"dataSet": "ds"})
+    assert "dataSet" in str(exc_info.value)
+
+
+def test_stream_writer_submits_full_batches(data_values: DataValues) -> None:
+    client = MagicMock(metadata=None, change_store=None)
+    writer = StreamWriter("dataElements", client, batch_size=2)
+
+    writer.write(data_values[0])
+    client.submit.assert_not_called()
+    writer.write(data_values[1])
+    client.submit.assert_called_once()
+    assert list(client.submit.call_args.args[0]) == data_values
+    assert len(writer.buffer) == 0
+
+    # empty buffers are not submitted
+    writer.submit()
+    client.submit.assert_called_once()
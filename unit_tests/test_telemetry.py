@@ -0,0 +1,69 @@
+import math
+from pathlib import Path
+
+from destination_dhis2.telemetry import (
+    LatencyHistogram,
+    SyncMetrics,
+    merge_metrics,
+    quantile,
+    to_prometheus,
+    write_prometheus,
+)
+
+
+def test_latency_histogram() -> None:
+    histogram = LatencyHistogram((1, 5))
+    for seconds in (0.5, 1, 3, 10):
+        histogram.observe(seconds)
+    snapshot = histogram.snapshot()
+    assert snapshot == {"buckets": [2, 3, 4], "count": 4, "sum": 14.5}
+    assert quantile(snapshot, 0.5, (1, 5)) == 1
+    assert quantile(snapshot, 0.75, (1, 5)) == 5
+    assert quantile(snapshot, 1, (1, 5)) == math.inf
+    assert quantile(LatencyHistogram().snapshot(), 0.5) is None
+
+
+def test_sync_metrics() -> None:
+    metrics = SyncMetrics(interval=3600)
+    metrics.records = 3
+    metrics.record_batch(values=10, payload_bytes=200, latency=0.3, failed=False)
+    # a failed batch counts towards the latency but not the throughput
+    metrics.record_batch(values=10, payload_bytes=200, latency=12, failed=True)
+    metrics.record_queue_depth(2)
+    metrics.record_queue_depth(1)
+    assert not metrics.due()
+
+    snapshot = metrics.snapshot(token_refreshes=1, retries=2, queue_depth=0)
+    assert snapshot["records"] == 3
+    assert snapshot["values"] == 10
+    assert snapshot["bytes_sent"] == 200
+    assert snapshot["batches"] == 2
+    assert snapshot["failed_batches"] == 1
+    assert snapshot["batch_latency_p50"] == 0.5
+    assert snapshot["batch_latency_p95"] == 30
+    assert snapshot["token_refreshes"] == 1
+    assert snapshot["retries"] == 2
+    assert snapshot["max_queue_depth"] == 2
+    assert snapshot["values_per_second"] > 0
+
+    merged = merge_metrics([snapshot, snapshot])
+    assert merged["values"] == 20
+    assert merged["batch_latency"]["count"] == 4
+    assert merged["batch_latency_p95"] == 30
+
+
+def test_prometheus(tmp_path: Path) -> None:
+    metrics = SyncMetrics()
+    metrics.record_batch(values=10, payload_bytes=200, latency=0.3, failed=False)
+    text = to_prometheus(metrics.snapshot())
+    assert "dhis2_destination_values_total 10\n" in text
+    assert "# TYPE dhis2_destination_batch_latency_seconds histogram\n" in text
+    assert 'dhis2_destination_batch_latency_seconds_bucket{le="0.25"} 0\n' in text
+    assert 'dhis2_destination_batch_latency_seconds_bucket{le="0.5"} 1\n' in text
+    assert 'dhis2_destination_batch_latency_seconds_bucket{le="+Inf"} 1\n' in text
+    assert "dhis2_destination_batch_latency_seconds_count 1\n" in text
+
+    path = tmp_path / "metrics.prom"
+    write_prometheus(metrics.snapshot(), str(path))
+    assert path.read_text().startswith("# HELP dhis2_destination_records_total")
+    assert list(tmp_path.iterdir()) == [path]
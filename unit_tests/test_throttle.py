@@ -0,0 +1,145 @@
+import threading
+from typing import Any
+
+import pendulum
+import pytest
+
+from destination_dhis2 import Dhis2Client
+from destination_dhis2.throttle import (
+    ConcurrencyGovernor,
+    RateLimiter,
+    RateLimitWindow,
+    TokenBucket,
+)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_token_bucket() -> None:
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, clock=clock, sleep=clock.sleep)
+
+    # a full bucket allows a burst of one second's worth
+    for _ in range(10):
+        assert bucket.acquire() == 0
+    assert bucket.acquire() == pytest.approx(0.1)
+    clock.now += 1
+    assert bucket.acquire(5) == 0
+
+    # taking more than the burst goes into debt
+    assert bucket.acquire(25) == pytest.approx(2)
+    assert clock.sleeps == pytest.approx([0.1, 2])
+
+
+OFFICE_HOURS: RateLimitWindow = {
+    "start": "08:00",
+    "end": "17:00",
+    "days": [1, 2, 3, 4, 5],
+    "requests_per_second": 1,
+    "values_per_second": 100,
+}
+NIGHT: RateLimitWindow = {"start": "22:00", "end": "06:00", "values_per_second": 1000}
+
+
+@pytest.mark.parametrize(
+    "now, limits",
+    [
+        # a Monday
+        ("2023-03-06T09:30:00", (1, 100)),
+        ("2023-03-06T17:00:00", (5, None)),
+        # a Saturday
+        ("2023-03-11T09:30:00", (5, None)),
+        # the night window wraps around midnight
+        ("2023-03-11T23:00:00", (None, 1000)),
+        ("2023-03-12T05:59:00", (None, 1000)),
+    ],
+)
+def test_rate_limiter_windows(now: str, limits: tuple[Any, Any]) -> None:
+    limiter = RateLimiter(requests_per_second=5, windows=[OFFICE_HOURS, NIGHT])
+    assert limiter.limits(pendulum.parse(now)) == limits  # type: ignore[arg-type]
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"windows": [{"start": "8:00", "end": "17:00"}]},
+        {"windows": [{"start": "08:00"}]},
+        {"requests_per_second": 0},
+        {"windows": [{"start": "08:00", "end": "17:00", "values_per_second": -1}]},
+    ],
+)
+def test_rate_limiter_invalid(options: dict[str, Any]) -> None:
+    with pytest.raises(ValueError):
+        RateLimiter(**options)
+
+
+def test_rate_limiter_acquire() -> None:
+    sleeps: list[float] = []
+    limiter = RateLimiter(
+        requests_per_second=2, values_per_second=100, sleep=sleeps.append
+    )
+    limiter.acquire_values(100)
+    limiter.acquire_values(50)
+    for _ in range(3):
+        limiter.acquire_request()
+    assert sleeps == pytest.approx([0.5, 0.5], abs=0.01)
+
+
+def test_concurrency_governor() -> None:
+    governor = ConcurrencyGovernor(max_concurrency=4)
+    assert governor.limit == 1
+
+    # grows by one per `limit` successful imports
+    for _ in range(1 + 2 + 3):
+        governor.acquire()
+        governor.release(latency=1, values=1000, failed=False)
+    assert governor.limit == 4
+    for _ in range(10):
+        governor.acquire()
+        governor.release(latency=1, values=1000, failed=False)
+    assert governor.limit == 4
+
+    # halves on slow imports and server errors
+    governor.acquire()
+    governor.release(latency=3, values=1000, failed=False)
+    assert governor.limit == 2
+    governor.acquire()
+    governor.release(latency=1, values=1000, failed=True)
+    assert governor.limit == 1
+
+
+def test_concurrency_governor_blocks() -> None:
+    governor = ConcurrencyGovernor(max_concurrency=4)
+    governor.acquire()
+    acquired = threading.Event()
+
+    def acquire() -> None:
+        governor.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    assert not acquired.wait(0.1)
+    governor.release(latency=1, values=1000, failed=False)
+    assert acquired.wait(1)
+    thread.join()
+
+
+def test_client_rate_limits_every_request(config: dict[str, Any]) -> None:
+    client = Dhis2Client(**config, requests_per_second=10)
+    # token refreshes share the rate limited session
+    assert client.session.rate_limiter is client.rate_limiter
+    assert client._authenticator.session is client.session
+    assert Dhis2Client(**config).rate_limiter is None
+    client.close()